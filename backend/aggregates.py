@@ -0,0 +1,202 @@
+"""
+Incrementally maintained occupancy and revenue aggregates.
+
+occupancy_stats holds one row per ride, per (route, day) and per month.
+Booking and ride write paths call the hooks below inside their own
+transaction; `rebuild` recomputes everything from scratch with grouped
+INSERT ... SELECT statements and `verify` reports any drift.
+
+Usage: python aggregates.py rebuild|verify
+"""
+import sys
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import String, case, cast, delete, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+import models
+from models import OccupancyStat
+
+COUNTERS = ("rides", "seats_total", "seats_sold", "bookings", "cancellations", "revenue")
+
+
+def _keys(ride_id: int, route_id: int, day: date):
+    return [
+        ("ride", str(ride_id), route_id, day),
+        ("route_day", f"{route_id}:{day.isoformat()}", route_id, day),
+        ("month", day.strftime("%Y-%m"), None, day.replace(day=1)),
+    ]
+
+
+def _bump(db: Session, ride: models.Ride, **deltas):
+    deltas = {k: v for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    table = OccupancyStat.__table__
+    for level, key, route_id, period in _keys(ride.id, ride.route_id, ride.date):
+        result = db.execute(
+            update(table)
+            .where(table.c.level == level, table.c.key == key)
+            .values({col: table.c[col] + v for col, v in deltas.items()})
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table).values(
+                level=level, key=key, route_id=route_id, period=period,
+                **{col: deltas.get(col, 0) for col in COUNTERS},
+            ))
+
+
+# ── Write-path hooks ──────────────────────────────────────────────────────────
+
+def ride_added(db: Session, ride: models.Ride):
+    """Call after the ride has been flushed (needs ride.id)."""
+    _bump(db, ride, rides=1, seats_total=ride.seats_total)
+
+
+def ride_removed(db: Session, ride: models.Ride):
+    table = OccupancyStat.__table__
+    row = db.execute(
+        select(*[table.c[col] for col in COUNTERS])
+        .where(table.c.level == "ride", table.c.key == str(ride.id))
+    ).first()
+    if row is None:
+        return
+    _bump(db, ride, **{col: -(getattr(row, col) or 0) for col in COUNTERS})
+    db.execute(delete(table).where(table.c.level == "ride", table.c.key == str(ride.id)))
+
+
+def booking_changed(db: Session, ride: models.Ride, seats: int = 0, bookings: int = 0, cancellations: int = 0):
+    _bump(
+        db, ride,
+        seats_sold=seats, bookings=bookings, cancellations=cancellations,
+        revenue=seats * (ride.price or 0),
+    )
+
+
+# ── Reads ─────────────────────────────────────────────────────────────────────
+
+def query(
+    db: Session,
+    level: str,
+    route_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> List[OccupancyStat]:
+    q = db.query(OccupancyStat).filter(OccupancyStat.level == level)
+    if route_id is not None:
+        q = q.filter(OccupancyStat.route_id == route_id)
+    if date_from:
+        start = date_from.replace(day=1) if level == "month" else date_from
+        q = q.filter(OccupancyStat.period >= start)
+    if date_to:
+        q = q.filter(OccupancyStat.period <= date_to)
+    return q.order_by(OccupancyStat.period, OccupancyStat.key).all()
+
+
+# ── Rebuild / verify ──────────────────────────────────────────────────────────
+
+def _fresh_ride_rows():
+    """Per-ride aggregates straight from rides + bookings, as a SELECT."""
+    b = models.Booking.__table__
+    r = models.Ride.__table__
+    confirmed = b.c.status == "confirmed"
+    return (
+        select(
+            literal("ride").label("level"),
+            cast(r.c.id, String).label("key"),
+            r.c.route_id.label("route_id"),
+            r.c.date.label("period"),
+            literal(1).label("rides"),
+            r.c.seats_total.label("seats_total"),
+            func.coalesce(func.sum(case((confirmed, b.c.seats), else_=0)), 0).label("seats_sold"),
+            func.coalesce(func.sum(case((confirmed, 1), else_=0)), 0).label("bookings"),
+            func.coalesce(func.sum(case((b.c.status == "cancelled", 1), else_=0)), 0).label("cancellations"),
+            (func.coalesce(func.sum(case((confirmed, b.c.seats), else_=0)), 0)
+             * func.coalesce(r.c.price, 0)).label("revenue"),
+        )
+        .select_from(r.outerjoin(b, b.c.ride_id == r.c.id))
+        .group_by(r.c.id)
+    )
+
+
+def rebuild(db: Session):
+    table = OccupancyStat.__table__
+    db.execute(delete(table))
+    columns = ["level", "key", "route_id", "period", *COUNTERS]
+    db.execute(insert(table).from_select(columns, _fresh_ride_rows()))
+
+    ride = select(table).where(table.c.level == "ride").subquery()
+    sums = [func.sum(ride.c[col]).label(col) for col in COUNTERS]
+    route_day = select(
+        literal("route_day").label("level"),
+        (cast(ride.c.route_id, String) + ":" + cast(ride.c.period, String)).label("key"),
+        ride.c.route_id, ride.c.period, *sums,
+    ).group_by(ride.c.route_id, ride.c.period)
+    month_key = func.substr(cast(ride.c.period, String), 1, 7)
+    month = select(
+        literal("month").label("level"),
+        month_key.label("key"),
+        literal(None).label("route_id"),
+        func.min(ride.c.period).label("period"),
+        *sums,
+    ).group_by(month_key)
+
+    db.execute(insert(table).from_select(columns, route_day))
+    db.execute(insert(table).from_select(columns, month))
+    # Month rows are keyed by their first day regardless of which rides exist
+    for row in db.query(OccupancyStat).filter(OccupancyStat.level == "month").all():
+        row.period = row.period.replace(day=1)
+    db.commit()
+
+
+def verify(db: Session) -> List[dict]:
+    """Compare stored ride-level rows and rollups against a fresh computation."""
+    fresh = {row.key: row for row in db.execute(_fresh_ride_rows())}
+    stored = {row.key: row for row in db.query(OccupancyStat).filter(OccupancyStat.level == "ride")}
+    problems = []
+    for key in sorted(set(fresh) | set(stored), key=int):
+        f, s = fresh.get(key), stored.get(key)
+        for col in COUNTERS:
+            fv = getattr(f, col) if f is not None else 0
+            sv = getattr(s, col) if s is not None else 0
+            if abs((fv or 0) - (sv or 0)) > 1e-6:
+                problems.append({"level": "ride", "key": key, "field": col, "stored": sv, "expected": fv})
+
+    for level in ("route_day", "month"):
+        expected = {}
+        for row in stored.values():
+            _, key, _, _ = next(k for k in _keys(int(row.key), row.route_id, row.period) if k[0] == level)
+            acc = expected.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for col in COUNTERS:
+                acc[col] += getattr(row, col) or 0
+        actual = {row.key: row for row in db.query(OccupancyStat).filter(OccupancyStat.level == level)}
+        for key in sorted(set(expected) | set(actual)):
+            for col in COUNTERS:
+                ev = expected.get(key, {}).get(col, 0)
+                av = getattr(actual[key], col) if key in actual else 0
+                if abs((ev or 0) - (av or 0)) > 1e-6:
+                    problems.append({"level": level, "key": key, "field": col, "stored": av, "expected": ev})
+    return problems
+
+
+if __name__ == "__main__":
+    import migrations
+    from database import SessionLocal, engine
+
+    migrations.upgrade(engine)
+    command = sys.argv[1] if len(sys.argv) > 1 else "verify"
+    db = SessionLocal()
+    if command == "rebuild":
+        rebuild(db)
+        print("Aggregates rebuilt")
+    elif command == "verify":
+        problems = verify(db)
+        for p in problems:
+            print(p)
+        print("OK" if not problems else f"{len(problems)} mismatches")
+        sys.exit(1 if problems else 0)
+    else:
+        print(__doc__)
+        sys.exit(2)
+    db.close()
@@ -0,0 +1,167 @@
+"""
+Batch parcel-to-ride allocation.
+
+Pending parcels go, earliest deadline first (then oldest first), onto the
+earliest upcoming ride in their direction that departs by the deadline
+and still has room for them by count, weight and volume. Each parcel
+costs one vectorized scan over the remaining ride capacities, so a run
+over thousands of parcels stays fast. Assignments are written with one
+bulk UPDATE.
+
+Capacities left empty on a ride fall back to the DEFAULT_* limits, and
+parcels without a weight or volume count as a typical small parcel.
+
+Usage: python allocation.py [--dry-run] [--reassign]
+"""
+from datetime import date
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import models
+
+DEFAULT_RIDE_PARCELS = 40
+DEFAULT_RIDE_WEIGHT_KG = 400.0
+DEFAULT_RIDE_VOLUME_L = 2000.0
+DEFAULT_PARCEL_WEIGHT_KG = 5.0
+DEFAULT_PARCEL_VOLUME_L = 20.0
+
+
+def _or(values: list, default: float) -> np.ndarray:
+    return np.array([default if v is None else v for v in values], dtype=float)
+
+
+def allocate(
+    db: Session,
+    today: Optional[date] = None,
+    reassign: bool = False,
+    dry_run: bool = False,
+) -> dict:
+    """Assign unallocated pending parcels (all pending ones on upcoming rides with reassign=True)."""
+    today = today or date.today()
+    rides = (
+        db.query(
+            models.Ride.id, models.Ride.date, models.Route.direction,
+            models.Ride.parcel_capacity, models.Ride.parcel_weight_kg, models.Ride.parcel_volume_l,
+        )
+        .join(models.Route, models.Route.id == models.Ride.route_id)
+        .filter(models.Ride.date >= today, models.Ride.status != "cancelled")
+        .order_by(models.Ride.date, models.Ride.id)
+        .all()
+    )
+    ride_ids = [r[0] for r in rides]
+
+    parcels = db.query(
+        models.Parcel.id, models.Parcel.ride_id, models.Parcel.direction, models.Parcel.status,
+        models.Parcel.weight_kg, models.Parcel.volume_l, models.Parcel.deadline,
+    )
+    if ride_ids:
+        parcels = parcels.filter(
+            (models.Parcel.ride_id.is_(None) & (models.Parcel.status == "pending"))
+            | models.Parcel.ride_id.in_(ride_ids)
+        )
+    else:
+        parcels = parcels.filter(models.Parcel.ride_id.is_(None), models.Parcel.status == "pending")
+    parcels = parcels.all()
+
+    n_rides = len(rides)
+    ride_index = {rid: i for i, rid in enumerate(ride_ids)}
+    ride_day = np.array([r[1].toordinal() for r in rides], dtype=np.int64)
+    ride_dir = np.array([r[2] for r in rides], dtype=object)
+    rem_count = _or([r[3] for r in rides], DEFAULT_RIDE_PARCELS)
+    rem_weight = _or([r[4] for r in rides], DEFAULT_RIDE_WEIGHT_KG)
+    rem_volume = _or([r[5] for r in rides], DEFAULT_RIDE_VOLUME_L)
+
+    weight = _or([p[4] for p in parcels], DEFAULT_PARCEL_WEIGHT_KG)
+    volume = _or([p[5] for p in parcels], DEFAULT_PARCEL_VOLUME_L)
+
+    # Parcels that stay where they are use up capacity first
+    todo = []
+    for k, p in enumerate(parcels):
+        movable = p[3] == "pending" and (p[1] is None or reassign)
+        if movable:
+            todo.append(k)
+        elif p[1] in ride_index:
+            i = ride_index[p[1]]
+            rem_count[i] -= 1
+            rem_weight[i] -= weight[k]
+            rem_volume[i] -= volume[k]
+
+    far = date.max.toordinal()
+    deadline = np.array([parcels[k][6].toordinal() if parcels[k][6] else far for k in todo], dtype=np.int64)
+    order = np.lexsort((np.array([parcels[k][0] for k in todo], dtype=np.int64), deadline))
+
+    by_direction = {d: np.flatnonzero(ride_dir == d) for d in set(ride_dir.tolist())}
+    assignments, unallocated = [], []
+    for o in order:
+        k = todo[o]
+        pid, current, direction = parcels[k][0], parcels[k][1], parcels[k][2]
+        candidates = by_direction.get(direction)
+        if candidates is None or not len(candidates):
+            unallocated.append({"parcel_id": pid, "reason": "no_ride"})
+            continue
+        # Rides are sorted by date, so the deadline cuts the candidate list
+        candidates = candidates[: np.searchsorted(ride_day[candidates], deadline[o], side="right")]
+        if not len(candidates):
+            unallocated.append({"parcel_id": pid, "reason": "deadline"})
+            continue
+        fits = (
+            (rem_count[candidates] >= 1)
+            & (rem_weight[candidates] >= weight[k])
+            & (rem_volume[candidates] >= volume[k])
+        )
+        if not fits.any():
+            unallocated.append({"parcel_id": pid, "reason": "capacity"})
+            if current is not None:
+                assignments.append((pid, None))
+            continue
+        i = candidates[int(np.argmax(fits))]
+        rem_count[i] -= 1
+        rem_weight[i] -= weight[k]
+        rem_volume[i] -= volume[k]
+        if ride_ids[i] != current:
+            assignments.append((pid, ride_ids[i]))
+
+    if assignments and not dry_run:
+        db.execute(update(models.Parcel), [{"id": pid, "ride_id": rid} for pid, rid in assignments])
+        db.commit()
+
+    load = []
+    for i, rid in enumerate(ride_ids):
+        cap_count = rides[i][3] if rides[i][3] is not None else DEFAULT_RIDE_PARCELS
+        cap_weight = rides[i][4] if rides[i][4] is not None else DEFAULT_RIDE_WEIGHT_KG
+        cap_volume = rides[i][5] if rides[i][5] is not None else DEFAULT_RIDE_VOLUME_L
+        load.append({
+            "ride_id": rid,
+            "date": rides[i][1],
+            "direction": rides[i][2],
+            "parcels": int(cap_count - rem_count[i]),
+            "weight_kg": round(float(cap_weight - rem_weight[i]), 2),
+            "volume_l": round(float(cap_volume - rem_volume[i]), 2),
+            "capacity": int(cap_count),
+            "weight_capacity_kg": float(cap_weight),
+            "volume_capacity_l": float(cap_volume),
+        })
+    return {
+        "dry_run": dry_run,
+        "considered": len(todo),
+        "changed": len(assignments),
+        "assignments": [{"parcel_id": pid, "ride_id": rid} for pid, rid in assignments],
+        "unallocated": unallocated,
+        "rides": [r for r in load if r["parcels"]],
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import migrations
+    from database import SessionLocal, engine
+
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    result = allocate(db, reassign="--reassign" in sys.argv, dry_run="--dry-run" in sys.argv)
+    print(f"{result['changed']} of {result['considered']} parcels (re)assigned, "
+          f"{len(result['unallocated'])} left unallocated")
+    db.close()
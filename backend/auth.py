@@ -8,6 +8,7 @@ from fastapi.security import OAuth2PasswordBearer, APIKeyHeader
 from sqlalchemy.orm import Session
 from database import get_db
 import models
+import profiling
 from schemas import TokenData
 
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-production-please")
@@ -20,11 +21,13 @@ api_key_header = APIKeyHeader(name="X-Bot-Key", auto_error=False)
 
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return bcrypt.checkpw(plain.encode(), hashed.encode())
+    with profiling.span("bcrypt"):
+        return bcrypt.checkpw(plain.encode(), hashed.encode())
 
 
 def hash_password(plain: str) -> str:
-    return bcrypt.hashpw(plain.encode(), bcrypt.gensalt()).decode()
+    with profiling.span("bcrypt"):
+        return bcrypt.hashpw(plain.encode(), bcrypt.gensalt()).decode()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -41,28 +44,32 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
-async def get_current_user(
-    token: Optional[str] = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> models.User:
-    exc = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def user_from_token(db: Session, token: Optional[str]) -> Optional[models.User]:
+    """The user a JWT belongs to, or None if it is missing, invalid or expired."""
     if not token:
-        raise exc
+        return None
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise exc
+            return None
         token_data = TokenData(username=username)
     except JWTError:
-        raise exc
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
+        return None
+    return db.query(models.User).filter(models.User.username == token_data.username).first()
+
+
+async def get_current_user(
+    token: Optional[str] = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> models.User:
+    user = user_from_token(db, token)
     if user is None:
-        raise exc
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
 
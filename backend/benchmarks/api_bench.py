@@ -0,0 +1,367 @@
+"""
+API load test: a weighted mix of bot and admin traffic.
+
+By default the app runs in-process behind httpx's ASGI transport, on a
+fresh SQLite database filled by synthetic.py, so SQL statements can be counted per
+request. With --url it drives a running server instead (SQL counts are
+then not available). To serve the same data:
+
+    python -m benchmarks.api_bench --seed-only --db bench.db
+    DATABASE_URL=sqlite:///bench.db uvicorn main:app
+    python -m benchmarks.api_bench --url http://127.0.0.1:8000
+
+Each worker repeatedly picks a scenario by weight (list rides, booking
+context, create + cancel booking, parcel CRUD, login, admin lists...).
+Every HTTP call is timed on its own and reported per endpoint with
+p50/p95/p99 and mean SQL statements. --out saves the results as JSON and
+--baseline prints the change against an earlier run.
+
+Usage: python -m benchmarks.api_bench [--scenarios 1000] [--concurrency 8]
+           [--bookings 5000] [--parcels 1000] [--routes 8] [--years 0.5] [--seed 1]
+           [--out results.json] [--baseline old.json]
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+BOT_API_KEY = os.getenv("BOT_API_KEY", "bot-secret-key")
+ADMIN_USERNAME = "bench-admin"
+ADMIN_PASSWORD = "bench-admin"
+
+# (scenario, weight); bot traffic dominates, as in production
+MIX = (
+    ("list_rides", 30),
+    ("booking_context", 20),
+    ("my_bookings", 10),
+    ("book_and_cancel", 10),
+    ("parcel_crud", 6),
+    ("track_parcel", 6),
+    ("admin_bookings", 5),
+    ("admin_parcels", 4),
+    ("admin_occupancy", 6),
+    ("login", 3),
+)
+
+# ── Measurement ───────────────────────────────────────────────────────────────
+
+_sql = contextvars.ContextVar("bench_sql", default=None)
+
+
+def count_sql(engine):
+    """Count statements per request; the box travels with the request into the threadpool."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        box = _sql.get()
+        if box is not None:
+            box[0] += 1
+
+
+class Recorder:
+    def __init__(self, client, counts_sql: bool):
+        self.client = client
+        self.counts_sql = counts_sql
+        self.samples = defaultdict(list)      # label -> [(ms, sql statements, ok)]
+
+    async def call(self, label: str, method: str, url: str, **kwargs):
+        box = [0]
+        token = _sql.set(box)
+        start = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, **kwargs)
+        finally:
+            _sql.reset(token)
+        ms = (time.perf_counter() - start) * 1000
+        self.samples[label].append((ms, box[0] if self.counts_sql else None, r.status_code < 400))
+        return r
+
+
+class Context:
+    """Ids the scenarios pick from, loaded through the API so --url works too."""
+
+    async def load(self, client, username: str, password: str):
+        r = await client.post("/auth/token", data={"username": username, "password": password})
+        r.raise_for_status()
+        self.username, self.password = username, password
+        self.bot = {"X-Bot-Key": BOT_API_KEY}
+        self.admin = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        rides = (await client.get("/api/rides", params={"fields": "id,route_id,date,seats_free,status"})).json()
+        today = date.today().isoformat()
+        self.rides = [(x["id"], x["route_id"]) for x in rides]
+        self.bookable = [x["id"] for x in rides if x["status"] == "active" and x["date"] >= today and x["seats_free"] > 0]
+        self.stops = {
+            route["id"]: [s["id"] for s in sorted(route["stops"], key=lambda s: s["order"])]
+            for route in (await client.get("/api/routes")).json()
+        }
+        self.ride_route = dict(self.rides)
+        self.phones = sorted({x["phone"] for x in (await client.get("/api/bookings", params={"fields": "phone"})).json()})
+        parcels = (await client.get("/api/parcels", params={"fields": "tracking_code"})).json()
+        self.codes = [x["tracking_code"] for x in parcels if x.get("tracking_code")]
+        if not (self.rides and self.bookable and self.phones and self.codes):
+            raise SystemExit("Benchmark database needs rides (some upcoming), bookings and parcels")
+
+
+def _pick(rng, seq):
+    return seq[int(rng.integers(len(seq)))]
+
+
+# ── Scenarios ─────────────────────────────────────────────────────────────────
+
+async def list_rides(b: Recorder, ctx: Context, rng):
+    await b.call("GET /api/rides", "GET", "/api/rides", headers=ctx.bot)
+
+
+async def booking_context(b: Recorder, ctx: Context, rng):
+    """What the bot loads when a passenger picks a ride: the ride, then its route's stops."""
+    ride_id, route_id = _pick(rng, ctx.rides)
+    await b.call("GET /api/rides/{id}", "GET", f"/api/rides/{ride_id}", headers=ctx.bot)
+    await b.call("GET /api/routes/{id}", "GET", f"/api/routes/{route_id}", headers=ctx.bot)
+
+
+async def my_bookings(b: Recorder, ctx: Context, rng):
+    await b.call("GET /api/bookings?phone", "GET", "/api/bookings",
+                 params={"phone": _pick(rng, ctx.phones)}, headers=ctx.bot)
+
+
+async def book_and_cancel(b: Recorder, ctx: Context, rng):
+    ride_id = _pick(rng, ctx.bookable)
+    stops = ctx.stops[ctx.ride_route[ride_id]]
+    r = await b.call("POST /api/bookings", "POST", "/api/bookings", headers=ctx.bot, json={
+        "ride_id": ride_id, "name": "Bench Passenger", "phone": _pick(rng, ctx.phones), "seats": 1,
+        "from_stop_id": stops[0], "to_stop_id": stops[-1],
+    })
+    if r.status_code == 200:
+        await b.call("DELETE /api/bookings/{id}", "DELETE", f"/api/bookings/{r.json()['id']}", headers=ctx.bot)
+
+
+async def parcel_crud(b: Recorder, ctx: Context, rng):
+    r = await b.call("POST /api/parcels", "POST", "/api/parcels", headers=ctx.bot, json={
+        "direction": _pick(rng, ["UA->CZ", "CZ->UA"]), "sender": "Bench Sender", "sender_phone": _pick(rng, ctx.phones),
+        "receiver": "Bench Receiver", "receiver_phone": _pick(rng, ctx.phones), "np_office": "12",
+    })
+    if r.status_code != 200:
+        return
+    parcel_id = r.json()["id"]
+    await b.call("GET /api/parcels/{id}", "GET", f"/api/parcels/{parcel_id}", headers=ctx.bot)
+    await b.call("PATCH /api/parcels/{id}/status", "PATCH", f"/api/parcels/{parcel_id}/status",
+                 headers=ctx.admin, json={"status": "in_transit"})
+    await b.call("DELETE /api/parcels/{id}", "DELETE", f"/api/parcels/{parcel_id}", headers=ctx.admin)
+
+
+async def track_parcel(b: Recorder, ctx: Context, rng):
+    await b.call("GET /api/parcels/track/{code}", "GET", f"/api/parcels/track/{_pick(rng, ctx.codes)}")
+
+
+async def admin_bookings(b: Recorder, ctx: Context, rng):
+    await b.call("GET /api/bookings", "GET", "/api/bookings", headers=ctx.admin)
+
+
+async def admin_parcels(b: Recorder, ctx: Context, rng):
+    await b.call("GET /api/parcels", "GET", "/api/parcels", headers=ctx.admin)
+
+
+async def admin_occupancy(b: Recorder, ctx: Context, rng):
+    level = _pick(rng, ["month", "route_day"])
+    await b.call("GET /api/stats/occupancy", "GET", "/api/stats/occupancy", params={"level": level}, headers=ctx.admin)
+
+
+async def login(b: Recorder, ctx: Context, rng):
+    await b.call("POST /auth/token", "POST", "/auth/token", data={"username": ctx.username, "password": ctx.password})
+
+
+SCENARIOS = {fn.__name__: fn for fn in (
+    list_rides, booking_context, my_bookings, book_and_cancel, parcel_crud, track_parcel,
+    admin_bookings, admin_parcels, admin_occupancy, login,
+)}
+
+
+async def drive(b: Recorder, ctx: Context, runs: int, concurrency: int, seed: int) -> float:
+    """Run `runs` scenarios drawn from MIX on `concurrency` workers; returns wall seconds."""
+    weights = np.array([w for _, w in MIX], dtype=float)
+    plan = iter(np.random.default_rng(seed).choice(len(MIX), size=runs, p=weights / weights.sum()))
+
+    async def worker(k: int):
+        rng = np.random.default_rng([seed, k])
+        for s in plan:
+            await SCENARIOS[MIX[s][0]](b, ctx, rng)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(k) for k in range(concurrency)))
+    return time.perf_counter() - start
+
+
+# ── Report ────────────────────────────────────────────────────────────────────
+
+def _stats(rows) -> dict:
+    ms = np.array([r[0] for r in rows])
+    sql = [r[1] for r in rows if r[1] is not None]
+    return {
+        "count": len(rows),
+        "errors": sum(1 for r in rows if not r[2]),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "sql_per_request": round(float(np.mean(sql)), 2) if sql else None,
+    }
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    every = [row for rows in samples.values() for row in rows]
+    overall = _stats(every)
+    overall["elapsed_s"] = round(elapsed, 3)
+    overall["throughput_rps"] = round(len(every) / elapsed, 1)
+    return {"overall": overall, "endpoints": {label: _stats(rows) for label, rows in sorted(samples.items())}}
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(__file__), timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(result: dict, baseline: dict = None):
+    def delta(new, old):
+        if old in (None, 0) or new is None:
+            return ""
+        return f" ({(new - old) / old * 100:+.0f}%)"
+
+    base = (baseline or {}).get("endpoints", {})
+    print(f"{'endpoint':<34} {'n':>6} {'err':>4} {'p50 ms':>14} {'p95 ms':>14} {'p99 ms':>9} {'sql':>6}")
+    for label, s in result["endpoints"].items():
+        old = base.get(label, {})
+        sql = "-" if s["sql_per_request"] is None else f"{s['sql_per_request']:.1f}"
+        print(
+            f"{label:<34} {s['count']:>6} {s['errors']:>4} "
+            f"{s['p50_ms']:>7.2f}{delta(s['p50_ms'], old.get('p50_ms')):<7} "
+            f"{s['p95_ms']:>7.2f}{delta(s['p95_ms'], old.get('p95_ms')):<7} "
+            f"{s['p99_ms']:>9.2f} {sql:>6}"
+        )
+    o = result["overall"]
+    old = (baseline or {}).get("overall", {})
+    print(
+        f"\n{o['count']} requests in {o['elapsed_s']:.1f}s: {o['throughput_rps']:.1f} req/s"
+        f"{delta(o['throughput_rps'], old.get('throughput_rps'))}, "
+        f"p50 {o['p50_ms']:.2f} ms, p95 {o['p95_ms']:.2f} ms, p99 {o['p99_ms']:.2f} ms, "
+        f"{o['errors']} errors"
+    )
+
+
+# ── Entry point ───────────────────────────────────────────────────────────────
+
+def prepare_database(args) -> str:
+    """Point the app at the bench database, seeding it when it is new."""
+    path = os.path.abspath(args.db or os.path.join(tempfile.mkdtemp(prefix="craft-bench-"), "bench.db"))
+    fresh = not os.path.exists(path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+    import synthetic
+    from database import engine
+
+    if fresh:
+        scale = synthetic.Scale(
+            bookings=args.bookings, parcels=args.parcels, routes=args.routes, years=args.years,
+            drivers=10, vehicles=10,
+        )
+        counts = synthetic.generate(
+            engine, scale, seed=args.seed, admin_username=args.username, admin_password=args.password,
+            log=lambda *a: None,
+        )
+        print(f"Seeded {path} in {counts['seconds']:.1f}s")
+    else:
+        print(f"Using existing {path}")
+    return path
+
+
+async def bench(args, client, counts_sql: bool) -> dict:
+    ctx = Context()
+    await ctx.load(client, args.username, args.password)
+    if args.warmup:
+        await drive(Recorder(client, counts_sql), ctx, args.warmup, args.concurrency, args.seed + 1)
+    recorder = Recorder(client, counts_sql)
+    elapsed = await drive(recorder, ctx, args.scenarios, args.concurrency, args.seed)
+    return summarize(recorder.samples, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenarios", type=int, default=1000, help="scenario runs to time (each is 1-4 requests)")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--bookings", type=int, default=5000)
+    parser.add_argument("--parcels", type=int, default=1000)
+    parser.add_argument("--routes", type=int, default=8)
+    parser.add_argument("--years", type=float, default=0.5)
+    parser.add_argument("--db", help="SQLite file; seeded if missing, reused if present")
+    parser.add_argument("--seed-only", action="store_true", help="seed --db and exit")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--username", default=ADMIN_USERNAME)
+    parser.add_argument("--password", default=ADMIN_PASSWORD)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    args = parser.parse_args()
+
+    import httpx
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        counts_sql = False
+    else:
+        prepare_database(args)
+        if args.seed_only:
+            return
+        import importlib
+        from database import engine
+
+        app = importlib.import_module("main").app
+        count_sql(engine)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+        counts_sql = True
+
+    async def run():
+        async with client:
+            return await bench(args, client, counts_sql)
+
+    result = asyncio.run(run())
+    result["meta"] = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "git": _git_revision(),
+        "target": args.url or "asgi",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {k: getattr(args, k) for k in ("scenarios", "warmup", "concurrency", "seed", "bookings", "parcels", "routes", "years")},
+        "mix": dict(MIX),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
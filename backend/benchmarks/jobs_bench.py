@@ -0,0 +1,176 @@
+"""
+Job queue benchmark: throughput and pickup latency of jobs.py on SQLite.
+
+throughput: --jobs jobs are queued up front, then 1, 2, 4... worker
+processes (--workers) drain them. Reports jobs/min between the first
+start and the last finish.
+
+latency: the workers idle while a separate producer process enqueues
+--rate jobs/s for --seconds, one commit per job as an endpoint would.
+Reports queue wait (run_at -> started) and end-to-end time
+(created -> finished) at p50/p95/p99. A cross-process pickup is bounded by
+JOB_POLL_SECONDS.
+
+Jobs run a no-op handler (--work-ms to sleep instead), so the numbers
+are the queue's own overhead.
+
+Usage: python -m benchmarks.jobs_bench [--jobs 5000] [--workers 1,2,4] [--concurrency 4]
+           [--rate 100] [--seconds 20] [--work-ms 0] [--db bench_jobs.db]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _register():
+    import jobs
+
+    @jobs.handler("bench.noop")
+    def noop(db, payload):
+        if payload.get("ms"):
+            time.sleep(payload["ms"] / 1000)
+
+    return jobs
+
+
+def _work(concurrency: int, drain: bool):
+    import asyncio
+    from database import SessionLocal
+
+    jobs = _register()
+    asyncio.run(jobs.Worker(SessionLocal, concurrency=concurrency).run(drain=drain))
+
+
+def _produce(rate: float, seconds: float, work_ms: int, out):
+    from database import SessionLocal
+
+    jobs = _register()
+    commits = []
+    start = time.perf_counter()
+    n = int(rate * seconds)
+    for i in range(n):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t = time.perf_counter()
+        with SessionLocal() as db:
+            jobs.enqueue(db, "bench.noop", {"ms": work_ms})
+            db.commit()
+        commits.append(time.perf_counter() - t)
+    out.put(commits)
+
+
+def _reset():
+    from database import SessionLocal
+    from models import Job
+
+    with SessionLocal() as db:
+        db.query(Job).delete()
+        db.commit()
+
+
+def _times():
+    from database import SessionLocal
+    from models import Job
+
+    with SessionLocal() as db:
+        return db.query(Job.created_at, Job.run_at, Job.started_at, Job.finished_at, Job.status).all()
+
+
+def _ms(values) -> str:
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return f"p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms"
+
+
+def throughput(n: int, workers: int, concurrency: int, work_ms: int):
+    from database import SessionLocal
+
+    jobs = _register()
+    _reset()
+    t = time.perf_counter()
+    with SessionLocal() as db:
+        for i in range(n):
+            jobs.enqueue(db, "bench.noop", {"ms": work_ms})
+            if i % 500 == 499:
+                db.commit()
+        db.commit()
+    enqueue_s = time.perf_counter() - t
+
+    procs = [multiprocessing.Process(target=_work, args=(concurrency, True)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    rows = _times()
+    done = [r for r in rows if r.status == "done"]
+    span = (max(r.finished_at for r in done) - min(r.started_at for r in done)).total_seconds()
+    print(f"throughput  workers={workers} x{concurrency}  {len(done)}/{n} done in {span:6.2f} s  "
+          f"{len(done) / span * 60:9.0f} jobs/min   (enqueue {n / enqueue_s * 60:9.0f} jobs/min)")
+
+
+def latency(rate: float, seconds: float, workers: int, concurrency: int, work_ms: int):
+    _reset()
+    procs = [multiprocessing.Process(target=_work, args=(concurrency, False)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    time.sleep(2.0)     # let the workers import and go idle
+    out = multiprocessing.Queue()
+    producer = multiprocessing.Process(target=_produce, args=(rate, seconds, work_ms, out))
+    producer.start()
+    commits = out.get()
+    producer.join()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        rows = _times()
+        if all(r.status == "done" for r in rows):
+            break
+        time.sleep(0.2)
+    for p in procs:
+        p.terminate()
+        p.join()
+    done = [r for r in rows if r.status == "done"]
+    wait = [(r.started_at - r.run_at).total_seconds() for r in done]
+    total = [(r.finished_at - r.created_at).total_seconds() for r in done]
+    print(f"latency     {rate:.0f} jobs/s = {rate * 60:.0f} jobs/min for {seconds:.0f} s, "
+          f"workers={workers} x{concurrency}, {len(done)}/{len(rows)} done")
+    print(f"  enqueue commit  {_ms(commits)}")
+    print(f"  queue wait      {_ms(wait)}")
+    print(f"  end to end      {_ms(total)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--workers", default="1,2,4", help="worker process counts for the throughput runs")
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight per worker process")
+    parser.add_argument("--rate", type=float, default=100.0, help="latency run: jobs enqueued per second")
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--work-ms", type=int, default=0)
+    parser.add_argument("--db", help="SQLite file (default: a temporary one)")
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(), "jobs_bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["JOB_WORKER"] = "0"
+    import migrations
+    from database import engine
+
+    migrations.upgrade(engine, log=lambda m: None)
+    engine.dispose()
+    multiprocessing.set_start_method("spawn")
+    print(f"{datetime.now():%Y-%m-%d %H:%M}  {path}  JOB_POLL_SECONDS={os.getenv('JOB_POLL_SECONDS', '0.2')}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        throughput(args.jobs, workers, args.concurrency, args.work_ms)
+    latency(args.rate, args.seconds, max(int(w) for w in args.workers.split(",")), args.concurrency, args.work_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Worker cold start: time from spawning `uvicorn main:app` until the first
+real request (GET /api/routes) is answered, which is what each new
+worker costs a multi-worker deployment.
+
+Runs against DATABASE_URL, or --db. Runs alternate with --baseline-dir
+(e.g. a `git worktree` of an older commit) so both see the same
+machine noise. Reports median and min over --runs spawns.
+
+Usage: python -m benchmarks.startup_bench [--runs 20] [--db data.db]
+           [--baseline-dir ../old/backend] [--port 8790]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def time_to_first_request(cwd: str, env: dict, port: int, path: str = "/api/routes") -> float:
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, env=env,
+    )
+    try:
+        while True:
+            if proc.poll() is not None:
+                raise SystemExit(f"uvicorn exited with {proc.returncode} in {cwd}")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5).read()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--db", help="SQLite file (default: DATABASE_URL)")
+    parser.add_argument("--baseline-dir", help="backend directory of another checkout to compare against")
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if args.db:
+        env["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    targets = [("current", BACKEND)]
+    if args.baseline_dir:
+        targets.insert(0, ("baseline", args.baseline_dir))
+
+    # One untimed start each: applies pending migrations and writes bytecode caches
+    for _, cwd in targets:
+        time_to_first_request(cwd, env, args.port)
+    samples = {label: [] for label, _ in targets}
+    for _ in range(args.runs):
+        for label, cwd in targets:
+            samples[label].append(time_to_first_request(cwd, env, args.port))
+
+    for label, values in samples.items():
+        print(f"{label:9} median {statistics.median(values) * 1000:7.0f} ms   min {min(values) * 1000:7.0f} ms")
+    if args.baseline_dir:
+        base, cur = statistics.median(samples["baseline"]), statistics.median(samples["current"])
+        print(f"{'change':9} {(cur - base) / base * 100:+6.1f} % (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Tour optimizer vs. the old browser heuristic on synthetic instances.
+
+Usage: python -m benchmarks.tour_bench [--budget-ms 200] [--seeds 5]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import tour
+
+SIZES = (10, 20, 50, 100, 200)
+
+
+def instance(rng: np.random.Generator, n: int, paired: bool):
+    # Pickups around a few Czech/Polish cities, like a real drop-off run
+    centers = np.array([[50.08, 14.43], [49.82, 18.26], [49.19, 16.61], [50.06, 19.94]])
+    c = centers[rng.integers(len(centers), size=n)]
+    lat = c[:, 0] + rng.normal(0, 0.15, n)
+    lng = c[:, 1] + rng.normal(0, 0.25, n)
+    after = [None] * n
+    if paired:
+        half = n // 2
+        for k in range(half, 2 * half):
+            after[k] = k - half
+    return lat, lng, after
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=int, default=200)
+    parser.add_argument("--seeds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'n':>4} {'paired':>6} {'baseline km':>12} {'optimized km':>13} {'gain %':>7} {'ms':>8}")
+    for paired in (False, True):
+        for n in SIZES:
+            base, opt, ms = [], [], []
+            for seed in range(args.seeds):
+                lat, lng, after = instance(np.random.default_rng(seed), n, paired)
+                r = tour.optimize(lat, lng, after=after, time_budget=args.budget_ms / 1000)
+                base.append(r["baseline_km"])
+                opt.append(r["distance_km"])
+                ms.append(r["elapsed_ms"])
+            gain = (1 - np.mean(opt) / np.mean(base)) * 100
+            print(f"{n:>4} {str(paired):>6} {np.mean(base):>12.1f} {np.mean(opt):>13.1f} {gain:>7.1f} {np.mean(ms):>8.1f}")
+    print("(the baseline ignores pickup-before-drop-off, so paired rows compare against an infeasible tour)")
+
+
+if __name__ == "__main__":
+    main()
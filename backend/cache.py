@@ -0,0 +1,268 @@
+"""
+Response cache for the hot public reads (rides and routes), coherent
+across worker processes.
+
+Writes to the models behind these responses bump a per-namespace counter
+in the cache_versions table, in the same transaction as the data. Each
+process keeps a copy of the counters, and a cached response is keyed by
+the counters of the namespaces it depends on. After a bump, old entries
+can no longer be reached, and LRU eviction drops them.
+
+To notice other workers' commits, one dedicated SQLite connection per
+process polls PRAGMA data_version. It costs microseconds and changes
+whenever any other connection commits. Only then is the small version
+table read again. A poll happens at most every CHECK_SECONDS on the
+request path, and the lifespan watcher polls on the same interval.
+Another worker's write is therefore seen within about CHECK_SECONDS.
+The writing worker sees its own write as soon as it commits.
+
+Each bump records the writer's pid. That lets other in-process state
+tell its own writes, which it already applied, from writes made
+elsewhere:
+- the spatial stop index rebuilds only for writes made elsewhere;
+- live subscribers get a "resync" only for writes made elsewhere.
+
+Writes made through ORM sessions are tracked, including bulk
+update()/delete() on the models. Raw SQL text is not.
+
+Settings: RESPONSE_CACHE (default 1), RESPONSE_CACHE_MB (default 64),
+CACHE_CHECK_SECONDS (default 0.1).
+"""
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, text
+
+import metrics
+import models
+
+ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+MAX_BYTES = int(float(os.getenv("RESPONSE_CACHE_MB", "64")) * 2**20)
+MAX_ENTRY_BYTES = MAX_BYTES // 8
+CHECK_SECONDS = float(os.getenv("CACHE_CHECK_SECONDS", "0.1"))
+
+# Model -> namespaces whose cached responses it appears in
+NAMESPACES = {
+    models.Ride:  ("rides",),
+    models.Route: ("rides", "routes"),    # rides embed a route summary
+    models.Stop:  ("routes",),
+    models.User:  ("rides",),             # rides embed the driver
+}
+# Cached GET paths -> namespaces they depend on (query strings are part of the key)
+RULES = [
+    (re.compile(r"^/api/rides(?:/\d+)?$"), ("rides",)),
+    (re.compile(r"^/api/routes(?:/\d+)?$"), ("routes",)),
+]
+
+_BUMP = text(
+    "INSERT INTO cache_versions (namespace, version, writer) VALUES (:namespace, 1, :writer) "
+    "ON CONFLICT(namespace) DO UPDATE SET version = version + 1, writer = excluded.writer"
+)
+
+
+# ── Versions ──────────────────────────────────────────────────────────────────
+
+class Versions:
+    """This process's view of cache_versions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._data_version: Optional[int] = None
+        self._next_check = 0.0
+        self.current: Dict[str, int] = {}
+        self.elsewhere: Dict[str, int] = {}     # namespace -> changes made by other processes seen so far
+        self._listeners: List[Tuple[str, Callable[[], None]]] = []
+
+    def configure(self, database_path: str):
+        self._path = database_path
+
+    def on_change_elsewhere(self, namespace: str, callback: Callable[[], None]):
+        self._listeners.append((namespace, callback))
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily and per pid, so a connection never crosses a fork
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._data_version = None
+        return self._conn
+
+    def refresh(self):
+        """Re-read the versions if anything was committed since the last look."""
+        if self._path is None:
+            return
+        moved: Set[str] = set()
+        with self._lock:
+            self._next_check = time.monotonic() + CHECK_SECONDS
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            rows = conn.execute("SELECT namespace, version, writer FROM cache_versions").fetchall()
+            for namespace, version, writer in rows:
+                old = self.current.get(namespace)
+                # More than one step, or one step by another pid: not (only) our own commit
+                if old is not None and version != old and (version - old > 1 or writer != self._pid):
+                    self.elsewhere[namespace] = self.elsewhere.get(namespace, 0) + 1
+                    moved.add(namespace)
+                self.current[namespace] = version
+        for namespace, callback in self._listeners:
+            if namespace in moved:
+                callback()
+
+    def maybe_refresh(self):
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+
+    def key(self, namespaces: Tuple[str, ...]) -> tuple:
+        return tuple(self.current.get(n, 0) for n in namespaces)
+
+
+versions = Versions()
+
+
+async def watch():
+    """Poll for other workers' commits (runs in each worker's lifespan)."""
+    while True:
+        await asyncio.sleep(CHECK_SECONDS)
+        try:
+            versions.refresh()
+        except sqlite3.Error:
+            pass
+
+
+# ── Session hooks ─────────────────────────────────────────────────────────────
+
+def _touch(session, cls):
+    for base in cls.__mro__:
+        if base in NAMESPACES:
+            session.info.setdefault("cache_namespaces", set()).update(NAMESPACES[base])
+            return
+
+
+def _after_flush(session, flush_context):
+    for obj in session.new | session.dirty | session.deleted:
+        _touch(session, type(obj))
+
+
+def _do_orm_execute(state):
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None:
+        _touch(state.session, state.bind_mapper.class_)
+
+
+def _before_commit(session):
+    session.flush()
+    namespaces = session.info.pop("cache_namespaces", None)
+    if namespaces:
+        session.execute(_BUMP, [{"namespace": n, "writer": os.getpid()} for n in sorted(namespaces)])
+        session.info["cache_bumped"] = True
+
+
+def _after_commit(session):
+    if session.info.pop("cache_bumped", False):
+        versions.refresh()
+
+
+def _after_rollback(session):
+    session.info.pop("cache_namespaces", None)
+    session.info.pop("cache_bumped", None)
+
+
+def install(engine, session_factory):
+    """Track writes made through `session_factory` sessions and watch `engine`'s database."""
+    versions.configure(engine.url.database)
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "do_orm_execute", _do_orm_execute)
+    event.listen(session_factory, "before_commit", _before_commit)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+
+# ── Responses ─────────────────────────────────────────────────────────────────
+
+class _Store:
+    def __init__(self):
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry, size: int):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[2])
+        self.entries[key] = entry
+        self.size += size
+        while self.size > MAX_BYTES and self.entries:
+            _, dropped = self.entries.popitem(last=False)
+            self.size -= len(dropped[2])
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+store = _Store()
+
+
+class ResponseCacheMiddleware:
+    """Serves RULES paths from `store`; only touched from the event loop, so no locking."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        namespaces = next((ns for pattern, ns in RULES if pattern.match(path)), None)
+        if namespaces is None:
+            await self.app(scope, receive, send)
+            return
+
+        versions.maybe_refresh()
+        key = (path, scope.get("query_string", b""), versions.key(namespaces))
+        entry = store.get(key)
+        if entry is not None:
+            metrics.cache_lookups.inc(cache="responses", result="hit")
+            route, headers, body = entry
+            if route is not None:
+                scope["route"] = route      # for per-route metrics and profiling
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        metrics.cache_lookups.inc(cache="responses", result="miss")
+
+        status = None
+        headers: list = []
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture(message):
+            nonlocal status, headers, size
+            if message["type"] == "http.response.start":
+                status, headers = message["status"], list(message.get("headers", ()))
+            elif message["type"] == "http.response.body" and size <= MAX_ENTRY_BYTES:
+                body = message.get("body", b"")
+                chunks.append(body)
+                size += len(body)
+            await send(message)
+
+        await self.app(scope, receive, capture)
+        if status == 200 and size <= MAX_ENTRY_BYTES:
+            store.put(key, (scope.get("route"), headers, b"".join(chunks)), size)
@@ -0,0 +1,219 @@
+"""
+Persistent stop-to-stop distance/duration matrix.
+
+distance_matrix holds one row per ordered pair of points, keyed by a
+coordinate hash (lat/lng rounded to 1e-5 degrees, about a metre, packed
+into one integer). Points are identified by where they are rather than
+by Stop id, so a moved stop simply gets new keys and geocoded addresses
+share cells with stops at the same place.
+
+Missing pairs are filled from the routing provider in one matrix call
+and written back; after that, any N×N matrix is a single indexed read.
+
+ROUTER=haversine (default) uses great-circle distance × DETOUR_FACTOR at
+AVERAGE_SPEED_KMH; ROUTER=osrm queries an OSRM /table service (OSRM_URL).
+Switching providers: python distances.py clear
+
+Usage: python distances.py [fill-routes|clear]
+"""
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+from geo import DETOUR_FACTOR, distance_matrix_km
+from models import DistanceCell
+
+AVERAGE_SPEED_KMH = 70.0
+PERSIST_LIMIT = 60       # larger ad-hoc matrices reuse stored cells but are not written back
+KEY_SCALE = 100_000      # 1e-5 degree grid
+LNG_SPAN = 360 * KEY_SCALE + 1
+
+
+def coord_key(lat, lng) -> np.ndarray:
+    """Pack rounded coordinates into int64 keys; accepts scalars or arrays."""
+    lat_i = np.rint(np.asarray(lat, dtype=float) * KEY_SCALE).astype(np.int64) + 90 * KEY_SCALE
+    lng_i = np.rint(np.asarray(lng, dtype=float) * KEY_SCALE).astype(np.int64) + 180 * KEY_SCALE
+    return lat_i * LNG_SPAN + lng_i
+
+
+# ── Providers ─────────────────────────────────────────────────────────────────
+
+class RoutingUnavailable(Exception):
+    """The routing service could not be reached or answered with an HTTP error."""
+
+
+class RoutingProvider:
+    name = "none"
+
+    def matrix(self, lat: np.ndarray, lng: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(distance km, duration min) N×N matrices; unreachable pairs are inf."""
+        raise NotImplementedError
+
+
+class HaversineProvider(RoutingProvider):
+    name = "haversine"
+
+    def __init__(self, detour_factor: float = DETOUR_FACTOR, speed_kmh: float = AVERAGE_SPEED_KMH):
+        self.detour_factor = detour_factor
+        self.speed_kmh = speed_kmh
+
+    def matrix(self, lat, lng):
+        km = distance_matrix_km(lat, lng) * self.detour_factor
+        return km, km / self.speed_kmh * 60
+
+
+class OSRMProvider(RoutingProvider):
+    name = "osrm"
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = (url or os.getenv("OSRM_URL", "https://router.project-osrm.org")).rstrip("/")
+
+    def matrix(self, lat, lng):
+        import httpx   # only when OSRM is configured; keeps it off worker startup
+
+        coords = ";".join(f"{x:.6f},{y:.6f}" for x, y in zip(lng, lat))
+        try:
+            r = httpx.get(
+                f"{self.url}/table/v1/driving/{coords}",
+                params={"annotations": "distance,duration"},
+                timeout=30,
+            )
+            r.raise_for_status()
+        except httpx.HTTPError as e:
+            raise RoutingUnavailable(str(e)) from e
+        data = r.json()
+        if data.get("code") != "Ok":
+            raise ValueError(f"OSRM: {data.get('code')}")
+        km = np.array(data["distances"], dtype=float) / 1000
+        minutes = np.array(data["durations"], dtype=float) / 60
+        # OSRM reports unreachable pairs as null
+        return np.nan_to_num(km, nan=np.inf), np.nan_to_num(minutes, nan=np.inf)
+
+
+def provider_from_env() -> RoutingProvider:
+    if os.getenv("ROUTER", "haversine") == "osrm":
+        return OSRMProvider()
+    return HaversineProvider()
+
+
+provider = provider_from_env()
+
+
+# ── Store ─────────────────────────────────────────────────────────────────────
+
+def matrix(
+    db: Session,
+    lat: Sequence[float],
+    lng: Sequence[float],
+    routing: Optional[RoutingProvider] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """(distance km, duration min) for every ordered pair of the given points."""
+    routing = routing or provider
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    keys = coord_key(lat, lng)
+    uniq, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    m = len(uniq)
+    dist = np.full((m, m), np.nan)
+    dur = np.full((m, m), np.nan)
+    np.fill_diagonal(dist, 0.0)
+    np.fill_diagonal(dur, 0.0)
+    if m < 2:
+        return dist[np.ix_(inverse, inverse)], dur[np.ix_(inverse, inverse)]
+
+    t = DistanceCell.__table__
+    key_list = [int(k) for k in uniq]
+    rows = db.execute(
+        select(t.c.origin, t.c.dest, t.c.distance_km, t.c.duration_min)
+        .where(t.c.origin.in_(key_list), t.c.dest.in_(key_list))
+    ).all()
+    if rows:
+        cells = np.array(rows, dtype=float)
+        i = np.searchsorted(uniq, cells[:, 0].astype(np.int64))
+        j = np.searchsorted(uniq, cells[:, 1].astype(np.int64))
+        dist[i, j] = cells[:, 2]
+        dur[i, j] = cells[:, 3]
+
+    missing = np.isnan(dist)
+    misses = int(missing.sum())
+    metrics.cache_lookups.inc(m * (m - 1) - misses, cache="distance_matrix", result="hit")
+    metrics.cache_lookups.inc(misses, cache="distance_matrix", result="miss")
+    if misses:
+        # One provider call over the points that take part in a missing pair
+        idx = np.flatnonzero(missing.any(axis=0) | missing.any(axis=1))
+        sub_dist, sub_dur = routing.matrix(lat[first[idx]], lng[first[idx]])
+        block = np.ix_(idx, idx)
+        hole = missing[block]
+        dist[block] = np.where(hole, sub_dist, dist[block])
+        dur[block] = np.where(hole, sub_dur, dur[block])
+        if m <= PERSIST_LIMIT:
+            oi, di = np.nonzero(missing)
+            db.execute(insert(t).prefix_with("OR IGNORE"), [
+                {
+                    "origin": key_list[a], "dest": key_list[b], "source": routing.name,
+                    "distance_km": float(dist[a, b]), "duration_min": float(dur[a, b]),
+                }
+                for a, b in zip(oi, di)
+            ])
+            db.commit()
+    return dist[np.ix_(inverse, inverse)], dur[np.ix_(inverse, inverse)]
+
+
+def stop_matrix(db: Session, stop_ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Matrices for the given stops, in that order; stops must have coordinates."""
+    stops = {
+        s.id: s for s in db.query(models.Stop).filter(models.Stop.id.in_(list(stop_ids)))
+    }
+    located = [stops.get(i) for i in stop_ids]
+    if any(s is None or s.lat is None or s.lng is None for s in located):
+        raise ValueError("every stop needs coordinates")
+    return matrix(db, [s.lat for s in located], [s.lng for s in located])
+
+
+def route_matrix(db: Session, route_id: int) -> Tuple[List[models.Stop], np.ndarray, np.ndarray]:
+    """Stops of a route that have coordinates (in route order) and their matrices."""
+    stops = (
+        db.query(models.Stop)
+        .filter(models.Stop.route_id == route_id, models.Stop.lat.isnot(None), models.Stop.lng.isnot(None))
+        .order_by(models.Stop.order)
+        .all()
+    )
+    dist, dur = matrix(db, [s.lat for s in stops], [s.lng for s in stops])
+    return stops, dist, dur
+
+
+def fill_routes(db: Session) -> int:
+    """Make sure every route's stop matrix is stored; returns the number of routes."""
+    route_ids = [r[0] for r in db.query(models.Route.id).order_by(models.Route.id)]
+    for route_id in route_ids:
+        route_matrix(db, route_id)
+    return len(route_ids)
+
+
+def clear(db: Session):
+    db.execute(delete(DistanceCell.__table__))
+    db.commit()
+
+
+if __name__ == "__main__":
+    import sys
+    import migrations
+    from database import SessionLocal, engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "fill-routes"
+    if command not in ("fill-routes", "clear"):
+        print(__doc__)
+        sys.exit(2)
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    if command == "clear":
+        clear(db)
+        print("Cleared the distance matrix")
+    else:
+        print(f"Filled matrices for {fill_routes(db)} routes")
+    db.close()
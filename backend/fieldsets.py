@@ -0,0 +1,114 @@
+"""
+Sparse fieldsets: ``GET /api/rides?fields=id,date,seats_free,route.name``.
+
+Requested fields are pushed down into the SELECT column list, so the
+database only reads (and the API only serializes) what the client asked for.
+Plain names map to columns of the model; ``relation.column`` reaches one
+level into a many-to-one relationship through an outer join.
+
+The response skips the endpoint's response_model, so only fields of that
+schema can be selected (``driver.username`` through RideOut.driver, never
+``driver.password_hash``). Anything else is a 400.
+"""
+from typing import Callable, Dict, List, Optional, Set, Tuple, get_args
+
+from pydantic import BaseModel
+
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import inspect
+from sqlalchemy.orm import MANYTOONE, Session, aliased
+
+
+Allowed = Tuple[Set[str], Dict[str, Set[str]]]     # (columns, {relation: columns})
+
+
+def _nested(annotation) -> Optional[type]:
+    """The schema of a nested object field (``Optional[UserOut]`` -> UserOut)."""
+    for t in (annotation, *get_args(annotation)):
+        if isinstance(t, type) and issubclass(t, BaseModel):
+            return t
+    return None
+
+
+def allowed_fields(model, schema) -> Allowed:
+    """Columns of `model` and of its many-to-one relations that `schema` exposes."""
+    mapper = inspect(model)
+    fields = schema.model_fields
+    columns = set(mapper.columns.keys()) & set(fields)
+    relations = {}
+    for r in mapper.relationships:
+        nested = _nested(fields[r.key].annotation) if r.key in fields else None
+        if r.direction is MANYTOONE and nested is not None:
+            relations[r.key] = set(r.mapper.columns.keys()) & set(nested.model_fields)
+    return columns, relations
+
+
+class Fieldset:
+    def __init__(self, model, names: List[str], allowed: Allowed):
+        self.model = model
+        mapper = inspect(model)
+        columns, allowed_relations = allowed
+        relations = {
+            r.key: r for r in mapper.relationships if r.key in allowed_relations
+        }
+
+        if "id" not in names:
+            names = ["id"] + names
+
+        self.keys: List[tuple] = []
+        self.columns = []
+        self.joins: Dict[str, object] = {}
+        for name in dict.fromkeys(names):
+            rel, _, col = name.partition(".")
+            if not col:
+                if name not in columns:
+                    raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+                self.keys.append((name,))
+                self.columns.append(getattr(model, name))
+                continue
+            if rel not in relations:
+                raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+            target = relations[rel].mapper
+            if col not in allowed_relations[rel]:
+                raise HTTPException(status_code=400, detail=f"Unknown field: {name}")
+            if rel not in self.joins:
+                self.joins[rel] = aliased(target.class_)
+            self.keys.append((rel, col))
+            self.columns.append(getattr(self.joins[rel], col))
+
+    def query(self, db: Session):
+        q = db.query(*self.columns).select_from(self.model)
+        for rel, alias in self.joins.items():
+            q = q.outerjoin(getattr(self.model, rel).of_type(alias))
+        return q
+
+    def to_dict(self, row) -> dict:
+        out: dict = {}
+        for key, value in zip(self.keys, row):
+            if len(key) == 1:
+                out[key[0]] = value
+            else:
+                out.setdefault(key[0], {})[key[1]] = value
+        for rel in self.joins:
+            if rel in out and all(v is None for v in out[rel].values()):
+                out[rel] = None
+        return out
+
+    def response(self, rows) -> JSONResponse:
+        return JSONResponse(jsonable_encoder([self.to_dict(r) for r in rows]))
+
+
+def sparse_fields(model, schema) -> Callable[..., Optional[Fieldset]]:
+    """Dependency factory parsing ``?fields=`` into a Fieldset (or None); `schema` is the response item model."""
+    allowed = allowed_fields(model, schema)
+
+    def dependency(
+        fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+    ) -> Optional[Fieldset]:
+        if not fields:
+            return None
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        return Fieldset(model, names, allowed) if names else None
+    return dependency
@@ -0,0 +1,209 @@
+"""
+Demand forecasting per route and departure weekday.
+
+For every departed ride we build its booking curve: booked[d] = seats
+booked at least d days before departure (d = 0..HORIZON, booked[0] is the
+final load). demand_curves keeps the per (route, weekday) sums of those
+curves, so folding in newly departed rides is an O(new rides) update and
+never retrains over the whole history.
+
+Prediction for an upcoming ride d days out with b seats already sold:
+    multiplicative  b * sum(final) / sum(booked[d])     (when b > 0)
+    additive pickup b + (sum(final) - sum(booked[d])) / n
+
+The curves are brought up to date by the forecast.update job, which the
+first booking of a day queues (see stale()); reads never write.
+
+Usage: python forecast.py [update|refit]
+"""
+import sys
+from datetime import date, timedelta
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import aggregates
+import models
+from models import DemandCurve
+
+HORIZON = 30        # days before departure tracked on the curve
+MIN_RIDES = 4       # below this a (route, weekday) falls back to the whole route
+
+
+def _empty_curve() -> np.ndarray:
+    return np.zeros(HORIZON + 1)
+
+
+def _load_curve(row: DemandCurve) -> np.ndarray:
+    return np.frombuffer(row.booked_curve, dtype=np.float64).copy() if row.booked_curve else _empty_curve()
+
+
+def booking_curves(
+    db: Session, rides: list, since: Optional[date], until: date,
+) -> np.ndarray:
+    """Matrix [len(rides), HORIZON+1] of seats booked at least d days out.
+
+    `rides` are (id, route_id, date) rows with dates in (since, until].
+    """
+    curves = np.zeros((len(rides), HORIZON + 1))
+    if not rides:
+        return curves
+    index = {r[0]: i for i, r in enumerate(rides)}
+    ride_dates = [r[2] for r in rides]
+    q = (
+        db.query(models.Booking.ride_id, models.Booking.created_at, models.Booking.seats)
+        .join(models.Ride, models.Ride.id == models.Booking.ride_id)
+        .filter(models.Booking.status == "confirmed", models.Ride.date <= until)
+    )
+    if since is not None:
+        q = q.filter(models.Ride.date > since)
+    rows = [r for r in q.all() if r[0] in index]
+    if not rows:
+        return curves
+    idx = np.fromiter((index[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+    days = np.fromiter(
+        ((ride_dates[index[r[0]]] - r[1].date()).days if r[1] else 0 for r in rows),
+        dtype=np.int64, count=len(rows),
+    )
+    seats = np.fromiter((r[2] for r in rows), dtype=float, count=len(rows))
+    np.add.at(curves, (idx, np.clip(days, 0, HORIZON)), seats)
+    # Booked "at least d days out" is the reverse cumulative sum
+    return np.cumsum(curves[:, ::-1], axis=1)[:, ::-1]
+
+
+def fitted_through(db: Session) -> Optional[date]:
+    row = db.query(DemandCurve.fitted_through).order_by(DemandCurve.fitted_through.desc()).first()
+    return row[0] if row else None
+
+
+def stale(db: Session, today: Optional[date] = None) -> bool:
+    """True when rides that departed before `today` are not folded into the curves yet."""
+    until = (today or date.today()) - timedelta(days=1)
+    since = fitted_through(db)
+    if since is not None:
+        return since < until
+    return db.query(models.Ride.id).filter(
+        models.Ride.date <= until, models.Ride.status != "cancelled",
+    ).first() is not None
+
+
+def update(db: Session, today: Optional[date] = None, full: bool = False) -> int:
+    """Fold rides that departed since the last fit into the curve sums."""
+    today = today or date.today()
+    until = today - timedelta(days=1)
+    since = None if full else fitted_through(db)
+    if since is not None and since >= until:
+        return 0
+    if full:
+        db.query(DemandCurve).delete()
+
+    q = db.query(models.Ride.id, models.Ride.route_id, models.Ride.date).filter(
+        models.Ride.date <= until, models.Ride.status != "cancelled",
+    )
+    if since is not None:
+        q = q.filter(models.Ride.date > since)
+    rides = q.all()
+
+    state = {(c.route_id, c.weekday): c for c in db.query(DemandCurve).all()}
+    if rides:
+        curves = booking_curves(db, rides, since, until)
+        groups = np.array([r[1] * 7 + r[2].weekday() for r in rides])
+        for g in np.unique(groups):
+            mask = groups == g
+            key = (int(g) // 7, int(g) % 7)
+            row = state.get(key)
+            if row is None:
+                row = DemandCurve(route_id=key[0], weekday=key[1], rides=0, final_seats=0.0)
+                db.add(row)
+                state[key] = row
+            curve = _load_curve(row) + curves[mask].sum(axis=0)
+            row.rides = (row.rides or 0) + int(mask.sum())
+            row.final_seats = float(curve[0])
+            row.booked_curve = curve.tobytes()
+    for row in state.values():
+        row.fitted_through = until
+    db.commit()
+    return len(rides)
+
+
+def predict(db: Session, today: Optional[date] = None, route_id: Optional[int] = None) -> List[dict]:
+    today = today or date.today()
+    q = db.query(
+        models.Ride.id, models.Ride.route_id, models.Ride.date, models.Ride.seats_total,
+    ).filter(models.Ride.date >= today, models.Ride.status != "cancelled")
+    if route_id is not None:
+        q = q.filter(models.Ride.route_id == route_id)
+    rides = q.order_by(models.Ride.date, models.Ride.id).all()
+    if not rides:
+        return []
+
+    n = len(rides)
+    sold = {int(s.key): s.seats_sold for s in aggregates.query(db, "ride", route_id, date_from=today)}
+    booked = np.fromiter((sold.get(r[0], 0) for r in rides), dtype=float, count=n)
+    days_out = np.fromiter(((r[2] - today).days for r in rides), dtype=np.int64, count=n)
+    d = np.clip(days_out, 0, HORIZON)
+    seats_total = np.fromiter((r[3] for r in rides), dtype=float, count=n)
+
+    # Per-ride curve statistics: (route, weekday) or the route as a whole
+    by_group, by_route = {}, {}
+    for c in db.query(DemandCurve).all():
+        curve = _load_curve(c)
+        by_group[(c.route_id, c.weekday)] = (c.rides, curve)
+        acc = by_route.setdefault(c.route_id, [0, _empty_curve()])
+        acc[0] += c.rides
+        acc[1] = acc[1] + curve
+    history = np.zeros(n)
+    curves = np.zeros((n, HORIZON + 1))
+    for i, r in enumerate(rides):
+        stats = by_group.get((r[1], r[2].weekday()))
+        if stats is None or stats[0] < MIN_RIDES:
+            stats = by_route.get(r[1], stats)
+        if stats is not None:
+            history[i], curves[i] = stats
+
+    final = curves[:, 0]
+    at_d = curves[np.arange(n), d]
+    has_history = history > 0
+    ratio = np.divide(final, at_d, out=np.ones(n), where=at_d > 0)
+    pickup = np.divide(final - at_d, history, out=np.zeros(n), where=has_history)
+    multiplicative = has_history & (booked > 0) & (at_d > 0)
+    forecast = np.where(multiplicative, booked * ratio, booked + pickup)
+    forecast = np.maximum(forecast, booked)
+
+    model = np.where(multiplicative, "multiplicative", np.where(has_history, "additive", "none"))
+    vehicles = np.ceil(np.divide(forecast, seats_total, out=np.zeros(n), where=seats_total > 0))
+    return [
+        {
+            "ride_id": rides[i][0],
+            "route_id": rides[i][1],
+            "date": rides[i][2],
+            "days_out": int(days_out[i]),
+            "seats_total": int(seats_total[i]),
+            "booked": int(booked[i]),
+            "forecast": round(float(forecast[i]), 1),
+            "expected_load": round(float(forecast[i] / seats_total[i]), 3) if seats_total[i] else 0.0,
+            "vehicles_needed": max(int(vehicles[i]), 1),
+            "model": str(model[i]),
+            "history_rides": int(history[i]),
+        }
+        for i in range(n)
+    ]
+
+
+if __name__ == "__main__":
+    import migrations
+    from database import SessionLocal, engine
+
+    migrations.upgrade(engine)
+    command = sys.argv[1] if len(sys.argv) > 1 else "update"
+    if command not in ("update", "refit"):
+        print(__doc__)
+        sys.exit(2)
+    db = SessionLocal()
+    folded = update(db, full=command == "refit")
+    print(f"Folded {folded} departed rides into the booking curves")
+    for p in predict(db):
+        print(f"{p['date']} route={p['route_id']} ride={p['ride_id']}: "
+              f"{p['booked']} booked, forecast {p['forecast']} ({p['model']})")
+    db.close()
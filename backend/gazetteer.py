@@ -0,0 +1,67 @@
+"""
+Offline gazetteer of the cities we serve (UA / PL / CZ).
+
+Each entry lists the spellings dispatchers and passengers actually type:
+Ukrainian, local and English names. Coordinates are city centres.
+"""
+
+CITIES = [
+    # (country, lat, lng, names...)
+    ("UA", 50.4501, 30.5234, "Київ", "Kyiv", "Kiev", "Киев"),
+    ("UA", 50.2547, 28.6587, "Житомир", "Zhytomyr"),
+    ("UA", 50.6199, 26.2516, "Рівне", "Rivne", "Ровно"),
+    ("UA", 49.8397, 24.0297, "Львів", "Lviv", "Lwów", "Львов"),
+    ("UA", 50.7472, 25.3254, "Луцьк", "Lutsk"),
+    ("UA", 49.5535, 25.5948, "Тернопіль", "Ternopil"),
+    ("UA", 49.4229, 26.9871, "Хмельницький", "Khmelnytskyi"),
+    ("UA", 49.2331, 28.4682, "Вінниця", "Vinnytsia"),
+    ("UA", 48.9226, 24.7111, "Івано-Франківськ", "Ivano-Frankivsk"),
+    ("UA", 48.6208, 22.2879, "Ужгород", "Uzhhorod"),
+    ("UA", 48.4392, 22.7178, "Мукачево", "Mukachevo"),
+    ("UA", 48.2921, 25.9358, "Чернівці", "Chernivtsi"),
+    ("UA", 50.3450, 26.6500, "Острог", "Ostroh"),
+    ("UA", 50.3200, 26.5200, "Здолбунів", "Zdolbuniv"),
+    ("UA", 50.0800, 25.1500, "Броди", "Brody"),
+    ("UA", 50.0500, 23.9700, "Жовква", "Zhovkva"),
+    ("UA", 49.7800, 23.8300, "Городок", "Horodok"),
+    ("UA", 50.0333, 23.0000, "Шегині", "Shehyni"),
+    ("UA", 49.9400, 23.3900, "Мостиська", "Mostyska"),
+    ("UA", 50.0800, 23.8900, "Краковець", "Krakovets"),
+    ("UA", 46.4825, 30.7233, "Одеса", "Odesa", "Odessa"),
+    ("UA", 49.9935, 36.2304, "Харків", "Kharkiv"),
+    ("UA", 48.4647, 35.0462, "Дніпро", "Dnipro"),
+    ("UA", 49.5883, 34.5514, "Полтава", "Poltava"),
+    ("UA", 49.4444, 32.0598, "Черкаси", "Cherkasy"),
+    ("PL", 49.7838, 22.7678, "Перемишль", "Przemyśl", "Przemysl"),
+    ("PL", 50.0412, 21.9991, "Жешув", "Rzeszów", "Rzeszow"),
+    ("PL", 50.0647, 19.9450, "Краків", "Kraków", "Krakow", "Cracow"),
+    ("PL", 50.2649, 19.0238, "Катовіце", "Katowice"),
+    ("PL", 51.1079, 17.0385, "Вроцлав", "Wrocław", "Wroclaw"),
+    ("PL", 52.2297, 21.0122, "Варшава", "Warszawa", "Warsaw"),
+    ("PL", 51.2465, 22.5684, "Люблін", "Lublin"),
+    ("PL", 50.0128, 20.9880, "Тарнув", "Tarnów", "Tarnow"),
+    ("PL", 50.2945, 18.6714, "Гливиці", "Gliwice"),
+    ("PL", 49.8224, 19.0444, "Бельсько-Бяла", "Bielsko-Biała", "Bielsko-Biala"),
+    ("PL", 49.7500, 18.6333, "Цешин", "Cieszyn"),
+    ("CZ", 49.7475, 18.6272, "Чеський Тешин", "Český Těšín", "Cesky Tesin"),
+    ("CZ", 49.8209, 18.2625, "Острава", "Ostrava"),
+    ("CZ", 49.6833, 18.3500, "Фридек-Містек", "Frýdek-Místek", "Frydek-Mistek"),
+    ("CZ", 49.9387, 17.9026, "Опава", "Opava"),
+    ("CZ", 49.5938, 17.2509, "Оломоуц", "Olomouc"),
+    ("CZ", 49.4561, 17.4506, "Пршеров", "Přerov", "Prerov"),
+    ("CZ", 49.2265, 17.6707, "Злін", "Zlín", "Zlin"),
+    ("CZ", 49.1951, 16.6068, "Брно", "Brno"),
+    ("CZ", 49.3961, 15.5912, "Йіглава", "Jihlava"),
+    ("CZ", 50.2092, 15.8328, "Градець-Кралове", "Hradec Králové", "Hradec Kralove"),
+    ("CZ", 50.0343, 15.7812, "Пардубіце", "Pardubice"),
+    ("CZ", 49.9483, 15.2681, "Кутна Гора", "Kutná Hora", "Kutna Hora"),
+    ("CZ", 50.0755, 14.4378, "Прага", "Praha", "Prague"),
+    ("CZ", 50.1435, 14.1000, "Кладно", "Kladno"),
+    ("CZ", 50.4114, 14.9032, "Млада Болеслав", "Mladá Boleslav", "Mlada Boleslav"),
+    ("CZ", 50.7663, 15.0543, "Ліберець", "Liberec"),
+    ("CZ", 50.6607, 14.0323, "Усті-над-Лабем", "Ústí nad Labem", "Usti nad Labem"),
+    ("CZ", 49.7384, 13.3736, "Пльзень", "Plzeň", "Plzen", "Pilsen"),
+    ("CZ", 50.2310, 12.8712, "Карлові Вари", "Karlovy Vary"),
+    ("CZ", 48.9745, 14.4743, "Чеські Будейовіце", "České Budějovice", "Ceske Budejovice"),
+    ("CZ", 49.4144, 14.6578, "Табор", "Tábor", "Tabor"),
+]
@@ -0,0 +1,25 @@
+"""Great-circle helpers shared by the planning and reporting modules."""
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Road distance is longer than the great-circle one; this is the average
+# detour we measured on the UA <-> CZ corridor.
+DETOUR_FACTOR = 1.25
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Vectorized haversine distance in km; accepts scalars or arrays."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix_km(lat, lng):
+    """N×N haversine matrix for the given coordinate arrays."""
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    return haversine_km(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
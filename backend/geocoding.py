@@ -0,0 +1,314 @@
+"""
+Server-side geocoding with a persistent cache.
+
+Lookups go: in-process LRU -> geocode_cache table -> offline gazetteer
+(exact city names) -> the configured provider. Addresses are normalized
+before lookup, so "Прага,  Václavské nám. 1" and "прага, vaclavske nam. 1"
+share one cache row. Batches are deduplicated and the misses are resolved
+concurrently within the provider's rate limit.
+
+Street addresses go to OpenStreetMap Nominatim (NOMINATIM_URL,
+GEOCODER_RPS); when it is unreachable they fall back to their city from the
+gazetteer for that request only; neither the cache table nor the
+in-process LRU keeps the stand-in. GEOCODER=offline skips the provider
+entirely (tests, air-gapped installs), so addresses resolve to city
+centroids only.
+
+Usage: python geocoding.py backfill-stops
+"""
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+import models
+from gazetteer import CITIES
+from models import GeocodeCache
+
+MEMORY_SIZE = 20000
+COUNTRY_NAMES = {
+    "ua": "UA", "україна": "UA", "ukraine": "UA",
+    "pl": "PL", "польща": "PL", "polska": "PL", "poland": "PL",
+    "cz": "CZ", "чехія": "CZ", "česko": "CZ", "cesko": "CZ", "czechia": "CZ", "czech republic": "CZ",
+}
+
+
+@dataclass(frozen=True)
+class GeoResult:
+    lat: float
+    lng: float
+    source: str                 # "gazetteer" | provider name | "cache"
+    precision: str = "address"  # "address" | "city"
+
+
+def normalize(address: str) -> str:
+    text = unicodedata.normalize("NFKD", address)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"[ʼ’`']", "'", text)
+    text = re.sub(r"[^\w' -]+", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _build_gazetteer() -> Dict[str, Tuple[str, float, float]]:
+    index = {}
+    for country, lat, lng, *names in CITIES:
+        for name in names:
+            index[normalize(name)] = (country, lat, lng)
+    return index
+
+
+GAZETTEER = _build_gazetteer()
+
+
+def gazetteer_lookup(address: str, partial: bool = False) -> Optional[GeoResult]:
+    """Exact city match ("Львів", "Praha, CZ"); with partial=True any comma part may be the city."""
+    parts = [normalize(p) for p in address.split(",")]
+    parts = [p for p in parts if p]
+    if not parts:
+        return None
+    country = COUNTRY_NAMES.get(parts[-1]) if len(parts) > 1 else None
+    if country:
+        parts = parts[:-1]
+    candidates = parts if partial else (parts if len(parts) == 1 else [])
+    for part in candidates:
+        hit = GAZETTEER.get(part)
+        if hit and (country is None or hit[0] == country):
+            return GeoResult(hit[1], hit[2], "gazetteer", "city")
+    return None
+
+
+# ── Providers ─────────────────────────────────────────────────────────────────
+
+class ProviderUnavailable(Exception):
+    """The provider could not be reached or answered with an HTTP error."""
+
+
+class GeocodingProvider:
+    name = "none"
+    concurrency = 8
+
+    async def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        raise NotImplementedError
+
+
+class OfflineProvider(GeocodingProvider):
+    """Resolves nothing beyond the gazetteer (GEOCODER=offline)."""
+    name = "offline"
+
+    async def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        return None
+
+
+class StaticProvider(GeocodingProvider):
+    """Local stand-in: answers from a fixed {address: (lat, lng)} mapping."""
+    name = "static"
+
+    def __init__(self, mapping: Dict[str, Tuple[float, float]]):
+        self.mapping = {normalize(k): v for k, v in mapping.items()}
+        self.calls = 0
+
+    async def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        self.calls += 1
+        return self.mapping.get(normalize(query))
+
+
+class NominatimProvider(GeocodingProvider):
+    name = "nominatim"
+
+    def __init__(self, url: Optional[str] = None, rps: Optional[float] = None):
+        self.url = url or os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+        self.interval = 1.0 / (rps or float(os.getenv("GEOCODER_RPS", "1")))
+        self.concurrency = max(1, int(1 / self.interval))
+        self._lock = asyncio.Lock()
+        self._next = 0.0
+
+    async def _throttle(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def geocode(self, query: str) -> Optional[Tuple[float, float]]:
+        import httpx   # imported on first lookup; keeps it off worker startup
+
+        await self._throttle()
+        try:
+            async with httpx.AsyncClient() as c:
+                r = await c.get(
+                    self.url,
+                    params={"q": query, "format": "json", "limit": 1, "countrycodes": "ua,pl,cz"},
+                    headers={"Accept-Language": "uk,en", "User-Agent": "CraftTransBot/1.0"},
+                    timeout=10,
+                )
+                r.raise_for_status()
+                data = r.json()
+        except httpx.HTTPError as e:
+            raise ProviderUnavailable(str(e)) from e
+        if not data:
+            return None
+        return float(data[0]["lat"]), float(data[0]["lon"])
+
+
+def provider_from_env() -> GeocodingProvider:
+    if os.getenv("GEOCODER", "nominatim") == "offline":
+        return OfflineProvider()
+    return NominatimProvider()
+
+
+# ── Service ───────────────────────────────────────────────────────────────────
+
+class Geocoder:
+    def __init__(self, provider: Optional[GeocodingProvider] = None):
+        self.provider = provider or provider_from_env()
+        self._memory: "OrderedDict[str, Optional[GeoResult]]" = OrderedDict()
+
+    def _remember(self, key: str, result: Optional[GeoResult]):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        if len(self._memory) > MEMORY_SIZE:
+            self._memory.popitem(last=False)
+
+    def clear_memory(self):
+        self._memory.clear()
+
+    async def geocode_many(self, db: Session, addresses: Iterable[str]) -> List[Optional[GeoResult]]:
+        addresses = list(addresses)
+        keys = [normalize(a) for a in addresses]
+        resolved: Dict[str, Optional[GeoResult]] = {}
+        original: Dict[str, str] = {}
+        for address, key in zip(addresses, keys):
+            if not key:
+                resolved[key] = None
+            elif key in self._memory:
+                self._memory.move_to_end(key)
+                resolved[key] = self._memory[key]
+            else:
+                original.setdefault(key, address)
+
+        # Gazetteer (exact city names) never needs the cache
+        for key, address in list(original.items()):
+            hit = gazetteer_lookup(address)
+            if hit:
+                resolved[key] = hit
+                self._remember(key, hit)
+                del original[key]
+
+        metrics.cache_lookups.inc(len(resolved), cache="geocode_memory", result="hit")
+        metrics.cache_lookups.inc(len(original), cache="geocode_memory", result="miss")
+
+        if original:
+            rows = await run_in_threadpool(_cached, db, list(original))
+            metrics.cache_lookups.inc(len(rows), cache="geocode_db", result="hit")
+            metrics.cache_lookups.inc(len(original) - len(rows), cache="geocode_db", result="miss")
+            for row in rows:
+                result = GeoResult(row.lat, row.lng, row.source, row.precision) if row.lat is not None else None
+                if result is None:
+                    result = gazetteer_lookup(original[row.key], partial=True)
+                resolved[row.key] = result
+                self._remember(row.key, result)
+                del original[row.key]
+
+        if original:
+            found = await self._resolve(list(original.items()))
+            answers = []
+            for key, address in original.items():
+                coords = found.get(key)
+                if coords is not None:
+                    result = GeoResult(coords[0], coords[1], self.provider.name)
+                else:
+                    result = gazetteer_lookup(address, partial=True)
+                resolved[key] = result
+                if key not in found:
+                    continue    # the provider failed: the city stands in for this request only
+                self._remember(key, result)
+                if not isinstance(self.provider, OfflineProvider):
+                    answers.append(GeocodeCache(
+                        key=key, query=address, source=self.provider.name, precision="address",
+                        lat=coords[0] if coords else None, lng=coords[1] if coords else None,
+                    ))
+            if answers:
+                await run_in_threadpool(_store, db, answers)
+        return [resolved.get(k) for k in keys]
+
+    async def _resolve(self, items: List[Tuple[str, str]]) -> Dict[str, Optional[Tuple[float, float]]]:
+        """Provider lookups for cache misses; failed calls are left out (and not cached)."""
+        semaphore = asyncio.Semaphore(self.provider.concurrency)
+
+        async def one(key: str, address: str):
+            async with semaphore:
+                try:
+                    return key, await self.provider.geocode(address), True
+                except (ProviderUnavailable, ValueError, KeyError):
+                    return key, None, False
+
+        out = {}
+        for key, coords, ok in await asyncio.gather(*(one(k, a) for k, a in items)):
+            if ok:
+                out[key] = coords
+        return out
+
+    async def geocode(self, db: Session, address: str) -> Optional[GeoResult]:
+        return (await self.geocode_many(db, [address]))[0]
+
+
+# Database work runs in the threadpool; geocode_many() is called from the event loop
+
+def _cached(db: Session, keys: List[str]) -> List[GeocodeCache]:
+    return db.query(GeocodeCache).filter(GeocodeCache.key.in_(keys)).all()
+
+
+def _store(db: Session, answers: List[GeocodeCache]):
+    for row in answers:
+        db.merge(row)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # a concurrent request cached the same address first
+
+
+def _stops_without_coords(db: Session) -> List[models.Stop]:
+    return db.query(models.Stop).filter((models.Stop.lat.is_(None)) | (models.Stop.lng.is_(None))).all()
+
+
+geocoder = Geocoder()
+
+
+async def backfill_stops(db: Session, service: Optional[Geocoder] = None) -> int:
+    """Fill missing Stop.lat/lng from "city, country"; returns the number of stops updated."""
+    service = service or geocoder
+    stops = await run_in_threadpool(_stops_without_coords, db)
+    if not stops:
+        return 0
+    results = await service.geocode_many(db, [f"{s.city}, {s.country}" for s in stops])
+    updated = 0
+    for stop, result in zip(stops, results):
+        if result is not None:
+            stop.lat, stop.lng = result.lat, result.lng
+            updated += 1
+    await run_in_threadpool(db.commit)
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+    import migrations
+    from database import SessionLocal, engine
+
+    if len(sys.argv) < 2 or sys.argv[1] != "backfill-stops":
+        print(__doc__)
+        sys.exit(2)
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    print(f"Updated {asyncio.run(backfill_stops(db))} stops")
+    db.close()
@@ -0,0 +1,217 @@
+"""
+Seat holds: seats set aside while someone is still filling in a booking.
+
+The bot places a hold as soon as a ride is chosen. It extends the hold at
+every step of the conversation and resizes it once the seat count is
+known. The final POST /api/bookings passes `hold_id`, and the held seats
+become the booking in the same transaction. If the booking is rejected,
+the hold is left as it was.
+
+Held seats count against availability like booked ones. They are taken
+out of Ride.seats_free and counted in Ride.seats_held, so ride lists, live
+updates and the booking check see them without a join.
+
+A hold lasts HOLD_TTL_SECONDS (default 600) from its last extension.
+Expired holds are released in two ways:
+- The sweeper, one task per worker, sleeps until the earliest expires_at
+  (an indexed column) and releases what is due. Holds are placed and
+  extended for the same TTL, so none can come due earlier than that.
+- Before deciding anything about a ride, the ride's own expired holds are
+  released, so a late sweep never turns a booking away.
+
+A release deletes the row (DELETE ... RETURNING) and gives its seats back
+in the same transaction. Only the transaction that deleted the row gives
+them back, so concurrent sweepers and bookings never count a hold twice.
+
+Hold ids are random, so only the client that placed a hold can extend,
+book or release it.
+"""
+import asyncio
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, event, func, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+from models import SeatHold
+
+TTL = timedelta(seconds=float(os.getenv("HOLD_TTL_SECONDS", "600")))
+RETRY_SECONDS = 5.0         # sweeper pause after a database error
+
+
+def _count(db: Session, outcome: str, n: int = 1):
+    db.info.setdefault("seat_holds", Counter())[outcome] += n
+
+
+def _after_commit(session):
+    for outcome, n in session.info.pop("seat_holds", {}).items():
+        metrics.seat_holds.inc(n, outcome=outcome)
+
+
+def _after_rollback(session):
+    session.info.pop("seat_holds", None)
+
+
+def install(session_factory):
+    """Count hold outcomes of `session_factory` sessions once they commit."""
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+
+def lock_ride(db: Session, ride_id: int) -> Optional[models.Ride]:
+    """Load a ride for a change to its seats, inside a write transaction.
+
+    pysqlite opens the transaction only at the first write, and
+    with_for_update() does nothing on SQLite, so a ride read first may be
+    stale by the time its seat counts are written back, and concurrent
+    bookings overwrite each other. A no-op UPDATE takes the write lock
+    before the read.
+    """
+    db.execute(
+        update(models.Ride).where(models.Ride.id == ride_id).values(seats_free=models.Ride.seats_free)
+        .execution_options(synchronize_session=False)
+    )
+    return db.query(models.Ride).filter(models.Ride.id == ride_id).populate_existing().first()
+
+
+def _give_back(db: Session, rows) -> int:
+    """Return the seats of deleted holds, given as (ride_id, seats) rows, to their rides."""
+    seats = Counter()
+    for ride_id, n in rows:
+        seats[ride_id] += n
+    for ride_id, n in seats.items():
+        ride = db.get(models.Ride, ride_id)
+        if ride is not None:
+            ride.seats_free += n
+            ride.seats_held -= n
+    return len(rows)
+
+
+def release_expired(db: Session, ride_id: Optional[int] = None) -> int:
+    """Release expired holds (of one ride, or all); returns how many. The caller commits."""
+    query = delete(SeatHold).where(SeatHold.expires_at <= datetime.utcnow())
+    if ride_id is not None:
+        query = query.where(SeatHold.ride_id == ride_id)
+    rows = db.execute(
+        query.returning(SeatHold.ride_id, SeatHold.seats).execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        _count(db, "expired", len(rows))
+    return _give_back(db, rows)
+
+
+def place(db: Session, ride: models.Ride, seats: int, holder: Optional[str] = None) -> SeatHold:
+    """Hold `seats` on `ride` (from lock_ride). Raises ValueError when they are not free."""
+    if seats < 1:
+        raise ValueError("A hold needs at least one seat")
+    release_expired(db, ride.id)
+    if ride.seats_free < seats:
+        metrics.seat_holds.inc(outcome="rejected")
+        raise ValueError(f"Not enough seats. Available: {ride.seats_free}")
+    now = datetime.utcnow()
+    hold = SeatHold(
+        id=uuid.uuid4().hex, ride_id=ride.id, seats=seats, holder=holder,
+        created_at=now, expires_at=now + TTL,
+    )
+    db.add(hold)
+    ride.seats_free -= seats
+    ride.seats_held += seats
+    _count(db, "placed")
+    return hold
+
+
+def extend(db: Session, hold_id: str, seats: Optional[int] = None) -> Optional[SeatHold]:
+    """Restart a live hold's TTL and optionally resize it; None if it is gone.
+
+    Raises ValueError when the ride is cancelled or a larger hold does not fit.
+    """
+    if seats is not None and seats < 1:
+        raise ValueError("A hold needs at least one seat")
+    now = datetime.utcnow()
+    held = db.execute(
+        update(SeatHold)
+        .where(SeatHold.id == hold_id, SeatHold.expires_at > now)
+        .values(expires_at=now + TTL)
+        .returning(SeatHold.ride_id, SeatHold.seats)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if held is None:
+        return None
+    hold = db.get(SeatHold, hold_id, populate_existing=True)
+    if seats is not None and seats != held.seats:
+        ride = db.get(models.Ride, held.ride_id)
+        if ride.status == "cancelled":
+            raise ValueError("Ride is cancelled")
+        release_expired(db, ride.id)
+        if seats - held.seats > ride.seats_free:
+            metrics.seat_holds.inc(outcome="rejected")
+            raise ValueError(f"Not enough seats. Available: {ride.seats_free + held.seats}")
+        ride.seats_free -= seats - held.seats
+        ride.seats_held += seats - held.seats
+        hold.seats = seats
+    return hold
+
+
+def take(db: Session, hold_id: str, ride: models.Ride) -> int:
+    """Release a live hold on `ride` (from lock_ride) for a booking made in the same transaction.
+
+    Returns the hold's seats, or 0 if it is gone.
+    """
+    rows = db.execute(
+        delete(SeatHold)
+        .where(SeatHold.id == hold_id, SeatHold.ride_id == ride.id, SeatHold.expires_at > datetime.utcnow())
+        .returning(SeatHold.ride_id, SeatHold.seats)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        _count(db, "converted")
+    _give_back(db, rows)
+    return sum(n for _, n in rows)
+
+
+def release(db: Session, hold_id: str) -> bool:
+    """Give a hold's seats back now; False if it was already gone."""
+    rows = db.execute(
+        delete(SeatHold)
+        .where(SeatHold.id == hold_id)
+        .returning(SeatHold.ride_id, SeatHold.seats)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if rows:
+        _count(db, "released")
+    return _give_back(db, rows) > 0
+
+
+# ── Sweeper ───────────────────────────────────────────────────────────────────
+
+def sweep(db: Session) -> float:
+    """Release due holds; returns seconds until the next one is due."""
+    due = db.query(func.min(SeatHold.expires_at)).scalar()
+    if due is not None and due <= datetime.utcnow():
+        release_expired(db)
+        db.commit()
+        due = db.query(func.min(SeatHold.expires_at)).scalar()
+    now = datetime.utcnow()
+    # Capped at TTL in case another worker runs with a shorter HOLD_TTL_SECONDS
+    return max(0.0, (min(due or now + TTL, now + TTL) - now).total_seconds()) + 0.01
+
+
+def sweep_with(session_factory) -> float:
+    with session_factory() as db:
+        return sweep(db)
+
+
+async def sweep_periodically(session_factory):
+    """Background task: release holds as they expire."""
+    while True:
+        try:
+            delay = await asyncio.to_thread(sweep_with, session_factory)
+        except SQLAlchemyError:
+            delay = RETRY_SECONDS   # e.g. database locked
+        await asyncio.sleep(delay)
@@ -0,0 +1,275 @@
+"""
+Idempotency-Key support for the writes that clients retry.
+
+A request to one of RULES that carries an Idempotency-Key header runs
+at most once per key:
+
+- The first request inserts a "pending" row for the key.
+- The handler's own transaction flips the row to "committed" (a session
+  hook), so the write and the claim commit together.
+- Once the response has been sent, it is stored on the row. Later
+  requests with the key get that response back, with
+  `Idempotent-Replayed: true`.
+
+Concurrent duplicates are coalesced, in this worker or another: they
+wait for the first request (up to WAIT_SECONDS, otherwise 409) and then
+get its response. Only one transaction runs.
+
+If the first request committed nothing (validation error, no seats, a
+crash), the key is released and a retry runs normally. A pending key
+whose request died is taken over after STALE_SECONDS. If the original
+request is only slow and tries to commit after that, the commit fails
+instead of writing twice. The same key with a different method, path
+or body is rejected with 422.
+
+Keys expire after IDEMPOTENCY_TTL_HOURS (default 24).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, event, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+from models import IdempotencyKey
+
+TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+WAIT_SECONDS = 15.0         # longer than the bot's 10 s request timeout
+STALE_SECONDS = 60.0
+POLL_SECONDS = 0.05         # duplicates waiting on another worker
+PURGE_SECONDS = 600.0
+MAX_KEY_LENGTH = 255
+HEADER = b"idempotency-key"
+
+RULES = [
+    ("POST", re.compile(r"^/api/bookings$")),
+    ("POST", re.compile(r"^/api/parcels$")),
+    ("POST", re.compile(r"^/api/holds$")),
+    ("PATCH", re.compile(r"^/api/bookings/\d+$")),
+]
+
+_session_factory = None
+_current: ContextVar[Optional[Tuple[str, str]]] = ContextVar("idempotency_key", default=None)   # (key, owner)
+_inflight: Dict[str, asyncio.Event] = {}    # keys being executed by this process
+
+
+class KeyLost(RuntimeError):
+    """Another request took the key over; committing now could write twice."""
+
+
+# ── Session hook ──────────────────────────────────────────────────────────────
+
+def _before_commit(session):
+    current = _current.get()
+    if current is None:
+        return
+    key, owner = current
+    claimed = session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key, IdempotencyKey.owner == owner, IdempotencyKey.status != "done")
+        .values(status="committed")
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        raise KeyLost(f"Idempotency-Key {key!r} was taken over by another request")
+
+
+def install(session_factory):
+    """Mark keys committed in the transaction of `session_factory` sessions."""
+    global _session_factory
+    _session_factory = session_factory
+    event.listen(session_factory, "before_commit", _before_commit)
+
+
+# ── Storage ───────────────────────────────────────────────────────────────────
+
+def _acquire(key: str, fingerprint: str, owner: str) -> Optional[dict]:
+    """Claim the key for `owner` (returns None), or return the row that holds it."""
+    with _session_factory() as db:
+        while True:
+            now = datetime.utcnow()
+            db.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.expires_at < now))
+            db.add(IdempotencyKey(
+                key=key, fingerprint=fingerprint, status="pending", owner=owner,
+                locked_at=now, expires_at=now + TTL,
+            ))
+            try:
+                db.commit()
+                return None
+            except IntegrityError:
+                db.rollback()
+            row = db.get(IdempotencyKey, key)
+            if row is None:
+                continue        # released meanwhile
+            if row.status == "pending" and row.locked_at < now - timedelta(seconds=STALE_SECONDS):
+                taken = db.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.key == key, IdempotencyKey.owner == row.owner,
+                           IdempotencyKey.status == "pending")
+                    .values(owner=owner, fingerprint=fingerprint, locked_at=now)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.commit()
+                if taken:
+                    return None
+                continue
+            return {
+                "fingerprint": row.fingerprint, "status": row.status, "status_code": row.status_code,
+                "headers": row.headers, "body": row.body,
+            }
+
+
+def _finish(key: str, owner: str, status_code: int, headers: list, body: bytes):
+    """Store the response if the handler committed; otherwise release the key."""
+    with _session_factory() as db:
+        stored = db.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key, IdempotencyKey.owner == owner, IdempotencyKey.status == "committed")
+            .values(
+                status="done", status_code=status_code, body=body,
+                headers=json.dumps([[k.decode("latin-1"), v.decode("latin-1")] for k, v in headers]),
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not stored:
+            db.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.key == key, IdempotencyKey.owner == owner, IdempotencyKey.status == "pending",
+            ))
+        db.commit()
+
+
+def purge() -> int:
+    with _session_factory() as db:
+        n = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow())).rowcount
+        db.commit()
+        return n
+
+
+# ── Middleware ────────────────────────────────────────────────────────────────
+
+def _fingerprint(scope, body: bytes) -> str:
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        pass
+    digest = hashlib.sha256(f"{scope['method']} {scope['path']}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def _respond(send, status_code: int, headers: list, body: bytes):
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _error(send, status_code: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await _respond(send, status_code, [
+        (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+    ], body)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._next_purge = 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            method == scope["method"] and pattern.match(scope["path"]) for method, pattern in RULES
+        ):
+            await self.app(scope, receive, send)
+            return
+        raw = next((v for k, v in scope["headers"] if k == HEADER), None)
+        if raw is None:
+            await self.app(scope, receive, send)
+            return
+        key = raw.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await _error(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+            return
+
+        if time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + PURGE_SECONDS
+            await run_in_threadpool(purge)
+
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = _fingerprint(scope, body)
+        owner = uuid.uuid4().hex
+
+        waited = False
+        deadline = time.monotonic() + WAIT_SECONDS
+        while True:
+            row = await run_in_threadpool(_acquire, key, fingerprint, owner)
+            if row is None:
+                break
+            if row["fingerprint"] != fingerprint:
+                metrics.idempotent_requests.inc(outcome="mismatch")
+                await _error(send, 422, "Idempotency-Key was already used for a different request")
+                return
+            if row["status"] == "done":
+                metrics.idempotent_requests.inc(outcome="coalesced" if waited else "replayed")
+                headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(row["headers"])]
+                await _respond(send, row["status_code"], headers + [(b"idempotent-replayed", b"true")], row["body"])
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics.idempotent_requests.inc(outcome="conflict")
+                await _error(send, 409, "A request with this Idempotency-Key is still in progress")
+                return
+            waited = True
+            local = _inflight.get(key)
+            try:
+                if local is not None:
+                    await asyncio.wait_for(local.wait(), remaining)
+                else:
+                    await asyncio.sleep(min(POLL_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+        done = _inflight[key] = asyncio.Event()
+        sent = False
+
+        async def replay_body():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        status_code, headers, out = 500, [], []
+
+        async def capture(message):
+            nonlocal status_code, headers
+            if message["type"] == "http.response.start":
+                status_code, headers = message["status"], list(message.get("headers", ()))
+            elif message["type"] == "http.response.body":
+                out.append(message.get("body", b""))
+            await send(message)
+
+        token = _current.set((key, owner))
+        try:
+            await self.app(scope, replay_body, capture)
+        finally:
+            _current.reset(token)
+            try:
+                await run_in_threadpool(_finish, key, owner, status_code, headers, b"".join(out))
+            finally:
+                _inflight.pop(key, None)
+                done.set()
+        metrics.idempotent_requests.inc(outcome="executed")
@@ -0,0 +1,401 @@
+"""
+Durable background jobs, queued in the jobs table.
+
+enqueue() adds a row to the caller's session. The job is therefore
+committed with the data that asked for it, or not at all, and the
+endpoint can return at once. Workers claim ready jobs with a single
+UPDATE ... RETURNING, highest priority first and then by run_at. That
+statement holds SQLite's write lock, so no two workers can claim the same
+job. An idle worker checks for ready jobs with a plain read and does not
+take the lock.
+
+A claim is a lease that lasts LEASE_SECONDS. If a worker dies, its jobs
+are queued again once the lease runs out. Delivery is at least once, so
+handlers must be safe to run twice. A failed attempt is retried after
+BACKOFF_BASE * 2**(attempt - 1) seconds, capped at BACKOFF_MAX and with
+jitter. After max_attempts the job is "dead" and stays dead until
+POST /api/jobs/{id}/retry.
+
+A worker survives database errors (e.g. "database is locked"): it logs
+them and tries again after RETRY_SECONDS. A job whose outcome cannot be
+recorded keeps its lease and is run again once the lease runs out.
+
+Each API worker runs one job worker in its lifespan (JOB_WORKER=1, the
+default). A commit that enqueued a job wakes that worker at once. Other
+processes pick the job up within JOB_POLL_SECONDS. Dedicated worker
+processes can be added:
+
+    python jobs.py work [--concurrency 4] [--drain]
+    python jobs.py status
+    python jobs.py retry-dead [kind]
+
+Handlers are registered with @handler("kind") and are called with
+(db, payload). Sync handlers run in a thread and async ones on the loop.
+A handler's return value is stored as the job result (JSON).
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import aggregates
+import forecast
+import geocoding
+import metrics
+from models import Job
+
+IN_APP = os.getenv("JOB_WORKER", "1") != "0"
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "0.2"))
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+KEEP_DONE = timedelta(days=7)
+MAINTAIN_SECONDS = 30.0     # how often a worker re-queues expired leases and purges old jobs
+MAX_ERROR_CHARS = 4000
+RETRY_SECONDS = 5.0         # worker pause after a database error
+SETTLE_ATTEMPTS = 3         # tries at recording an outcome before leaving the job to its lease
+
+log = logging.getLogger(__name__)
+
+_handlers: Dict[str, Callable] = {}
+_workers: Set["Worker"] = set()     # running in this process, woken by local enqueues
+
+
+def handler(kind: str):
+    """Register the function that runs jobs of `kind`."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+    return register
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+# ── Queue ─────────────────────────────────────────────────────────────────────
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: Optional[dict] = None,
+    priority: int = 0,
+    run_at: Optional[datetime] = None,
+    delay: float = 0.0,
+    max_attempts: int = 5,
+    dedupe: bool = False,
+) -> Job:
+    """Add a job to `db`'s transaction; workers see it once the caller commits.
+
+    With dedupe=True an identical job (kind and payload) that is still
+    queued is returned instead of adding another.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    data = _dumps(payload or {})
+    if dedupe:
+        existing = (
+            db.query(Job)
+            .filter(Job.status == "queued", Job.kind == kind, Job.payload == data)
+            .first()
+        )
+        if existing is not None:
+            return existing
+    job = Job(
+        kind=kind, payload=data, status="queued", priority=priority, attempts=0, max_attempts=max_attempts,
+        run_at=run_at or datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    db.flush()
+    db.info["jobs_enqueued"] = True
+    return job
+
+
+def backoff(attempt: int) -> float:
+    """Seconds before retrying after failed attempt number `attempt` (1-based)."""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+
+
+def claim(db: Session, worker: str, limit: int) -> list:
+    """Lease up to `limit` ready jobs to `worker`; returns rows of (id, kind, payload, attempts, max_attempts, run_at)."""
+    now = datetime.utcnow()
+    ready = (
+        select(Job.id)
+        .where(Job.status == "queued", Job.run_at <= now)
+        .order_by(Job.priority.desc(), Job.run_at, Job.id)
+    )
+    if db.execute(ready.limit(1)).first() is None:
+        return []
+    rows = db.execute(
+        update(Job)
+        .where(Job.id.in_(ready.limit(limit).scalar_subquery()))
+        .values(
+            status="running", attempts=Job.attempts + 1, started_at=now,
+            locked_by=worker, locked_until=now + timedelta(seconds=LEASE_SECONDS),
+        )
+        .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts, Job.run_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return rows
+
+
+def complete(db: Session, job_id: int, worker: str, result: Any = None) -> bool:
+    """Mark a leased job done; False if the lease was lost (the job expired and was re-queued)."""
+    done = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.locked_by == worker)
+        .values(
+            status="done", result=None if result is None else _dumps(result),
+            finished_at=datetime.utcnow(), locked_by=None, locked_until=None,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(done)
+
+
+def fail(db: Session, job_id: int, worker: str, attempts: int, max_attempts: int, error: str) -> str:
+    """Schedule a retry, or dead-letter the job after its last attempt; returns the outcome."""
+    now = datetime.utcnow()
+    if attempts >= max_attempts:
+        outcome, values = "dead", {"status": "dead", "finished_at": now}
+    else:
+        outcome, values = "retry", {"status": "queued", "run_at": now + timedelta(seconds=backoff(attempts))}
+    db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.locked_by == worker)
+        .values(last_error=error[-MAX_ERROR_CHARS:], locked_by=None, locked_until=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return outcome
+
+
+def retry(db: Session, job: Job):
+    """Put a dead job back in the queue with a fresh set of attempts."""
+    job.status, job.attempts, job.run_at, job.finished_at = "queued", 0, datetime.utcnow(), None
+    db.info["jobs_enqueued"] = True
+
+
+def maintain(db: Session) -> Dict[str, int]:
+    """Re-queue jobs whose lease ran out (dead-lettering exhausted ones) and purge old finished jobs."""
+    now = datetime.utcnow()
+    expired = (Job.status == "running", Job.locked_until < now)
+    lost = "Lease expired: the worker stopped or the job ran longer than JOB_LEASE_SECONDS"
+    out = {
+        "dead": db.execute(
+            update(Job).where(*expired, Job.attempts >= Job.max_attempts)
+            .values(status="dead", finished_at=now, locked_by=None, locked_until=None, last_error=lost)
+            .execution_options(synchronize_session=False)
+        ).rowcount,
+        "requeued": db.execute(
+            update(Job).where(*expired)
+            .values(status="queued", run_at=now, locked_by=None, locked_until=None, last_error=lost)
+            .execution_options(synchronize_session=False)
+        ).rowcount,
+        "purged": db.execute(
+            delete(Job).where(Job.status == "done", Job.finished_at < now - KEEP_DONE)
+            .execution_options(synchronize_session=False)
+        ).rowcount,
+    }
+    db.commit()
+    return out
+
+
+def counts(db: Session) -> Dict[str, Dict[str, int]]:
+    """{kind: {status: n}}"""
+    out: Dict[str, Dict[str, int]] = {}
+    for kind, status, n in db.query(Job.kind, Job.status, func.count()).group_by(Job.kind, Job.status):
+        out.setdefault(kind, {})[status] = n
+    return out
+
+
+def _after_commit(session):
+    if session.info.pop("jobs_enqueued", False):
+        for worker in list(_workers):
+            worker.wake()
+
+
+def _after_rollback(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+def install(session_factory):
+    """Wake this process's workers when a `session_factory` session commits new jobs."""
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+
+# ── Worker ────────────────────────────────────────────────────────────────────
+
+class Worker:
+    """Claims jobs and runs up to `concurrency` of them at a time on the current event loop."""
+
+    def __init__(self, session_factory, concurrency: int = 1, name: Optional[str] = None):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self.processed = 0
+        self._running: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def wake(self):
+        """Thread-safe: look for jobs now instead of at the next poll."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _with_db(self, fn, *args):
+        with self.session_factory() as db:
+            return fn(db, *args)
+
+    async def run(self, drain: bool = False):
+        """Work until cancelled (then let running jobs finish); with drain=True, until the queue is empty."""
+        self._loop, self._wakeup = asyncio.get_running_loop(), asyncio.Event()
+        _workers.add(self)
+        next_maintenance = 0.0
+        try:
+            while True:
+                self._wakeup.clear()
+                free = self.concurrency - len(self._running)
+                try:
+                    if time.monotonic() >= next_maintenance:
+                        await asyncio.to_thread(self._with_db, maintain)
+                        next_maintenance = time.monotonic() + MAINTAIN_SECONDS
+                    claimed = await asyncio.to_thread(self._with_db, claim, self.name, free) if free else []
+                except SQLAlchemyError:     # e.g. database locked
+                    log.warning("Job queue unavailable; retrying in %.0fs", RETRY_SECONDS, exc_info=True)
+                    await asyncio.sleep(RETRY_SECONDS)
+                    continue
+                for job in claimed:
+                    task = asyncio.create_task(self._execute(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._finished)
+                if free and len(claimed) == free:
+                    continue        # probably more ready
+                if drain and not claimed and not self._running:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            _workers.discard(self)
+            if self._running:
+                await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        self._wakeup.set()
+
+    async def _settle(self, fn, *args):
+        """Record a job's outcome with complete() or fail(); None if the database stays unavailable.
+
+        An unrecorded job keeps its lease, and maintain() queues it again
+        once the lease runs out.
+        """
+        for attempt in range(1, SETTLE_ATTEMPTS + 1):
+            try:
+                return await asyncio.to_thread(self._with_db, fn, *args)
+            except SQLAlchemyError:
+                log.warning("Could not record job %s (attempt %d/%d)", args[0], attempt, SETTLE_ATTEMPTS,
+                            exc_info=True)
+                if attempt < SETTLE_ATTEMPTS:
+                    await asyncio.sleep(RETRY_SECONDS)
+        return None
+
+    def _call(self, fn, payload):
+        with self.session_factory() as db:
+            return fn(db, payload)
+
+    async def _execute(self, job):
+        metrics.job_wait.observe(max(0.0, (datetime.utcnow() - job.run_at).total_seconds()), kind=job.kind)
+        fn = _handlers.get(job.kind)
+        try:
+            if fn is None:
+                raise LookupError(f"No handler for job kind {job.kind!r} in this worker")
+            payload = json.loads(job.payload)
+            if asyncio.iscoroutinefunction(fn):
+                with self.session_factory() as db:
+                    result = await fn(db, payload)
+            else:
+                result = await asyncio.to_thread(self._call, fn, payload)
+        except Exception:
+            outcome = await self._settle(
+                fail, job.id, self.name, job.attempts, job.max_attempts, traceback.format_exc(),
+            ) or "unrecorded"
+        else:
+            recorded = await self._settle(complete, job.id, self.name, result)
+            outcome = "done" if recorded is not None else "unrecorded"
+        self.processed += 1
+        metrics.jobs_finished.inc(kind=job.kind, outcome=outcome)
+
+
+# ── Handlers ──────────────────────────────────────────────────────────────────
+
+@handler("aggregates.rebuild")
+def _rebuild_aggregates(db: Session, payload: dict):
+    aggregates.rebuild(db)
+
+
+@handler("forecast.update")
+def _update_forecast(db: Session, payload: dict):
+    return {"rides": forecast.update(db)}
+
+
+@handler("forecast.refit")
+def _refit_forecast(db: Session, payload: dict):
+    return {"rides": forecast.update(db, full=True)}
+
+
+@handler("geocode.backfill_stops")
+async def _backfill_stops(db: Session, payload: dict):
+    return {"updated": await geocoding.backfill_stops(db)}
+
+
+if __name__ == "__main__":
+    import argparse
+    import migrations
+    from database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=("work", "status", "retry-dead"))
+    parser.add_argument("kind", nargs="?", help="retry-dead: only jobs of this kind")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--drain", action="store_true", help="work: exit once no job is ready")
+    args = parser.parse_args()
+
+    migrations.upgrade(engine)
+    if args.command == "work":
+        metrics.start()
+        worker = Worker(SessionLocal, concurrency=args.concurrency)
+        try:
+            asyncio.run(worker.run(drain=args.drain))
+        except KeyboardInterrupt:
+            pass
+        print(f"Processed {worker.processed} jobs")
+    elif args.command == "status":
+        with SessionLocal() as db:
+            for kind, by_status in sorted(counts(db).items()):
+                print(f"{kind:28} " + "  ".join(f"{s}={n}" for s, n in sorted(by_status.items())))
+    else:
+        with SessionLocal() as db:
+            dead = db.query(Job).filter(Job.status == "dead")
+            if args.kind:
+                dead = dead.filter(Job.kind == args.kind)
+            jobs = dead.all()
+            for job in jobs:
+                retry(db, job)
+            db.commit()
+        print(f"Re-queued {len(jobs)} jobs")
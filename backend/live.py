@@ -0,0 +1,151 @@
+"""
+In-process pub/sub for live ride availability.
+
+Ride writes are picked up in the session's after_flush hook and
+published once the transaction commits, as compact deltas
+{"id", "seats_free", "seats_held", "seats_total", "status"}. A removed ride is sent
+with status "deleted". Rolled-back changes are never sent.
+
+Each subscriber has a buffer keyed by ride id, so a slow client only
+ever holds the latest state of each ride and publishing never waits on
+anyone. A subscriber that falls more than MAX_PENDING rides behind gets
+a single "resync" (re-fetch the rides) instead of a longer backlog.
+
+Deltas only cover commits made by this process. When several workers
+serve the app, rides changed by another worker reach subscribers as a
+"resync", triggered by cache.versions.
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+import models
+
+MAX_PENDING = 500
+COALESCE_SECONDS = 0.05     # gather bursts (e.g. a bulk import) into one message
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+    def __init__(self):
+        self.pending: Dict[int, dict] = {}
+        self.overflow = False
+        self._ready = asyncio.Event()
+
+    def push(self, deltas: List[dict]):
+        if self.overflow:
+            return
+        for d in deltas:
+            self.pending[d["id"]] = d
+        if len(self.pending) > MAX_PENDING:
+            self.pending.clear()
+            self.overflow = True
+        self._ready.set()
+
+    def resync(self):
+        self.pending.clear()
+        self.overflow = True
+        self._ready.set()
+
+    async def next(self, timeout: float = HEARTBEAT_SECONDS) -> Optional[dict]:
+        """The next coalesced message, or None when nothing happened within `timeout`."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        await asyncio.sleep(COALESCE_SECONDS)
+        self._ready.clear()
+        if self.overflow:
+            self.overflow = False
+            return {"type": "resync"}
+        rides, self.pending = list(self.pending.values()), {}
+        return {"type": "rides", "rides": rides}
+
+
+class Hub:
+    def __init__(self):
+        self._subscribers = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription()
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        self._subscribers.discard(sub)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, deltas: List[dict]):
+        """Fan deltas out to every subscriber; safe to call from worker threads."""
+        self._on_loop(self._fanout, deltas)
+
+    def resync(self):
+        """Tell every subscriber to re-fetch: rides changed in another worker process."""
+        self._on_loop(self._resync_all)
+
+    def _on_loop(self, fn, *args):
+        loop = self._loop
+        if loop is None or not self._subscribers or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            fn(*args)
+        else:
+            loop.call_soon_threadsafe(fn, *args)
+
+    def _fanout(self, deltas: List[dict]):
+        for sub in list(self._subscribers):
+            sub.push(deltas)
+
+    def _resync_all(self):
+        for sub in list(self._subscribers):
+            sub.resync()
+
+
+hub = Hub()
+
+
+# ── Session hooks ─────────────────────────────────────────────────────────────
+
+def _ride_delta(ride: models.Ride, deleted: bool = False) -> dict:
+    if deleted:
+        return {"id": ride.id, "status": "deleted"}
+    return {
+        "id": ride.id, "seats_free": ride.seats_free, "seats_held": ride.seats_held,
+        "seats_total": ride.seats_total, "status": ride.status,
+    }
+
+
+def _after_flush(session, flush_context):
+    changes = session.info.setdefault("live_rides", {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, models.Ride):
+            changes[obj.id] = _ride_delta(obj)
+    for obj in session.deleted:
+        if isinstance(obj, models.Ride):
+            changes[obj.id] = _ride_delta(obj, deleted=True)
+
+
+def _after_commit(session):
+    changes = session.info.pop("live_rides", None)
+    if changes:
+        hub.publish(list(changes.values()))
+
+
+def _after_rollback(session):
+    session.info.pop("live_rides", None)
+
+
+def install(session_factory):
+    """Publish ride changes committed through sessions made by `session_factory`."""
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
@@ -1,41 +1,82 @@
+import asyncio
+import json
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-from database import engine, get_db
-import models
+from database import engine, get_db, SessionLocal
 import schemas
-from auth import authenticate_user, create_access_token
-from routers import routes, rides, bookings, parcels, users, driver, vehicles
+import migrations
+import cache
+import holds
+import idempotency
+import jobs
+import live
+import search
+import tracking
+import profiling
+import metrics
+from auth import BOT_API_KEY, authenticate_user, create_access_token, user_from_token
+from routers import routes, rides, bookings, parcels, users, driver, vehicles, profitability, stats, geocode, spatial, debug
+from routers import holds as holds_router, jobs as jobs_router, search as search_router
+from compression import CompressionMiddleware
 
-# Create all tables on startup
-models.Base.metadata.create_all(bind=engine)
+# ── Process setup ─────────────────────────────────────────────────────────────
+# Importing this module is preload-safe: it only migrates and registers
+# event hooks. Threads, tasks and connections start per worker in lifespan.
+#
+#   uvicorn main:app --workers 4
+#   gunicorn main:app --preload -w 4 -k uvicorn.workers.UvicornWorker
+#   uvicorn main:create_app --factory
 
-app = FastAPI(title="CraftTrans API", version="1.0.0")
+# One PRAGMA read when the schema is current; applies pending migrations otherwise
+migrations.ensure(engine)
+engine.dispose()    # forked workers must not inherit pooled connections
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://localhost:3000"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+search.install(engine)
+live.install(SessionLocal)
+cache.install(engine, SessionLocal)
+cache.versions.on_change_elsewhere("rides", live.hub.resync)
+jobs.install(SessionLocal)
+holds.install(SessionLocal)
+idempotency.install(SessionLocal)
+profiling.install(engine)
+metrics.install(engine, SessionLocal, {
+    "live_subscribers": ("Open SSE/WebSocket live-availability subscriptions.", lambda: len(live.hub)),
+})
 
-app.include_router(routes.router)
-app.include_router(rides.router)
-app.include_router(bookings.router)
-app.include_router(parcels.router)
-app.include_router(users.router)
-app.include_router(driver.router)
-app.include_router(vehicles.router)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each worker, after any fork
+    metrics.start()
+    cache.versions.refresh()
+    tasks = [
+        asyncio.create_task(tracking.flush_periodically(SessionLocal)),
+        asyncio.create_task(cache.watch()),
+        asyncio.create_task(holds.sweep_periodically(SessionLocal)),
+    ]
+    if jobs.IN_APP:
+        tasks.append(asyncio.create_task(jobs.Worker(SessionLocal).run()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)   # jobs already running finish first
+    tracking.flush_with(SessionLocal)
 
-@app.post("/auth/token", response_model=schemas.Token)
+
+core = APIRouter(route_class=profiling.ProfiledRoute)
+
+
+@core.post("/auth/token", response_model=schemas.Token)
 def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
@@ -50,6 +91,101 @@ def login(
     return {"access_token": token, "token_type": "bearer", "role": user.role}
 
 
-@app.get("/health")
+# ── Live seat availability ────────────────────────────────────────────────────
+
+def _live_allowed(token: str, bot_key: str) -> bool:
+    """EventSource can't send headers, so the JWT may come as ?token=; the bot uses its key.
+
+    Blocking (it reads the user): the async handlers call it in the threadpool.
+    """
+    if bot_key and bot_key == BOT_API_KEY:
+        return True
+    with SessionLocal() as db:
+        return user_from_token(db, token) is not None
+
+
+@core.get("/api/live/rides")
+async def live_rides_sse(request: Request, token: str = "", key: str = ""):
+    """Server-sent events: `rides` (list of ride deltas) and `resync` (re-fetch everything)."""
+    if not await run_in_threadpool(_live_allowed, token, request.headers.get("X-Bot-Key") or key):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    sub = live.hub.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = await sub.next()
+                if message is None:
+                    yield ": ping\n\n"
+                elif message["type"] == "resync":
+                    yield "event: resync\ndata: {}\n\n"
+                else:
+                    yield f"event: rides\ndata: {json.dumps(message['rides'], separators=(',', ':'))}\n\n"
+        finally:
+            live.hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@core.websocket("/api/live/ws")
+async def live_rides_ws(websocket: WebSocket, token: str = "", key: str = ""):
+    """Same messages as the SSE stream, as JSON objects with a `type` field."""
+    if not await run_in_threadpool(_live_allowed, token, websocket.headers.get("X-Bot-Key") or key):
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    sub = live.hub.subscribe()
+    try:
+        while True:
+            message = await sub.next()
+            await websocket.send_json(message or {"type": "ping"})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        live.hub.unsubscribe(sub)
+
+
+@core.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@core.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    if metrics.METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# ── App ───────────────────────────────────────────────────────────────────────
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="CraftTrans API", version="1.0.0", lifespan=lifespan)
+
+    # Innermost first: stored responses are uncompressed and without CORS headers
+    app.add_middleware(cache.ResponseCacheMiddleware)
+    app.add_middleware(idempotency.IdempotencyMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:5173", "http://localhost:3000"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(profiling.ProfilingMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    for module in (routes, rides, bookings, parcels, users, driver, vehicles,
+                   profitability, stats, geocode, spatial, debug, holds_router, jobs_router, search_router):
+        app.include_router(module.router)
+    app.include_router(core)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,189 @@
+"""
+Maintenance-due index.
+
+maintenance_due keeps, per vehicle and work type, the latest service record
+and the mileage at which the work is due again. It is refreshed for the
+affected (vehicle, work type) on every add/delete of a maintenance record,
+so "what's due soon" never has to read full histories.
+
+Mileage is projected forward from the routes of upcoming rides assigned to
+the vehicle (Ride.vehicle is matched by vehicle name or plate).
+"""
+from datetime import date, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+import models
+from models import MaintenanceDue, MaintenanceRecord
+from profitability import route_distances
+
+
+def refresh(db: Session, vehicle_id: int, work_type: str):
+    """Recompute the summary row for one (vehicle, work type)."""
+    latest = (
+        db.query(MaintenanceRecord)
+        .filter_by(vehicle_id=vehicle_id, work_type=work_type)
+        .order_by(MaintenanceRecord.mileage.desc(), MaintenanceRecord.date.desc(), MaintenanceRecord.id.desc())
+        .first()
+    )
+    row = db.get(MaintenanceDue, (vehicle_id, work_type))
+    if latest is None:
+        if row is not None:
+            db.delete(row)
+        return
+    if row is None:
+        row = MaintenanceDue(vehicle_id=vehicle_id, work_type=work_type)
+        db.add(row)
+    row.record_id = latest.id
+    row.last_date = latest.date
+    row.last_mileage = latest.mileage
+    row.next_service_km = latest.next_service_km
+
+
+def rebuild(db: Session):
+    """Recompute the whole index with one grouped INSERT ... SELECT."""
+    r = MaintenanceRecord.__table__
+    ranked = select(
+        r.c.id, r.c.vehicle_id, r.c.work_type, r.c.date, r.c.mileage, r.c.next_service_km,
+        func.row_number().over(
+            partition_by=(r.c.vehicle_id, r.c.work_type),
+            order_by=(r.c.mileage.desc(), r.c.date.desc(), r.c.id.desc()),
+        ).label("rn"),
+    ).subquery()
+    latest = select(
+        ranked.c.vehicle_id, ranked.c.work_type, ranked.c.id,
+        ranked.c.date, ranked.c.mileage, ranked.c.next_service_km,
+    ).where(ranked.c.rn == 1)
+    db.execute(delete(MaintenanceDue.__table__))
+    db.execute(insert(MaintenanceDue.__table__).from_select(
+        ["vehicle_id", "work_type", "record_id", "last_date", "last_mileage", "next_service_km"], latest,
+    ))
+    db.commit()
+
+
+def summaries(db: Session, vehicle_ids: Optional[Iterable[int]] = None) -> dict:
+    """Per-vehicle record count, total cost and last service per work type.
+
+    One grouped query over the records plus one read of the due index,
+    however long the histories are.
+    """
+    totals = db.query(
+        MaintenanceRecord.vehicle_id,
+        func.count(MaintenanceRecord.id),
+        func.coalesce(func.sum(MaintenanceRecord.cost), 0.0),
+    ).group_by(MaintenanceRecord.vehicle_id)
+    latest = db.query(MaintenanceDue).order_by(MaintenanceDue.vehicle_id, MaintenanceDue.work_type)
+    if vehicle_ids is not None:
+        vehicle_ids = list(vehicle_ids)
+        totals = totals.filter(MaintenanceRecord.vehicle_id.in_(vehicle_ids))
+        latest = latest.filter(MaintenanceDue.vehicle_id.in_(vehicle_ids))
+
+    out = {}
+    for vid, count, cost in totals:
+        out[vid] = {"record_count": count, "total_cost": round(float(cost), 2), "last_service": []}
+    for row in latest:
+        out.setdefault(row.vehicle_id, {"record_count": 0, "total_cost": 0.0, "last_service": []})
+        out[row.vehicle_id]["last_service"].append(row)
+    return out
+
+
+def history_page(
+    db: Session, vehicle_id: int, limit: int, cursor: Optional[Tuple[int, int]] = None,
+) -> Tuple[List[MaintenanceRecord], Optional[Tuple[int, int]]]:
+    """Keyset page of records ordered by (mileage, id) descending."""
+    q = db.query(MaintenanceRecord).filter(MaintenanceRecord.vehicle_id == vehicle_id)
+    if cursor is not None:
+        mileage, record_id = cursor
+        q = q.filter(or_(
+            MaintenanceRecord.mileage < mileage,
+            and_(MaintenanceRecord.mileage == mileage, MaintenanceRecord.id < record_id),
+        ))
+    rows = q.order_by(MaintenanceRecord.mileage.desc(), MaintenanceRecord.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1].mileage, rows[-1].id)
+
+
+def _projected_km(db: Session, vehicles: dict, today: date, until: date) -> dict:
+    """{vehicle_id: [(ride date, cumulative km), ...]} for rides in [today, until]."""
+    by_key = {}
+    for vid, (name, plate) in vehicles.items():
+        for key in (name, plate):
+            if key:
+                by_key[key.strip().lower()] = vid
+    rides = (
+        db.query(models.Ride.date, models.Ride.route_id, models.Ride.vehicle)
+        .filter(
+            models.Ride.date >= today, models.Ride.date <= until,
+            models.Ride.status != "cancelled", models.Ride.vehicle.isnot(None),
+        )
+        .order_by(models.Ride.date)
+        .all()
+    )
+    if not rides:
+        return {}
+    distances = route_distances(db)
+    out = {}
+    for ride_date, route_id, vehicle in rides:
+        vid = by_key.get(vehicle.strip().lower())
+        if vid is None or route_id not in distances:
+            continue
+        steps = out.setdefault(vid, [])
+        total = (steps[-1][1] if steps else 0.0) + distances[route_id]
+        steps.append((ride_date, total))
+    return out
+
+
+def due(
+    db: Session,
+    within_km: int = 1000,
+    within_days: int = 14,
+    today: Optional[date] = None,
+) -> List[dict]:
+    """Ranked list of work due within `within_km` now or by `within_days` of projected driving."""
+    today = today or date.today()
+    until = today + timedelta(days=within_days)
+    rows = (
+        db.query(
+            MaintenanceDue, models.Vehicle.name, models.Vehicle.plate, models.Vehicle.mileage_current,
+        )
+        .join(models.Vehicle, models.Vehicle.id == MaintenanceDue.vehicle_id)
+        .filter(MaintenanceDue.next_service_km.isnot(None))
+        .all()
+    )
+    if not rows:
+        return []
+    vehicles = {d.vehicle_id: (name, plate) for d, name, plate, _ in rows}
+    projection = _projected_km(db, vehicles, today, until)
+
+    items = []
+    for d, name, plate, mileage in rows:
+        remaining = d.next_service_km - mileage
+        steps = projection.get(d.vehicle_id, [])
+        driven = steps[-1][1] if steps else 0.0
+        due_date = today if remaining <= 0 else next(
+            (day for day, km in steps if km >= remaining), None,
+        )
+        if remaining > within_km and due_date is None:
+            continue
+        items.append({
+            "vehicle_id": d.vehicle_id,
+            "vehicle_name": name,
+            "plate": plate,
+            "work_type": d.work_type,
+            "record_id": d.record_id,
+            "last_date": d.last_date,
+            "last_mileage": d.last_mileage,
+            "next_service_km": d.next_service_km,
+            "mileage_current": mileage,
+            "remaining_km": remaining,
+            "projected_mileage": int(round(mileage + driven)),
+            "projected_remaining_km": int(round(remaining - driven)),
+            "projected_due_date": due_date,
+            "overdue": remaining <= 0,
+        })
+    items.sort(key=lambda i: (i["projected_remaining_km"], i["vehicle_id"], i["work_type"]))
+    return items
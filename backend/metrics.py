@@ -0,0 +1,350 @@
+"""
+Prometheus metrics (text exposition format, served at /metrics).
+
+Counters and histograms are sharded per thread. A thread only ever
+writes its own shard, so an increment takes no lock; the lock is taken
+only the first time a thread uses a new label set. A scrape adds the
+shards up. Other gauges are read at scrape time through callbacks, such
+as DB pool usage and parcels by status.
+
+With several uvicorn workers, point METRICS_DIR at a directory they
+share and empty it on deploy. Every process writes its totals there
+every FLUSH_SECONDS, on each scrape and at exit. /metrics then adds up
+all the files, whichever worker answers. Counters of workers that have
+exited are kept, so totals never go backwards, but their gauges are
+dropped. Gauges that read the database are computed only by the worker
+that answers, never summed.
+
+Set METRICS_TOKEN to require "Authorization: Bearer <token>" on scrapes.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+
+import models
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+FLUSH_SECONDS = 5.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY: List["_Metric"] = []
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        REGISTRY.append(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _copies(self) -> List[dict]:
+        # Owners only add keys under the lock, so copying under it never sees a resize
+        with self._lock:
+            return [{k: (list(v) if isinstance(v, list) else v) for k, v in s.items()} for s in self._shards]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        shard = self._shard()
+        value = shard.get(key)
+        if value is None:
+            with self._lock:
+                shard[key] = amount
+        else:
+            shard[key] = value + amount
+
+    def collect(self) -> Dict[tuple, float]:
+        out: Dict[tuple, float] = {}
+        for shard in self._copies():
+            for key, value in shard.items():
+                out[key] = out.get(key, 0.0) + value
+        return out
+
+
+class Gauge(Counter):
+    """Up/down value summed over threads (e.g. requests in progress), or read by a callback."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[tuple, float]]] = None, shared: bool = True):
+        super().__init__(name, help, labels)
+        self.callback = callback
+        self.shared = shared        # False: the same for every worker (read from the DB), never summed
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self) -> Dict[tuple, float]:
+        return self.callback() if self.callback else super().collect()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        shard = self._shard()
+        cell = shard.get(key)
+        if cell is None:
+            cell = [0] * (len(self.buckets) + 1) + [0.0]     # per-bucket counts, +Inf, sum
+            with self._lock:
+                shard[key] = cell
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def collect(self) -> Dict[tuple, list]:
+        out: Dict[tuple, list] = {}
+        for shard in self._copies():
+            for key, cell in shard.items():
+                total = out.get(key)
+                out[key] = cell if total is None else [a + b for a, b in zip(total, cell)]
+        return out
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status.",
+                        ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.",
+                         ("method", "route"))
+http_in_progress = Gauge("http_requests_in_progress", "HTTP requests being served.")
+
+bookings_created = Counter("bookings_created_total", "Bookings created.")
+bookings_cancelled = Counter("bookings_cancelled_total", "Bookings cancelled.")
+seats_sold = Counter("seats_sold_total", "Seats booked, including seats added to existing bookings.")
+seats_released = Counter("seats_released_total", "Seats given back by cancellations and reductions.")
+booking_failures = Counter("booking_failures_total", "Rejected booking attempts.", ("reason",))
+seat_holds = Counter("seat_holds_total",
+                     "Seat holds by outcome (placed/rejected/converted/released/expired).", ("outcome",))
+parcels_created = Counter("parcels_created_total", "Parcels registered.")
+cache_lookups = Counter("cache_lookups_total", "Cache lookups by cache and result (hit/miss).", ("cache", "result"))
+idempotent_requests = Counter("idempotent_requests_total",
+                              "Writes sent with an Idempotency-Key by outcome "
+                              "(executed/replayed/coalesced/conflict/mismatch).", ("outcome",))
+jobs_finished = Counter("jobs_finished_total", "Background job attempts by kind and outcome (done/retry/dead/unrecorded).",
+                        ("kind", "outcome"))
+job_wait = Histogram("job_queue_wait_seconds", "Time from a job's run_at until a worker started it.", ("kind",),
+                     buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+
+# ── Multi-process ─────────────────────────────────────────────────────────────
+
+def _snapshot() -> dict:
+    metrics = {}
+    for m in REGISTRY:
+        if isinstance(m, Gauge) and not m.shared:
+            continue
+        metrics[m.name] = [[list(k), v] for k, v in m.collect().items()]
+    return {"pid": os.getpid(), "at": time.time(), "metrics": metrics}
+
+
+def write_snapshot():
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merged() -> Dict[str, Dict[tuple, object]]:
+    """name -> {labels: value} over every process that has written a snapshot."""
+    if not METRICS_DIR:
+        return {m.name: m.collect() for m in REGISTRY}
+    write_snapshot()
+    kinds = {m.name: m for m in REGISTRY}
+    out: Dict[str, Dict[tuple, object]] = {m.name: {} for m in REGISTRY}
+    for name in os.listdir(METRICS_DIR):
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue    # being replaced right now; its numbers come in the next scrape
+        alive = _alive(snap["pid"])
+        for metric, rows in snap["metrics"].items():
+            m = kinds.get(metric)
+            if m is None or (isinstance(m, Gauge) and not alive):
+                continue
+            target = out[metric]
+            for labels, value in rows:
+                key = tuple(labels)
+                old = target.get(key)
+                if old is None:
+                    target[key] = value
+                elif isinstance(value, list):
+                    target[key] = [a + b for a, b in zip(old, value)]
+                else:
+                    target[key] = old + value
+    for m in REGISTRY:
+        if isinstance(m, Gauge) and not m.shared:
+            out[m.name] = m.collect()
+    return out
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+# ── Exposition ────────────────────────────────────────────────────────────────
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def render() -> str:
+    values = _merged()
+    lines = []
+    for m in REGISTRY:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for key, v in sorted(values.get(m.name, {}).items()):
+            if m.kind == "histogram":
+                running = 0
+                for bound, count in zip(m.buckets + ("+Inf",), v):
+                    running += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{m.name}_bucket{_labels(m.labels, key, le)} {running}")
+                lines.append(f"{m.name}_sum{_labels(m.labels, key)} {_number(v[-1])}")
+                lines.append(f"{m.name}_count{_labels(m.labels, key)} {running}")
+            else:
+                lines.append(f"{m.name}{_labels(m.labels, key)} {_number(v)}")
+    return "\n".join(lines) + "\n"
+
+
+# ── Hooks ─────────────────────────────────────────────────────────────────────
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status, streaming = 500, False
+
+        async def send_with_status(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        streaming = True
+            await send(message)
+
+        http_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_progress.dec()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            http_requests.inc(method=scope["method"], route=route, status=status)
+            if not streaming:
+                http_latency.observe(time.perf_counter() - start, method=scope["method"], route=route)
+
+
+def install(engine, session_factory, extra_gauges: Dict[str, Tuple[str, Callable[[], float]]] = None):
+    """Register the gauges that read the pool and the database."""
+    def pool_stats():
+        pool = engine.pool      # replaced by engine.dispose()
+        out = {}
+        for state, fn in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+            if hasattr(pool, fn):
+                out[(state,)] = float(max(0, getattr(pool, fn)()))  # overflow is negative until the pool fills
+        return out
+
+    Gauge("db_pool_connections", "DB connection pool usage (per worker, summed).", ("state",), callback=pool_stats)
+
+    def parcels_by_status():
+        with session_factory() as db:
+            rows = db.query(models.Parcel.status, func.count()).group_by(models.Parcel.status).all()
+        return {(status or "unknown",): float(n) for status, n in rows}
+
+    Gauge("parcels", "Parcels by current status.", ("status",), callback=parcels_by_status, shared=False)
+
+    def jobs_by_status():
+        with session_factory() as db:
+            rows = db.query(models.Job.status, func.count()).group_by(models.Job.status).all()
+        return {(status,): float(n) for status, n in rows}
+
+    Gauge("jobs", "Background jobs by status.", ("status",), callback=jobs_by_status, shared=False)
+
+    def seats_held():
+        with session_factory() as db:
+            return {(): float(db.query(func.coalesce(func.sum(models.Ride.seats_held), 0)).scalar())}
+
+    Gauge("seats_held", "Seats held by bookings still being filled in.", callback=seats_held, shared=False)
+
+    for name, (help, fn) in (extra_gauges or {}).items():
+        Gauge(name, help, callback=lambda fn=fn: {(): float(fn())})
+
+
+
+def start():
+    """Start this process's multi-process flusher (call in each worker, after any fork)."""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+        atexit.register(write_snapshot)
@@ -0,0 +1,111 @@
+"""Baseline: users, routes, stops, rides, bookings, parcels, vehicles, maintenance records."""
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id INTEGER NOT NULL,
+        username VARCHAR NOT NULL,
+        password_hash VARCHAR NOT NULL,
+        full_name VARCHAR,
+        phone VARCHAR,
+        role VARCHAR,
+        PRIMARY KEY (id),
+        UNIQUE (username)
+    )""",
+    """CREATE TABLE IF NOT EXISTS routes (
+        id INTEGER NOT NULL,
+        name VARCHAR NOT NULL,
+        direction VARCHAR NOT NULL,
+        is_active BOOLEAN,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS stops (
+        id INTEGER NOT NULL,
+        route_id INTEGER NOT NULL,
+        city VARCHAR NOT NULL,
+        country VARCHAR NOT NULL,
+        "order" INTEGER NOT NULL,
+        pickup BOOLEAN,
+        dropoff BOOLEAN,
+        lat FLOAT,
+        lng FLOAT,
+        PRIMARY KEY (id),
+        FOREIGN KEY(route_id) REFERENCES routes (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS rides (
+        id INTEGER NOT NULL,
+        route_id INTEGER NOT NULL,
+        driver_id INTEGER,
+        date DATE NOT NULL,
+        seats_total INTEGER NOT NULL,
+        seats_free INTEGER NOT NULL,
+        vehicle VARCHAR,
+        price INTEGER,
+        status VARCHAR,
+        PRIMARY KEY (id),
+        FOREIGN KEY(route_id) REFERENCES routes (id),
+        FOREIGN KEY(driver_id) REFERENCES users (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS bookings (
+        id INTEGER NOT NULL,
+        ride_id INTEGER NOT NULL,
+        name VARCHAR NOT NULL,
+        phone VARCHAR NOT NULL,
+        seats INTEGER NOT NULL,
+        from_stop_id INTEGER,
+        to_stop_id INTEGER,
+        comment VARCHAR,
+        created_at DATETIME,
+        status VARCHAR,
+        PRIMARY KEY (id),
+        FOREIGN KEY(ride_id) REFERENCES rides (id),
+        FOREIGN KEY(from_stop_id) REFERENCES stops (id),
+        FOREIGN KEY(to_stop_id) REFERENCES stops (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS parcels (
+        id INTEGER NOT NULL,
+        ride_id INTEGER,
+        direction VARCHAR NOT NULL,
+        sender VARCHAR NOT NULL,
+        sender_phone VARCHAR NOT NULL,
+        receiver VARCHAR NOT NULL,
+        receiver_phone VARCHAR NOT NULL,
+        np_office VARCHAR NOT NULL,
+        description TEXT,
+        status VARCHAR,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(ride_id) REFERENCES rides (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS vehicles (
+        id INTEGER NOT NULL,
+        name VARCHAR NOT NULL,
+        plate VARCHAR NOT NULL,
+        make VARCHAR,
+        model_name VARCHAR,
+        year INTEGER,
+        mileage_current INTEGER NOT NULL,
+        notes TEXT,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS maintenance_records (
+        id INTEGER NOT NULL,
+        vehicle_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        mileage INTEGER NOT NULL,
+        work_type VARCHAR NOT NULL,
+        description TEXT,
+        cost FLOAT,
+        next_service_km INTEGER,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(vehicle_id) REFERENCES vehicles (id)
+    )""",
+]
+
+
+def upgrade(conn):
+    for ddl in TABLES:
+        conn.exec_driver_sql(ddl)
+    # index=True on the primary keys, as create_all made them
+    for table in ("users", "routes", "stops", "rides", "bookings", "parcels", "vehicles", "maintenance_records"):
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS ix_{table}_id ON {table} (id)")
@@ -0,0 +1,7 @@
+"""Route tolls and vehicle fuel consumption for the profitability engine."""
+from migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "routes", "tolls", "FLOAT")
+    add_column(conn, "vehicles", "fuel_l100", "FLOAT")
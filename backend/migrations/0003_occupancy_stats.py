@@ -0,0 +1,25 @@
+"""Occupancy and revenue aggregates per ride, route-day and month."""
+import aggregates
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS occupancy_stats (
+        level VARCHAR NOT NULL,
+        "key" VARCHAR NOT NULL,
+        route_id INTEGER,
+        period DATE NOT NULL,
+        rides INTEGER NOT NULL,
+        seats_total INTEGER NOT NULL,
+        seats_sold INTEGER NOT NULL,
+        bookings INTEGER NOT NULL,
+        cancellations INTEGER NOT NULL,
+        revenue FLOAT NOT NULL,
+        PRIMARY KEY (level, "key")
+    )""")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_occupancy_stats_level_period ON occupancy_stats (level, period)"
+    )
+
+
+def backfill(db):
+    aggregates.rebuild(db)
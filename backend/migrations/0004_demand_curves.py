@@ -0,0 +1,13 @@
+"""Booking curves per route and departure weekday for demand forecasting."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS demand_curves (
+        route_id INTEGER NOT NULL,
+        weekday INTEGER NOT NULL,
+        rides INTEGER NOT NULL,
+        final_seats FLOAT NOT NULL,
+        booked_curve BLOB,
+        fitted_through DATE,
+        PRIMARY KEY (route_id, weekday)
+    )""")
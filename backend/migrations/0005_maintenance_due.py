@@ -0,0 +1,26 @@
+"""Maintenance-due index: latest record per vehicle and work type."""
+import maintenance
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS maintenance_due (
+        vehicle_id INTEGER NOT NULL,
+        work_type VARCHAR NOT NULL,
+        record_id INTEGER NOT NULL,
+        last_date DATE NOT NULL,
+        last_mileage INTEGER NOT NULL,
+        next_service_km INTEGER,
+        PRIMARY KEY (vehicle_id, work_type),
+        FOREIGN KEY(vehicle_id) REFERENCES vehicles (id)
+    )""")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_maintenance_due_next_service_km ON maintenance_due (next_service_km)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_maintenance_records_vehicle_mileage "
+        "ON maintenance_records (vehicle_id, mileage, id)"
+    )
+
+
+def backfill(db):
+    maintenance.rebuild(db)
@@ -0,0 +1,14 @@
+"""Geocoding cache keyed by normalized address."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS geocode_cache (
+        "key" VARCHAR NOT NULL,
+        "query" VARCHAR NOT NULL,
+        lat FLOAT,
+        lng FLOAT,
+        source VARCHAR NOT NULL,
+        precision VARCHAR NOT NULL,
+        created_at DATETIME,
+        PRIMARY KEY ("key")
+    )""")
@@ -0,0 +1,12 @@
+"""Persistent road distance/duration matrix."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS distance_matrix (
+        origin BIGINT NOT NULL,
+        dest BIGINT NOT NULL,
+        distance_km FLOAT NOT NULL,
+        duration_min FLOAT NOT NULL,
+        source VARCHAR NOT NULL,
+        PRIMARY KEY (origin, dest)
+    ) WITHOUT ROWID""")
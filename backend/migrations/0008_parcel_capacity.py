@@ -0,0 +1,11 @@
+"""Parcel size and deadline, ride parcel capacity for the allocator."""
+from migrations import add_column
+
+
+def upgrade(conn):
+    add_column(conn, "rides", "parcel_capacity", "INTEGER")
+    add_column(conn, "rides", "parcel_weight_kg", "FLOAT")
+    add_column(conn, "rides", "parcel_volume_l", "FLOAT")
+    add_column(conn, "parcels", "weight_kg", "FLOAT")
+    add_column(conn, "parcels", "volume_l", "FLOAT")
+    add_column(conn, "parcels", "deadline", "DATE")
@@ -0,0 +1,17 @@
+"""Driver GPS fixes."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS position_fixes (
+        id INTEGER NOT NULL,
+        ride_id INTEGER NOT NULL,
+        recorded_at DATETIME NOT NULL,
+        lat FLOAT NOT NULL,
+        lng FLOAT NOT NULL,
+        speed_kmh FLOAT,
+        PRIMARY KEY (id),
+        FOREIGN KEY(ride_id) REFERENCES rides (id) ON DELETE CASCADE
+    )""")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_position_fixes_ride_time ON position_fixes (ride_id, recorded_at)"
+    )
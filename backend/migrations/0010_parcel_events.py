@@ -0,0 +1,31 @@
+"""Append-only parcel event log, tracking codes and the parcel status projection."""
+import parcel_events
+from migrations import add_column
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS parcel_events (
+        id INTEGER NOT NULL,
+        parcel_id INTEGER NOT NULL,
+        status VARCHAR NOT NULL,
+        created_at DATETIME NOT NULL,
+        actor VARCHAR NOT NULL,
+        ride_id INTEGER,
+        lat FLOAT,
+        lng FLOAT,
+        note VARCHAR,
+        PRIMARY KEY (id),
+        FOREIGN KEY(parcel_id) REFERENCES parcels (id),
+        FOREIGN KEY(ride_id) REFERENCES rides (id)
+    )""")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_parcel_events_parcel ON parcel_events (parcel_id, id)")
+    # create_all made this a UNIQUE table constraint; ADD COLUMN can't, so it's an index here
+    if add_column(conn, "parcels", "tracking_code", "VARCHAR"):
+        conn.exec_driver_sql("CREATE UNIQUE INDEX uq_parcels_tracking_code ON parcels (tracking_code)")
+    add_column(conn, "parcels", "status_changed_at", "DATETIME")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_parcels_status ON parcels (status)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_parcels_ride_status ON parcels (ride_id, status)")
+
+
+def backfill(db):
+    parcel_events.backfill(db)
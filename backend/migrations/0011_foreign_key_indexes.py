@@ -0,0 +1,30 @@
+"""Indexes on foreign keys and hot filter columns.
+
+SQLite does not index foreign keys by itself, so joins from a ride to its
+bookings and deletes of stops scanned whole tables. Every foreign key is
+now the leading column of some index. Where a filter or sort column
+usually comes with it (ride date, booking status, stop order), the
+index is a composite.
+"""
+
+INDEXES = [
+    "ix_stops_route_order ON stops (route_id, \"order\")",
+    "ix_rides_date ON rides (date)",
+    "ix_rides_route_date ON rides (route_id, date)",
+    "ix_rides_driver_date ON rides (driver_id, date)",
+    "ix_bookings_ride_status ON bookings (ride_id, status)",
+    "ix_bookings_from_stop ON bookings (from_stop_id)",
+    "ix_bookings_to_stop ON bookings (to_stop_id)",
+    "ix_bookings_phone_created ON bookings (phone, created_at)",
+    "ix_bookings_created ON bookings (created_at)",
+    "ix_parcels_created ON parcels (created_at)",
+    "ix_parcel_events_ride ON parcel_events (ride_id)",
+]
+
+
+def upgrade(conn):
+    for index in INDEXES:
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {index}")
+    # Planner statistics for the new indexes; not on an empty database, where they'd go stale
+    if conn.exec_driver_sql("SELECT 1 FROM bookings LIMIT 1").first():
+        conn.exec_driver_sql("ANALYZE")
@@ -0,0 +1,13 @@
+"""Per-namespace change counters for cross-process cache invalidation."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS cache_versions (
+        namespace VARCHAR NOT NULL,
+        version INTEGER NOT NULL,
+        writer INTEGER,
+        PRIMARY KEY (namespace)
+    )""")
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO cache_versions (namespace, version) VALUES ('rides', 0), ('routes', 0)"
+    )
@@ -0,0 +1,24 @@
+"""Durable background job queue."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER NOT NULL,
+        kind VARCHAR NOT NULL,
+        payload TEXT NOT NULL,
+        status VARCHAR NOT NULL,
+        priority INTEGER NOT NULL,
+        run_at DATETIME NOT NULL,
+        attempts INTEGER NOT NULL,
+        max_attempts INTEGER NOT NULL,
+        locked_by VARCHAR,
+        locked_until DATETIME,
+        last_error TEXT,
+        result TEXT,
+        created_at DATETIME NOT NULL,
+        started_at DATETIME,
+        finished_at DATETIME,
+        PRIMARY KEY (id)
+    )""")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, priority DESC, run_at)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_jobs_finished ON jobs (status, finished_at)")
@@ -0,0 +1,19 @@
+"""Stored responses for requests sent with an Idempotency-Key."""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS idempotency_keys (
+        "key" VARCHAR NOT NULL,
+        fingerprint VARCHAR NOT NULL,
+        status VARCHAR NOT NULL,
+        owner VARCHAR NOT NULL,
+        locked_at DATETIME NOT NULL,
+        expires_at DATETIME NOT NULL,
+        status_code INTEGER,
+        headers TEXT,
+        body BLOB,
+        PRIMARY KEY ("key")
+    )""")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires ON idempotency_keys (expires_at)"
+    )
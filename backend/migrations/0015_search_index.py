@@ -0,0 +1,11 @@
+"""Trigram full-text indexes over bookings and parcels, kept in sync by triggers.
+
+The definitions are search.INDEXES. Changing them later needs a migration
+that drops and re-creates the tables and triggers.
+"""
+import search
+
+
+def upgrade(conn):
+    search.create(conn)
+    search.rebuild(conn)
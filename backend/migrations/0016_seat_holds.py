@@ -0,0 +1,18 @@
+"""Time-limited seat holds, counted in rides.seats_free and rides.seats_held."""
+from migrations import add_column
+
+
+def upgrade(conn):
+    conn.exec_driver_sql("""CREATE TABLE IF NOT EXISTS seat_holds (
+        id VARCHAR NOT NULL,
+        ride_id INTEGER NOT NULL,
+        seats INTEGER NOT NULL,
+        holder VARCHAR,
+        created_at DATETIME NOT NULL,
+        expires_at DATETIME NOT NULL,
+        PRIMARY KEY (id),
+        FOREIGN KEY(ride_id) REFERENCES rides (id)
+    )""")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_seat_holds_expires ON seat_holds (expires_at)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_seat_holds_ride ON seat_holds (ride_id, expires_at)")
+    add_column(conn, "rides", "seats_held", "INTEGER NOT NULL DEFAULT 0")
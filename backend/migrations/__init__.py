@@ -0,0 +1,125 @@
+"""
+Schema migrations.
+
+Every schema change is a numbered script in this package
+(0001_baseline.py, 0002_...). A script defines `upgrade(conn)`, which
+runs raw DDL, and may define `backfill(db)` for data steps that go
+through the ORM. The schema version is SQLite's PRAGMA user_version.
+Checking it at startup is one read of the file header, with no
+reflection and no create_all.
+
+upgrade() applies every pending script's DDL in order, then their
+backfills, then sets the version, all in one BEGIN IMMEDIATE transaction
+(SQLite DDL is transactional). Backfills therefore always see the head
+schema the ORM models describe, and a failure leaves the database as it
+was. Workers starting together serialize on the write lock and re-read
+the version once they hold it.
+
+Databases created by create_all before migrations existed (version 0,
+with some tables and columns already present) converge as well. Tables
+and indexes use IF NOT EXISTS, and columns go through add_column(),
+which skips columns that are already there.
+
+    python -m migrations            # upgrade to the latest version
+    python -m migrations status
+"""
+import importlib
+import logging
+import os
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+log = logging.getLogger(__name__)
+
+_DIR = os.path.dirname(__file__)
+_SCRIPT = re.compile(r"^(\d{4})_\w+\.py$")
+
+
+def scripts() -> List[Tuple[int, str]]:
+    """(version, module name) of every script, checked to be numbered 1..N without gaps."""
+    found = sorted((int(m.group(1)), name[:-3]) for name in os.listdir(_DIR) if (m := _SCRIPT.match(name)))
+    if [v for v, _ in found] != list(range(1, len(found) + 1)):
+        raise RuntimeError(f"Migration scripts must be numbered 0001..{len(found):04d} without gaps")
+    return found
+
+
+def head() -> int:
+    return len(scripts())
+
+
+def current(conn: Connection) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def columns(conn: Connection, table: str) -> set:
+    return {row[1] for row in conn.exec_driver_sql(f'PRAGMA table_info("{table}")')}
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str) -> bool:
+    """ALTER TABLE ... ADD COLUMN unless the column exists; returns whether it was added."""
+    if column in columns(conn, table):
+        return False
+    conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+    return True
+
+
+def _transactional(engine: Engine) -> Engine:
+    # pysqlite commits implicitly before DDL; drive BEGIN/COMMIT ourselves instead
+    # (https://docs.sqlalchemy.org/en/20/dialects/sqlite.html#serializable-isolation-savepoints-transactional-ddl)
+    own = create_engine(engine.url, poolclass=NullPool, connect_args={"check_same_thread": False, "timeout": 600})
+
+    @event.listens_for(own, "connect")
+    def _no_implicit_transactions(dbapi_connection, record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(own, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return own
+
+
+def upgrade(engine: Engine, log=log.info) -> int:
+    """Apply pending scripts; returns the number applied (each one is logged through `log`)."""
+    pending_all = scripts()
+    own = _transactional(engine)
+    try:
+        with own.begin() as conn:
+            version = current(conn)
+            pending = [(v, importlib.import_module(f"{__name__}.{name}")) for v, name in pending_all if v > version]
+            if not pending:
+                return 0
+            for v, module in pending:
+                log(f"migration {v:04d}: {module.__doc__.strip().splitlines()[0]}")
+                module.upgrade(conn)
+            # Joins the outer transaction: commits inside backfills don't end it
+            with Session(bind=conn) as db:
+                for v, module in pending:
+                    if hasattr(module, "backfill"):
+                        module.backfill(db)
+                db.flush()
+            conn.exec_driver_sql(f"PRAGMA user_version = {pending[-1][0]}")
+        return len(pending)
+    finally:
+        own.dispose()
+
+
+def ensure(engine: Engine, auto: Optional[bool] = None):
+    """Startup check: compare versions, upgrading when behind (AUTO_MIGRATE=0 makes that an error)."""
+    with engine.connect() as conn:
+        version = current(conn)
+    latest = head()
+    if version == latest:
+        return
+    if version > latest:
+        raise RuntimeError(f"Database schema is at version {version}, newer than this code ({latest})")
+    if auto is None:
+        auto = os.getenv("AUTO_MIGRATE", "1") != "0"
+    if not auto:
+        raise RuntimeError(f"Database schema is at version {version}, this code needs {latest}: run `python -m migrations`")
+    upgrade(engine)
@@ -0,0 +1,17 @@
+import sys
+
+from database import engine
+from migrations import current, head, scripts, upgrade
+
+command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+if command == "status":
+    with engine.connect() as conn:
+        version = current(conn)
+    for v, name in scripts():
+        print(f"{'applied' if v <= version else 'pending':8} {name}")
+    print(f"version {version} of {head()}")
+elif command == "upgrade":
+    print(f"{upgrade(engine, log=print)} migration(s) applied")
+else:
+    print(__import__("migrations").__doc__)
+    sys.exit(2)
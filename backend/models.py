@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Text, DateTime, Boolean, Float
+from sqlalchemy import BigInteger, Column, Integer, String, Date, ForeignKey, Text, DateTime, Boolean, Float, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -23,6 +23,7 @@ class Route(Base):
     name      = Column(String, nullable=False)
     direction = Column(String, nullable=False)  # "UA->CZ" | "CZ->UA"
     is_active = Column(Boolean, default=True)
+    tolls     = Column(Float, nullable=True)    # € per ride, used by profitability
 
     stops = relationship("Stop", back_populates="route", order_by="Stop.order", cascade="all, delete-orphan")
     rides = relationship("Ride", back_populates="route", cascade="all, delete-orphan")
@@ -40,6 +41,8 @@ class Stop(Base):
     lat      = Column(Float, nullable=True)   # latitude for map
     lng      = Column(Float, nullable=True)   # longitude for map
 
+    __table_args__ = (Index("ix_stops_route_order", "route_id", "order"),)
+
     route = relationship("Route", back_populates="stops")
 
 
@@ -50,15 +53,26 @@ class Ride(Base):
     driver_id   = Column(Integer, ForeignKey("users.id"), nullable=True)
     date        = Column(Date, nullable=False)
     seats_total = Column(Integer, nullable=False)
-    seats_free  = Column(Integer, nullable=False)
+    seats_free  = Column(Integer, nullable=False)   # net of bookings and seat holds
+    seats_held  = Column(Integer, nullable=False, default=0)
     vehicle     = Column(String, nullable=True)
     price       = Column(Integer, nullable=True)
     status      = Column(String, default="active")  # "active" | "cancelled"
+    parcel_capacity  = Column(Integer, nullable=True)   # max parcels; null = allocation.py default
+    parcel_weight_kg = Column(Float, nullable=True)
+    parcel_volume_l  = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_rides_date", "date"),
+        Index("ix_rides_route_date", "route_id", "date"),
+        Index("ix_rides_driver_date", "driver_id", "date"),
+    )
 
     route    = relationship("Route", back_populates="rides")
     driver   = relationship("User", back_populates="assigned_rides", foreign_keys=[driver_id])
     bookings = relationship("Booking", back_populates="ride", cascade="all, delete-orphan")
     parcels  = relationship("Parcel", back_populates="ride")
+    holds    = relationship("SeatHold", cascade="all, delete-orphan")
 
 
 class Booking(Base):
@@ -74,6 +88,14 @@ class Booking(Base):
     created_at   = Column(DateTime, default=datetime.utcnow)
     status       = Column(String, default="confirmed")
 
+    __table_args__ = (
+        Index("ix_bookings_ride_status", "ride_id", "status"),
+        Index("ix_bookings_from_stop", "from_stop_id"),
+        Index("ix_bookings_to_stop", "to_stop_id"),
+        Index("ix_bookings_phone_created", "phone", "created_at"),
+        Index("ix_bookings_created", "created_at"),
+    )
+
     ride      = relationship("Ride", back_populates="bookings")
     from_stop = relationship("Stop", foreign_keys=[from_stop_id])
     to_stop   = relationship("Stop", foreign_keys=[to_stop_id])
@@ -91,11 +113,41 @@ class Parcel(Base):
     np_office      = Column(String, nullable=False)
     description    = Column(Text, nullable=True)
     status         = Column(String, default="pending")  # "pending" | "in_transit" | "delivered"
+    weight_kg      = Column(Float, nullable=True)
+    volume_l       = Column(Float, nullable=True)
+    deadline       = Column(Date, nullable=True)        # must leave on a ride dated no later than this
+    tracking_code  = Column(String, nullable=True)      # public lookup code (unique)
+    status_changed_at = Column(DateTime, nullable=True)  # time of the latest ParcelEvent
     created_at     = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_parcels_status", "status"),
+        Index("ix_parcels_ride_status", "ride_id", "status"),
+        Index("ix_parcels_created", "created_at"),
+        Index("uq_parcels_tracking_code", "tracking_code", unique=True),
+    )
+
     ride = relationship("Ride", back_populates="parcels")
 
 
+class ParcelEvent(Base):
+    """Append-only parcel history; Parcel.status is its projection (see parcel_events.py)."""
+    __tablename__ = "parcel_events"
+    __table_args__ = (
+        Index("ix_parcel_events_parcel", "parcel_id", "id"),
+        Index("ix_parcel_events_ride", "ride_id"),
+    )
+    id         = Column(Integer, primary_key=True)
+    parcel_id  = Column(Integer, ForeignKey("parcels.id"), nullable=False)
+    status     = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    actor      = Column(String, nullable=False)     # username, "bot", "public" or "system"
+    ride_id    = Column(Integer, ForeignKey("rides.id"), nullable=True)
+    lat        = Column(Float, nullable=True)
+    lng        = Column(Float, nullable=True)
+    note       = Column(String, nullable=True)
+
+
 # ── Vehicle tracking ───────────────────────────────────────────────────────────
 
 class Vehicle(Base):
@@ -107,12 +159,14 @@ class Vehicle(Base):
     model_name      = Column(String, nullable=True)    # Transit
     year            = Column(Integer, nullable=True)
     mileage_current = Column(Integer, nullable=False, default=0)
+    fuel_l100       = Column(Float, nullable=True)     # L/100km
     notes           = Column(Text, nullable=True)
 
     maintenance = relationship(
         "MaintenanceRecord", back_populates="vehicle",
         cascade="all, delete-orphan",
     )
+    maintenance_due = relationship("MaintenanceDue", cascade="all, delete-orphan")
 
 
 class MaintenanceRecord(Base):
@@ -128,3 +182,165 @@ class MaintenanceRecord(Base):
     created_at      = Column(DateTime, default=datetime.utcnow)
 
     vehicle = relationship("Vehicle", back_populates="maintenance")
+
+    __table_args__ = (Index("ix_maintenance_records_vehicle_mileage", "vehicle_id", "mileage", "id"),)
+
+
+class MaintenanceDue(Base):
+    """Latest record per vehicle and work type (see maintenance.py)."""
+    __tablename__ = "maintenance_due"
+    vehicle_id      = Column(Integer, ForeignKey("vehicles.id"), primary_key=True)
+    work_type       = Column(String, primary_key=True)
+    record_id       = Column(Integer, nullable=False)
+    last_date       = Column(Date, nullable=False)
+    last_mileage    = Column(Integer, nullable=False)
+    next_service_km = Column(Integer, nullable=True, index=True)
+
+
+# ── GPS tracking ──────────────────────────────────────────────────────────────
+
+class PositionFix(Base):
+    """One GPS fix reported by a driver's device (written in bulk by tracking.py)."""
+    __tablename__ = "position_fixes"
+    __table_args__ = (Index("ix_position_fixes_ride_time", "ride_id", "recorded_at"),)
+    id          = Column(Integer, primary_key=True)
+    ride_id     = Column(Integer, ForeignKey("rides.id", ondelete="CASCADE"), nullable=False)
+    recorded_at = Column(DateTime, nullable=False)   # device time, UTC
+    lat         = Column(Float, nullable=False)
+    lng         = Column(Float, nullable=False)
+    speed_kmh   = Column(Float, nullable=True)
+
+
+# ── Distance matrix ───────────────────────────────────────────────────────────
+
+class DistanceCell(Base):
+    """Road distance/duration between two points keyed by coordinate hash (see distances.py)."""
+    __tablename__ = "distance_matrix"
+    __table_args__ = {"sqlite_with_rowid": False}
+    origin       = Column(BigInteger, primary_key=True)
+    dest         = Column(BigInteger, primary_key=True)
+    distance_km  = Column(Float, nullable=False)
+    duration_min = Column(Float, nullable=False)
+    source       = Column(String, nullable=False)
+
+
+# ── Geocoding ─────────────────────────────────────────────────────────────────
+
+class GeocodeCache(Base):
+    """Provider answers keyed by normalized address (see geocoding.py)."""
+    __tablename__ = "geocode_cache"
+    key        = Column(String, primary_key=True)   # normalized address
+    query      = Column(String, nullable=False)     # address as first seen
+    lat        = Column(Float, nullable=True)       # null = provider found nothing
+    lng        = Column(Float, nullable=True)
+    source     = Column(String, nullable=False)
+    precision  = Column(String, nullable=False, default="address")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ── Aggregates ────────────────────────────────────────────────────────────────
+
+class OccupancyStat(Base):
+    """Materialized occupancy/revenue per ride, per route-day and per month (see aggregates.py)."""
+    __tablename__ = "occupancy_stats"
+    level         = Column(String, primary_key=True)   # "ride" | "route_day" | "month"
+    key           = Column(String, primary_key=True)   # ride id | "route_id:YYYY-MM-DD" | "YYYY-MM"
+    route_id      = Column(Integer, nullable=True)
+    period        = Column(Date, nullable=False)       # ride date, or first day of the month
+    rides         = Column(Integer, nullable=False, default=0)
+    seats_total   = Column(Integer, nullable=False, default=0)
+    seats_sold    = Column(Integer, nullable=False, default=0)
+    bookings      = Column(Integer, nullable=False, default=0)
+    cancellations = Column(Integer, nullable=False, default=0)
+    revenue       = Column(Float, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_occupancy_stats_level_period", "level", "period"),)
+
+
+class DemandCurve(Base):
+    """Summed booking curves per route and departure weekday (see forecast.py)."""
+    __tablename__ = "demand_curves"
+    route_id       = Column(Integer, primary_key=True)
+    weekday        = Column(Integer, primary_key=True)   # 0 = Monday
+    rides          = Column(Integer, nullable=False, default=0)
+    final_seats    = Column(Float, nullable=False, default=0)
+    booked_curve   = Column(LargeBinary, nullable=True)  # float64[HORIZON+1]
+    fitted_through = Column(Date, nullable=True)
+
+
+# ── Cache invalidation ────────────────────────────────────────────────────────
+
+class CacheVersion(Base):
+    """Change counter per cached namespace, bumped in the writing transaction (see cache.py)."""
+    __tablename__ = "cache_versions"
+    namespace = Column(String, primary_key=True)   # "rides" | "routes"
+    version   = Column(Integer, nullable=False)
+    writer    = Column(Integer, nullable=True)     # pid of the last writer
+
+
+# ── Background jobs ───────────────────────────────────────────────────────────
+
+class Job(Base):
+    """Durable background job (see jobs.py)."""
+    __tablename__ = "jobs"
+    id           = Column(Integer, primary_key=True)
+    kind         = Column(String, nullable=False)
+    payload      = Column(Text, nullable=False, default="{}")       # JSON
+    status       = Column(String, nullable=False, default="queued")  # queued | running | done | dead
+    priority     = Column(Integer, nullable=False, default=0)       # higher runs first
+    run_at       = Column(DateTime, nullable=False)                 # not before
+    attempts     = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    locked_by    = Column(String, nullable=True)                    # worker holding the lease
+    locked_until = Column(DateTime, nullable=True)
+    last_error   = Column(Text, nullable=True)
+    result       = Column(Text, nullable=True)                      # JSON
+    created_at   = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at   = Column(DateTime, nullable=True)                  # of the latest attempt
+    finished_at  = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_ready", status, priority.desc(), run_at),
+        Index("ix_jobs_finished", "status", "finished_at"),
+    )
+
+
+# ── Idempotency ───────────────────────────────────────────────────────────────
+
+class IdempotencyKey(Base):
+    """Outcome of a write sent with an Idempotency-Key header (see idempotency.py)."""
+    __tablename__ = "idempotency_keys"
+    key         = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)   # sha256 of method, path and body
+    status      = Column(String, nullable=False)   # pending | committed | done
+    owner       = Column(String, nullable=False)   # attempt holding the key
+    locked_at   = Column(DateTime, nullable=False)
+    expires_at  = Column(DateTime, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    headers     = Column(Text, nullable=True)      # JSON [[name, value], ...]
+    body        = Column(LargeBinary, nullable=True)
+
+    __table_args__ = (Index("ix_idempotency_keys_expires", "expires_at"),)
+
+
+# ── Search ────────────────────────────────────────────────────────────────────
+# bookings_fts and parcels_fts are FTS5 tables filled by triggers on bookings
+# and parcels (migration 0015). They have no models; search.py queries them.
+
+
+# ── Seat holds ────────────────────────────────────────────────────────────────
+
+class SeatHold(Base):
+    """Seats set aside while a booking is being filled in (see holds.py)."""
+    __tablename__ = "seat_holds"
+    id         = Column(String, primary_key=True)     # random, so only its holder can use it
+    ride_id    = Column(Integer, ForeignKey("rides.id"), nullable=False)
+    seats      = Column(Integer, nullable=False)
+    holder     = Column(String, nullable=True)        # e.g. "tg:123456", for support
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_seat_holds_expires", "expires_at"),
+        Index("ix_seat_holds_ride", "ride_id", "expires_at"),
+    )
@@ -0,0 +1,125 @@
+"""
+Parcel tracking history.
+
+parcel_events is append-only: every status change adds a row with time,
+actor, ride and location. Parcel.status (with status_changed_at) is the
+projection of the latest event and is updated in the same transaction,
+so list and filter queries never read the log. The public timeline is
+one indexed join on parcels.tracking_code.
+
+Bulk transitions (a whole ride's parcels at once) are set-based: one
+INSERT ... SELECT appends the events and one UPDATE moves the
+projection, whatever the number of parcels.
+"""
+import secrets
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from models import Parcel, ParcelEvent
+
+STATUSES = ("pending", "in_transit", "delivered")
+# Bulk transitions move parcels forward from the previous status only
+PREVIOUS = {"in_transit": ("pending",), "delivered": ("in_transit",)}
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+CODE_LENGTH = 10
+
+
+def new_tracking_code() -> str:
+    return "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+
+
+def record(
+    db: Session,
+    parcel: Parcel,
+    status: str,
+    actor: str,
+    ride_id: Optional[int] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    note: Optional[str] = None,
+) -> ParcelEvent:
+    """Append one event and move the projection (caller commits)."""
+    now = datetime.utcnow()
+    event = ParcelEvent(
+        parcel_id=parcel.id, status=status, created_at=now, actor=actor,
+        ride_id=ride_id if ride_id is not None else parcel.ride_id, lat=lat, lng=lng, note=note,
+    )
+    db.add(event)
+    parcel.status = status
+    parcel.status_changed_at = now
+    return event
+
+
+def transition_ride(
+    db: Session,
+    ride_id: int,
+    status: str,
+    actor: str,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    note: Optional[str] = None,
+) -> int:
+    """Move every parcel of a ride from the previous status to `status`; returns the count."""
+    now = datetime.utcnow()
+    p = Parcel.__table__
+    match = and_(p.c.ride_id == ride_id, p.c.status.in_(PREVIOUS[status]))
+    source = select(
+        p.c.id, literal(status), literal(now), literal(actor), p.c.ride_id,
+        literal(lat), literal(lng), literal(note),
+    ).where(match)
+    db.execute(insert(ParcelEvent.__table__).from_select(
+        ["parcel_id", "status", "created_at", "actor", "ride_id", "lat", "lng", "note"], source,
+    ))
+    moved = db.execute(
+        update(p).where(match).values(status=status, status_changed_at=now)
+    ).rowcount
+    db.commit()
+    return moved
+
+
+def timeline(db: Session, tracking_code: str) -> Optional[dict]:
+    """Public view of a parcel: current status and its events, oldest first."""
+    rows = db.execute(
+        select(
+            Parcel.id, Parcel.direction, Parcel.status, Parcel.created_at, Parcel.np_office,
+            ParcelEvent.status, ParcelEvent.created_at, ParcelEvent.lat, ParcelEvent.lng, ParcelEvent.note,
+        )
+        .outerjoin(ParcelEvent, ParcelEvent.parcel_id == Parcel.id)
+        .where(Parcel.tracking_code == tracking_code)
+        .order_by(ParcelEvent.id)
+    ).all()
+    if not rows:
+        return None
+    first = rows[0]
+    events = [
+        {"status": r[5], "at": r[6], "lat": r[7], "lng": r[8], "note": r[9]}
+        for r in rows if r[5] is not None
+    ]
+    return {
+        "tracking_code": tracking_code,
+        "direction": first[1],
+        "status": first[2],
+        "created_at": first[3],
+        "np_office": first[4],
+        "events": events,
+    }
+
+
+def delete_for(db: Session, parcel_ids: Iterable[int]):
+    db.query(ParcelEvent).filter(ParcelEvent.parcel_id.in_(list(parcel_ids))).delete(synchronize_session=False)
+
+
+def backfill(db: Session) -> int:
+    """Give parcels that predate the log a tracking code and an opening event."""
+    parcels: List[Parcel] = db.query(Parcel).filter(Parcel.tracking_code.is_(None)).all()
+    for parcel in parcels:
+        parcel.tracking_code = new_tracking_code()
+        at = parcel.created_at or datetime.utcnow()
+        db.add(ParcelEvent(parcel_id=parcel.id, status=parcel.status or "pending", created_at=at,
+                           actor="system", ride_id=parcel.ride_id, note="imported"))
+        parcel.status_changed_at = parcel.status_changed_at or at
+    db.commit()
+    return len(parcels)
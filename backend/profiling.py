@@ -0,0 +1,463 @@
+"""
+Per-request profiling.
+
+ProfilingMiddleware gives every sampled request a RequestProfile in a
+context variable. The context follows the request into the threadpool,
+where it collects:
+- statement count, DB time and per-statement timings, from SQLAlchemy
+  cursor hooks;
+- the time from the endpoint returning to the response going out
+  (serialization and rendering), marked by ProfiledRoute;
+- named spans such as bcrypt.
+
+At the end of the request the profile is folded into per-minute buckets,
+so the admin debug endpoint can list the worst endpoints and statements
+over a rolling window. Only requests sending "X-Profile-Token: <token>"
+matching PROFILE_TOKEN get a Server-Timing header back; those are always
+profiled, whatever the sample rate.
+
+A request still running after SLOW_MS / 2 gets stack samples from a
+background thread every STACK_INTERVAL seconds. If it ends up over
+SLOW_MS, the collapsed stacks are kept with the request in a short
+"slow requests" list. The sampler only wakes up while such a request is
+in flight, so normal traffic pays only for the counters: about ten
+microseconds per request plus two clock reads per statement.
+
+Settings (env): PROFILING=0 disables everything, PROFILE_SAMPLE_RATE
+(fraction of other requests profiled, default 0), PROFILE_TOKEN (unset:
+no request is profiled on demand), PROFILE_SLOW_MS (default 500),
+PROFILE_STACKS=0 turns the stack sampler off.
+
+Numbers are per process.
+"""
+import asyncio
+import functools
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Optional
+
+import numpy as np
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from starlette.datastructures import Headers, MutableHeaders
+
+ENABLED = os.getenv("PROFILING", "1") != "0"
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+STACKS = os.getenv("PROFILE_STACKS", "1") != "0"
+STACK_INTERVAL = 0.005
+STACK_DEPTH = 40
+WINDOW_SECONDS = 15 * 60
+BUCKET_SECONDS = 60
+RESERVOIR = 256             # latencies kept per endpoint and bucket for percentiles
+TOP_STATEMENTS = 5
+SLOW_KEEP = 50
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("start", "statements", "db_seconds", "by_statement", "returned", "serialize_seconds",
+                 "spans", "thread", "stacks", "samples")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.by_statement: Dict[str, list] = {}     # raw SQL -> [count, seconds, max seconds]
+        self.returned: Optional[float] = None        # when the endpoint function returned
+        self.serialize_seconds = 0.0
+        self.spans: Dict[str, float] = {}
+        self.thread = threading.get_ident()        # where the work happens; the sampler looks here
+        self.stacks: Optional[Counter] = None
+        self.samples = 0
+
+    def add_statement(self, statement: str, seconds: float):
+        self.statements += 1
+        self.db_seconds += seconds
+        self.thread = threading.get_ident()
+        s = self.by_statement.get(statement)
+        if s is None:
+            self.by_statement[statement] = [1, seconds, seconds]
+        else:
+            s[0] += 1
+            s[1] += seconds
+            if seconds > s[2]:
+                s[2] = seconds
+
+
+def current() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block (e.g. password hashing) into the current request's profile."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.thread = threading.get_ident()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.spans[name] = profile.spans.get(name, 0.0) + time.perf_counter() - start
+
+
+# ── SQL normalization ─────────────────────────────────────────────────────────
+
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=4096)
+def normalize(statement: str) -> str:
+    """One key per query shape: literals become ?, IN lists collapse, whitespace folds."""
+    s = _SPACE.sub(" ", statement).strip()
+    s = _LITERAL.sub("?", s)
+    return _IN_LIST.sub("(?, ...)", s)
+
+
+# ── Rolling window ────────────────────────────────────────────────────────────
+
+class _Bucket:
+    __slots__ = ("start", "endpoints", "queries")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.endpoints: Dict[str, list] = {}    # endpoint -> [count, errors, seconds, max, statements, db, serialize, latencies]
+        self.queries: Dict[str, list] = {}      # normalized SQL -> [count, seconds, max, Counter(endpoint)]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: deque = deque()
+        self._slow: deque = deque(maxlen=SLOW_KEEP)
+        self._inflight: Dict[int, RequestProfile] = {}
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def begin(self, profile: RequestProfile):
+        with self._lock:
+            self._inflight[id(profile)] = profile
+        if STACKS and self._sampler is None:
+            self._start_sampler()
+        self._wake.set()
+
+    def discard(self, profile: RequestProfile):
+        with self._lock:
+            self._inflight.pop(id(profile), None)
+
+    def finish(self, profile: RequestProfile, endpoint: str, status: int, path: str):
+        elapsed = time.perf_counter() - profile.start
+        queries = {}
+        for statement, (count, seconds, longest) in profile.by_statement.items():
+            key = normalize(statement)
+            q = queries.get(key)
+            if q is None:
+                queries[key] = [count, seconds, longest]
+            else:
+                q[0] += count
+                q[1] += seconds
+                q[2] = max(q[2], longest)
+        now = time.time()
+        with self._lock:
+            self._inflight.pop(id(profile), None)
+            bucket = self._bucket(now)
+            e = bucket.endpoints.get(endpoint)
+            if e is None:
+                e = bucket.endpoints[endpoint] = [0, 0, 0.0, 0.0, 0, 0.0, 0.0, []]
+            e[0] += 1
+            e[1] += status >= 500
+            e[2] += elapsed
+            e[3] = max(e[3], elapsed)
+            e[4] += profile.statements
+            e[5] += profile.db_seconds
+            e[6] += profile.serialize_seconds
+            if len(e[7]) < RESERVOIR:
+                e[7].append(elapsed)
+            else:
+                k = random.randrange(e[0])
+                if k < RESERVOIR:
+                    e[7][k] = elapsed
+            for key, (count, seconds, longest) in queries.items():
+                q = bucket.queries.get(key)
+                if q is None:
+                    q = bucket.queries[key] = [0, 0.0, 0.0, Counter()]
+                q[0] += count
+                q[1] += seconds
+                q[2] = max(q[2], longest)
+                q[3][endpoint] += count
+            if elapsed * 1000 >= SLOW_MS:
+                self._slow.append(self._slow_entry(profile, endpoint, path, status, elapsed, queries, now))
+
+    def _bucket(self, now: float) -> _Bucket:
+        start = now - now % BUCKET_SECONDS
+        if not self._buckets or self._buckets[-1].start != start:
+            self._buckets.append(_Bucket(start))
+            while self._buckets and self._buckets[0].start < now - WINDOW_SECONDS - BUCKET_SECONDS:
+                self._buckets.popleft()
+        return self._buckets[-1]
+
+    @staticmethod
+    def _slow_entry(profile, endpoint, path, status, elapsed, queries, now) -> dict:
+        top = sorted(queries.items(), key=lambda kv: -kv[1][1])[:TOP_STATEMENTS]
+        return {
+            "at": now,
+            "endpoint": endpoint,
+            "path": path,
+            "status": status,
+            "ms": round(elapsed * 1000, 2),
+            "statements": profile.statements,
+            "db_ms": round(profile.db_seconds * 1000, 2),
+            "serialize_ms": round(profile.serialize_seconds * 1000, 2),
+            "spans_ms": {k: round(v * 1000, 2) for k, v in profile.spans.items()},
+            "top_statements": [
+                {"sql": sql, "count": c, "ms": round(s * 1000, 2), "max_ms": round(m * 1000, 2)}
+                for sql, (c, s, m) in top
+            ],
+            "samples": profile.samples,
+            "stacks": [
+                {"stack": stack, "samples": n} for stack, n in (profile.stacks or Counter()).most_common(10)
+            ],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+            self._slow.clear()
+
+    # ── Stack sampler ──────────────────────────────────────────────────────
+
+    def _start_sampler(self):
+        with self._lock:
+            if self._sampler is not None:
+                return
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiling-sampler", daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self):
+        half = SLOW_MS / 2000
+        while True:
+            self._wake.clear()
+            with self._lock:
+                inflight = list(self._inflight.values())
+            if not inflight:
+                self._wake.wait()
+                continue
+            now = time.perf_counter()
+            oldest = min(p.start for p in inflight)
+            if now - oldest < half:
+                time.sleep(min(half - (now - oldest), 0.05))
+                continue
+            frames = sys._current_frames()
+            for p in inflight:
+                if now - p.start < half:
+                    continue
+                frame = frames.get(p.thread)
+                if frame is None:
+                    continue
+                if p.stacks is None:
+                    p.stacks = Counter()
+                p.stacks[_collapse(frame)] += 1
+                p.samples += 1
+            del frames
+            time.sleep(STACK_INTERVAL)
+
+    # ── Reports ────────────────────────────────────────────────────────────
+
+    def report(self, window: float = WINDOW_SECONDS, limit: int = 20, sort: str = "total") -> dict:
+        since = time.time() - window
+        endpoints: Dict[str, list] = {}
+        queries: Dict[str, list] = {}
+        with self._lock:
+            buckets = [b for b in self._buckets if b.start + BUCKET_SECONDS > since]
+            for b in buckets:
+                for name, e in b.endpoints.items():
+                    t = endpoints.setdefault(name, [0, 0, 0.0, 0.0, 0, 0.0, 0.0, []])
+                    for i in range(7):
+                        t[i] = max(t[i], e[i]) if i == 3 else t[i] + e[i]
+                    t[7].extend(e[7])
+                for sql, q in b.queries.items():
+                    t = queries.setdefault(sql, [0, 0.0, 0.0, Counter()])
+                    t[0] += q[0]
+                    t[1] += q[1]
+                    t[2] = max(t[2], q[2])
+                    t[3].update(q[3])
+            slow = [s for s in self._slow if s["at"] >= since]
+        covered = max(1.0, min(window, time.time() - buckets[0].start)) if buckets else window
+
+        rows = []
+        for name, (count, errors, total, longest, stmts, db, ser, lat) in endpoints.items():
+            lat = np.array(lat)
+            rows.append({
+                "endpoint": name,
+                "count": count,
+                "errors": errors,
+                "rps": round(count / covered, 3),
+                "total_ms": round(total * 1000, 1),
+                "mean_ms": round(total / count * 1000, 2),
+                "p95_ms": round(float(np.percentile(lat, 95)) * 1000, 2),
+                "max_ms": round(longest * 1000, 2),
+                "sql_per_request": round(stmts / count, 2),
+                "db_ms_per_request": round(db / count * 1000, 2),
+                "serialize_ms_per_request": round(ser / count * 1000, 2),
+            })
+        key = {"total": "total_ms", "mean": "mean_ms", "p95": "p95_ms", "sql": "sql_per_request"}.get(sort, "total_ms")
+        rows.sort(key=lambda r: -r[key])
+
+        top_queries = sorted(queries.items(), key=lambda kv: -kv[1][1])[:limit]
+        return {
+            "window_s": window,
+            "requests": sum(r["count"] for r in rows),
+            "endpoints": rows[:limit],
+            "queries": [
+                {
+                    "sql": sql[:1000],
+                    "count": count,
+                    "total_ms": round(total * 1000, 1),
+                    "mean_ms": round(total / count * 1000, 3),
+                    "max_ms": round(longest * 1000, 2),
+                    "endpoints": dict(by.most_common(3)),
+                }
+                for sql, (count, total, longest, by) in top_queries
+            ],
+            "slow_requests": sorted(slow, key=lambda s: -s["ms"])[:limit],
+        }
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+recorder = Recorder()
+
+
+# ── Hooks ─────────────────────────────────────────────────────────────────────
+
+def _authorised(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    token = Headers(scope=scope).get("x-profile-token", "")
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, sample_rate: float = SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        authorised = _authorised(scope)
+        if not authorised and random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        recorder.begin(profile)
+        status, streaming = 500, False
+
+        async def send_with_timing(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                status = message["status"]
+                if profile.returned is not None:
+                    profile.serialize_seconds = now - profile.returned
+                headers = MutableHeaders(scope=message)
+                if headers.get("content-type", "").startswith("text/event-stream"):
+                    # Live streams stay open for hours: not a request to time or sample
+                    streaming = True
+                    recorder.discard(profile)
+                if authorised:
+                    headers.append("Server-Timing", (
+                        f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.statements} queries", '
+                        f"ser;dur={profile.serialize_seconds * 1000:.1f}, "
+                        f"app;dur={(now - profile.start) * 1000:.1f}"
+                    ))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if not streaming:
+                route = scope.get("route")
+                endpoint = f"{scope['method']} {getattr(route, 'path', None) or 'unmatched'}"
+                recorder.finish(profile, endpoint, status, scope.get("path", ""))
+
+
+def _mark_returned():
+    profile = _current.get()
+    if profile is not None:
+        profile.returned = time.perf_counter()
+
+
+def _marked(endpoint):
+    if not ENABLED or getattr(endpoint, "_marks_return", False):
+        return endpoint
+    if asyncio.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def marked(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _mark_returned()
+    else:
+        @functools.wraps(endpoint)
+        def marked(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _mark_returned()
+    marked._marks_return = True
+    return marked
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute that notes when the endpoint returns; the middleware times the rest as serialization."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _marked(endpoint), **kwargs)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._profile_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    start = getattr(context, "_profile_start", None)
+    if profile is not None and start is not None:
+        profile.add_statement(statement, time.perf_counter() - start)
+
+
+def install(engine):
+    """Hook statement timing into `engine`."""
+    if not ENABLED:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
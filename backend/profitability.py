@@ -0,0 +1,169 @@
+"""
+Per-ride P&L over real booking data.
+
+Everything is loaded with a handful of bulk column queries, turned into
+NumPy arrays and computed in one vectorized pass:
+
+    revenue     = seats_sold * price
+    fuel_cost   = route_km * fuel_l100 / 100 * fuel_price
+    total_cost  = fuel_cost + tolls + driver_cost
+    profit      = revenue - total_cost
+
+A Ride is one direction of the trip, so the defaults below are per leg
+(half of the round-trip figures used on the Profitability page).
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import aggregates
+import models
+from geo import DETOUR_FACTOR, haversine_km
+
+
+@dataclass
+class CostParams:
+    fuel_price: float = 1.65          # €/L
+    fuel_l100: float = 11.0           # L/100km when the vehicle has no figure
+    tolls: float = 20.0               # € per ride when the route has no figure
+    driver_cost: float = 75.0         # € per ride
+    default_distance_km: float = 1500.0
+    detour_factor: float = DETOUR_FACTOR
+
+
+def route_distances(db: Session, detour_factor: float = DETOUR_FACTOR) -> dict:
+    """One-way road distance per route id, from consecutive stop coordinates."""
+    rows = (
+        db.query(models.Stop.route_id, models.Stop.lat, models.Stop.lng)
+        .filter(models.Stop.lat.isnot(None), models.Stop.lng.isnot(None))
+        .order_by(models.Stop.route_id, models.Stop.order)
+        .all()
+    )
+    if not rows:
+        return {}
+    route_id = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lat = np.fromiter((r[1] for r in rows), dtype=float, count=len(rows))
+    lng = np.fromiter((r[2] for r in rows), dtype=float, count=len(rows))
+
+    legs = haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:])
+    legs[route_id[:-1] != route_id[1:]] = 0.0
+    if not len(legs):
+        return {}
+    ids, inverse = np.unique(route_id[:-1], return_inverse=True)
+    km = np.bincount(inverse, weights=legs) * detour_factor
+    return {int(i): float(d) for i, d in zip(ids, km) if d > 0}
+
+
+def _vehicle_consumption(db: Session) -> dict:
+    """Ride.vehicle is free text: match it against vehicle name or plate."""
+    lookup = {}
+    for name, plate, l100 in db.query(models.Vehicle.name, models.Vehicle.plate, models.Vehicle.fuel_l100):
+        if l100 is None:
+            continue
+        for key in (name, plate):
+            if key:
+                lookup[key.strip().lower()] = l100
+    return lookup
+
+
+def compute(
+    db: Session,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    params: Optional[CostParams] = None,
+) -> dict:
+    params = params or CostParams()
+
+    q = db.query(
+        models.Ride.id, models.Ride.route_id, models.Ride.date,
+        models.Ride.price, models.Ride.vehicle, models.Ride.seats_total,
+    ).filter(models.Ride.status != "cancelled")
+    if date_from:
+        q = q.filter(models.Ride.date >= date_from)
+    if date_to:
+        q = q.filter(models.Ride.date <= date_to)
+    rides = q.order_by(models.Ride.date, models.Ride.id).all()
+    if not rides:
+        return {"rides": [], "by_route": [], "by_month": [], "totals": _totals(np.zeros(0), np.zeros(0), np.zeros(0), 0)}
+
+    n = len(rides)
+    ride_id = np.fromiter((r[0] for r in rides), dtype=np.int64, count=n)
+    route_id = np.fromiter((r[1] for r in rides), dtype=np.int64, count=n)
+    month = np.fromiter((r[2].year * 12 + r[2].month - 1 for r in rides), dtype=np.int64, count=n)
+    price = np.fromiter((r[3] or 0 for r in rides), dtype=float, count=n)
+    seats_total = np.fromiter((r[5] for r in rides), dtype=np.int64, count=n)
+
+    sold = {int(s.key): s.seats_sold for s in aggregates.query(db, "ride", date_from=date_from, date_to=date_to)}
+    seats_sold = np.fromiter((sold.get(int(i), 0) for i in ride_id), dtype=float, count=n)
+
+    distances = route_distances(db, params.detour_factor)
+    tolls_by_route = dict(db.query(models.Route.id, models.Route.tolls).filter(models.Route.tolls.isnot(None)).all())
+    route_ids, route_idx = np.unique(route_id, return_inverse=True)
+    route_km = np.array([distances.get(int(r), params.default_distance_km) for r in route_ids])[route_idx]
+    tolls = np.array([tolls_by_route.get(int(r), params.tolls) for r in route_ids])[route_idx]
+
+    consumption = _vehicle_consumption(db)
+    vehicles, vehicle_idx = np.unique([(r[4] or "").strip().lower() for r in rides], return_inverse=True)
+    fuel_l100 = np.array([consumption.get(v, params.fuel_l100) for v in vehicles])[vehicle_idx]
+
+    revenue = seats_sold * price
+    fuel_cost = route_km * fuel_l100 / 100 * params.fuel_price
+    cost = fuel_cost + tolls + params.driver_cost
+    profit = revenue - cost
+
+    ride_rows = [
+        {
+            "ride_id": int(ride_id[i]),
+            "route_id": int(route_id[i]),
+            "date": rides[i][2],
+            "seats_sold": int(seats_sold[i]),
+            "seats_total": int(seats_total[i]),
+            "distance_km": round(float(route_km[i]), 1),
+            "revenue": round(float(revenue[i]), 2),
+            "fuel_cost": round(float(fuel_cost[i]), 2),
+            "tolls": round(float(tolls[i]), 2),
+            "driver_cost": params.driver_cost,
+            "profit": round(float(profit[i]), 2),
+        }
+        for i in range(n)
+    ]
+
+    return {
+        "rides": ride_rows,
+        "by_route": _rollup([str(int(k)) for k in route_ids], route_idx, revenue, cost, seats_sold),
+        "by_month": _rollup(*_month_keys(month), revenue, cost, seats_sold),
+        "totals": _totals(revenue, cost, seats_sold, n),
+    }
+
+
+def _month_keys(month: np.ndarray):
+    months, idx = np.unique(month, return_inverse=True)
+    return [f"{int(m) // 12}-{int(m) % 12 + 1:02d}" for m in months], idx
+
+
+def _rollup(keys, idx: np.ndarray, revenue: np.ndarray, cost: np.ndarray, seats_sold: np.ndarray) -> list:
+    size = len(keys)
+    rides = np.bincount(idx, minlength=size)
+    rev = np.bincount(idx, weights=revenue, minlength=size)
+    cst = np.bincount(idx, weights=cost, minlength=size)
+    sold = np.bincount(idx, weights=seats_sold, minlength=size)
+    return [
+        {"key": keys[i], **_totals(rev[i:i + 1], cst[i:i + 1], sold[i:i + 1], int(rides[i]))}
+        for i in range(size)
+    ]
+
+
+def _totals(revenue: np.ndarray, cost: np.ndarray, seats_sold: np.ndarray, rides: int) -> dict:
+    rev = float(revenue.sum())
+    profit = rev - float(cost.sum())
+    return {
+        "rides": rides,
+        "seats_sold": int(seats_sold.sum()),
+        "revenue": round(rev, 2),
+        "cost": round(float(cost.sum()), 2),
+        "profit": round(profit, 2),
+        "margin": round(profit / rev * 100, 2) if rev > 0 else 0.0,
+    }
@@ -1,33 +1,64 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 import models
 import schemas
+import aggregates
+import forecast
+import holds
+import jobs
+import metrics
+import search
+import profiling
 from database import get_db
 from auth import get_current_user
+from fieldsets import Fieldset, sparse_fields
 
-router = APIRouter(prefix="/api/bookings", tags=["bookings"])
+router = APIRouter(prefix="/api/bookings", tags=["bookings"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("", response_model=List[schemas.BookingOut])
 def list_bookings(
     phone: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, max_length=200),
+    include_cancelled: bool = Query(False),
     db: Session = Depends(get_db),
+    fieldset: Optional[Fieldset] = Depends(sparse_fields(models.Booking, schemas.BookingOut)),
 ):
-    q = db.query(models.Booking)
+    """Cancelled bookings are kept for the statistics; they are listed only with include_cancelled."""
+    if fieldset:
+        query = fieldset.query(db)
+    else:
+        query = db.query(models.Booking).options(
+            selectinload(models.Booking.from_stop), selectinload(models.Booking.to_stop),
+        )
+    if not include_cancelled:
+        query = query.filter(models.Booking.status != "cancelled")
     if phone:
-        q = q.filter(models.Booking.phone == phone)
-    return q.order_by(models.Booking.created_at.desc()).all()
+        query = query.filter(models.Booking.phone == phone)
+    if q:
+        try:
+            query = query.filter(models.Booking.id.in_(search.matching_ids("bookings", q)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    rows = query.order_by(models.Booking.created_at.desc()).all()
+    return fieldset.response(rows) if fieldset else rows
 
 
 @router.post("", response_model=schemas.BookingOut)
 def create_booking(body: schemas.BookingCreate, db: Session = Depends(get_db)):
-    ride = db.query(models.Ride).filter(models.Ride.id == body.ride_id).with_for_update().first()
+    ride = holds.lock_ride(db, body.ride_id)
     if not ride:
+        metrics.booking_failures.inc(reason="ride_not_found")
         raise HTTPException(status_code=404, detail="Ride not found")
     if ride.status == "cancelled":
+        metrics.booking_failures.inc(reason="ride_cancelled")
         raise HTTPException(status_code=400, detail="Ride is cancelled")
+    holds.release_expired(db, ride.id)
+    if body.hold_id:
+        holds.take(db, body.hold_id, ride)     # rolled back with the booking if it is rejected
     if ride.seats_free < body.seats:
+        metrics.booking_failures.inc(reason="no_seats")
         raise HTTPException(status_code=400, detail=f"Not enough seats. Available: {ride.seats_free}")
 
     booking = models.Booking(
@@ -42,7 +73,12 @@ def create_booking(body: schemas.BookingCreate, db: Session = Depends(get_db)):
     )
     db.add(booking)
     ride.seats_free -= body.seats
+    aggregates.booking_changed(db, ride, seats=body.seats, bookings=1)
+    if forecast.stale(db):
+        jobs.enqueue(db, "forecast.update", dedupe=True)    # fold in the rides that departed since
     db.commit()
+    metrics.bookings_created.inc()
+    metrics.seats_sold.inc(body.seats)
     db.refresh(booking)
     return booking
 
@@ -56,19 +92,33 @@ def update_booking(
     booking = db.query(models.Booking).filter(models.Booking.id == booking_id).first()
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
+    if booking.status == "cancelled":
+        raise HTTPException(status_code=400, detail="Booking is cancelled")
 
+    delta = 0
     if body.seats is not None:
-        ride = db.query(models.Ride).filter(models.Ride.id == booking.ride_id).with_for_update().first()
+        ride = holds.lock_ride(db, booking.ride_id)
+        db.refresh(booking)     # read again under the lock
+        if booking.status == "cancelled":
+            raise HTTPException(status_code=400, detail="Booking is cancelled")
+        holds.release_expired(db, ride.id)
         available = ride.seats_free + booking.seats
         if body.seats > available:
+            metrics.booking_failures.inc(reason="no_seats")
             raise HTTPException(status_code=400, detail=f"Not enough seats. Max available: {available}")
+        delta = body.seats - booking.seats
         ride.seats_free = available - body.seats
+        aggregates.booking_changed(db, ride, seats=delta)
         booking.seats = body.seats
 
     if body.comment is not None:
         booking.comment = body.comment
 
     db.commit()
+    if delta > 0:
+        metrics.seats_sold.inc(delta)
+    elif delta < 0:
+        metrics.seats_released.inc(-delta)
     db.refresh(booking)
     return booking
 
@@ -78,11 +128,20 @@ def cancel_booking(booking_id: int, db: Session = Depends(get_db)):
     booking = db.query(models.Booking).filter(models.Booking.id == booking_id).first()
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
+    if booking.status == "cancelled":
+        return {"ok": True}
 
-    ride = db.query(models.Ride).filter(models.Ride.id == booking.ride_id).first()
+    ride = holds.lock_ride(db, booking.ride_id)
+    db.refresh(booking)     # read again under the lock
+    if booking.status == "cancelled":
+        return {"ok": True}
     if ride:
         ride.seats_free += booking.seats
+        aggregates.booking_changed(db, ride, seats=-booking.seats, bookings=-1, cancellations=1)
 
-    db.delete(booking)
+    # Keep the row so cancellations stay countable (and rebuildable)
+    booking.status = "cancelled"
     db.commit()
+    metrics.bookings_cancelled.inc()
+    metrics.seats_released.inc(booking.seats)
     return {"ok": True}
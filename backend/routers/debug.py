@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, Query
+from auth import require_admin
+import profiling
+
+router = APIRouter(prefix="/api/debug", tags=["debug"], route_class=profiling.ProfiledRoute)
+
+
+@router.get("/profile")
+def profile_report(
+    window: int = Query(profiling.WINDOW_SECONDS, ge=60, le=profiling.WINDOW_SECONDS),
+    limit: int = Query(20, ge=1, le=200),
+    sort: str = Query("total", pattern="^(total|mean|p95|sql)$"),
+    _=Depends(require_admin),
+):
+    """Worst endpoints, statements and slow requests (with stack samples) over the last `window` seconds."""
+    return profiling.recorder.report(window=window, limit=limit, sort=sort)
+
+
+@router.post("/profile/reset")
+def profile_reset(_=Depends(require_admin)):
+    profiling.recorder.reset()
+    return {"ok": True}
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import models, schemas
+import distances
+import spatial
+import tour
+import tracking
+import numpy as np
+import profiling
 from database import get_db
-from auth import require_driver
+from auth import require_admin, require_driver
 
-router = APIRouter(prefix="/api/driver", tags=["driver"])
+router = APIRouter(prefix="/api/driver", tags=["driver"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("/rides", response_model=List[schemas.RideOut])
@@ -18,23 +25,33 @@ def my_rides(db: Session = Depends(get_db), user: models.User = Depends(require_
     )
 
 
+def _own_ride(db: Session, ride_id: int, user: models.User) -> models.Ride:
+    ride = db.query(models.Ride).filter(models.Ride.id == ride_id).first()
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    if user.role == "driver" and ride.driver_id != user.id:
+        raise HTTPException(status_code=403, detail="Not your ride")
+    return ride
+
+
 @router.get("/rides/{ride_id}")
 def my_ride_detail(
     ride_id: int,
     db: Session = Depends(get_db),
     user: models.User = Depends(require_driver),
 ):
-    ride = db.query(models.Ride).filter(models.Ride.id == ride_id).first()
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
     # Admins can see any ride; drivers only their own
-    if user.role == "driver" and ride.driver_id != user.id:
-        raise HTTPException(status_code=403, detail="Not your ride")
+    ride = _own_ride(db, ride_id, user)
 
-    bookings = db.query(models.Booking).filter(models.Booking.ride_id == ride_id).all()
+    bookings = db.query(models.Booking).filter(
+        models.Booking.ride_id == ride_id, models.Booking.status != "cancelled",
+    ).all()
+    # Parcels on this ride, plus same-direction ones the allocator has not placed yet
     parcels  = db.query(models.Parcel).filter(
         (models.Parcel.ride_id == ride_id) |
-        (models.Parcel.direction == ride.route.direction)
+        (models.Parcel.ride_id.is_(None) &
+         (models.Parcel.status == "pending") &
+         (models.Parcel.direction == ride.route.direction))
     ).all()
 
     return {
@@ -45,6 +62,93 @@ def my_ride_detail(
     }
 
 
+@router.post("/optimize", response_model=schemas.TourOut)
+def optimize_tour(
+    body: schemas.TourRequest,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_driver),
+):
+    """Order pickup/drop-off points (nearest neighbour + 2-opt/Or-opt under a time budget)."""
+    if not body.points:
+        raise HTTPException(status_code=400, detail="No points")
+    if len(body.points) > 500:
+        raise HTTPException(status_code=400, detail="Too many points")
+    lat = [p.lat for p in body.points]
+    lng = [p.lng for p in body.points]
+    try:
+        dist, _ = distances.matrix(db, lat, lng)
+    except (distances.RoutingUnavailable, ValueError):
+        dist = None   # routing provider unavailable: optimize on haversine × detour
+    try:
+        return tour.optimize(
+            lat,
+            lng,
+            start=body.start,
+            end=body.end,
+            after=[p.after for p in body.points],
+            time_budget=min(max(body.time_budget_ms, 10), 2000) / 1000,
+            dist=dist,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ── GPS tracking ──────────────────────────────────────────────────────────────
+
+@router.post("/rides/{ride_id}/positions")
+def report_positions(
+    ride_id: int,
+    body: schemas.PositionBatch,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_driver),
+):
+    """Batch of GPS fixes from the driver's device (buffered, stored in bulk)."""
+    _own_ride(db, ride_id, user)
+    if not body.fixes:
+        return {"accepted": 0, "dropped": 0}
+    if len(body.fixes) > 5000:
+        raise HTTPException(status_code=400, detail="Too many fixes in one batch")
+    now = tracking.epoch_seconds(datetime.utcnow())
+    rows = np.array([
+        (
+            tracking.epoch_seconds(f.t) if f.t else now,
+            f.lat, f.lng, np.nan if f.speed_kmh is None else f.speed_kmh,
+        )
+        for f in body.fixes
+    ], dtype=float)
+    accepted, dropped = tracking.tracker.ingest(db, ride_id, rows)
+    return {"accepted": accepted, "dropped": dropped}
+
+
+@router.get("/rides/{ride_id}/position", response_model=schemas.PositionOut)
+def current_position(ride_id: int, db: Session = Depends(get_db), user: models.User = Depends(require_driver)):
+    _own_ride(db, ride_id, user)
+    position = tracking.tracker.current(db, ride_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="No position reported yet")
+    return position
+
+
+@router.get("/rides/{ride_id}/track", response_model=schemas.TrackOut)
+def ride_track(
+    ride_id: int,
+    tolerance_m: float = 50.0,
+    since: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_driver),
+):
+    """Track simplified with Douglas-Peucker (tolerance in metres)."""
+    _own_ride(db, ride_id, user)
+    since = tracking.naive_utc(since) if since is not None else None
+    return tracking.simplified_track(db, ride_id, max(tolerance_m, 0.0), since)
+
+
+@router.get("/positions", response_model=List[schemas.PositionOut])
+def all_positions(_=Depends(require_admin)):
+    """Latest position of every van reporting to this worker process (not to other workers)."""
+    return tracking.tracker.all_current()
+
+
 @router.patch("/rides/{ride_id}/stop/{stop_id}")
 def update_stop_position(
     ride_id: int,
@@ -61,4 +165,5 @@ def update_stop_position(
     stop.lat = lat
     stop.lng = lng
     db.commit()
+    spatial.stops.upsert(stop)
     return {"ok": True, "lat": lat, "lng": lng}
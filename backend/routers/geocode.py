@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+import schemas
+import geocoding
+import jobs
+import profiling
+from database import get_db
+from auth import get_current_user, require_admin
+
+router = APIRouter(prefix="/api/geocode", tags=["geocode"], route_class=profiling.ProfiledRoute)
+
+MAX_BATCH = 200
+
+
+@router.post("", response_model=List[schemas.GeocodeResult])
+async def geocode_batch(
+    body: schemas.GeocodeRequest,
+    db: Session = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    if len(body.addresses) > MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH} addresses per request")
+    results = await geocoding.geocoder.geocode_many(db, body.addresses)
+    return [
+        schemas.GeocodeResult(address=a) if r is None else
+        schemas.GeocodeResult(address=a, lat=r.lat, lng=r.lng, source=r.source, precision=r.precision)
+        for a, r in zip(body.addresses, results)
+    ]
+
+
+@router.post("/backfill-stops", status_code=202)
+def backfill_stops(db: Session = Depends(get_db), _=Depends(require_admin)):
+    """Queue geocoding of stops without coordinates; the job result has the number updated."""
+    job = jobs.enqueue(db, "geocode.backfill_stops", dedupe=True)
+    db.commit()
+    return {"ok": True, "job_id": job.id}
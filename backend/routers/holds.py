@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+import schemas
+import holds
+import profiling
+from database import get_db
+from auth import verify_bot_key
+
+router = APIRouter(prefix="/api/holds", tags=["holds"], route_class=profiling.ProfiledRoute)
+
+
+@router.post("", response_model=schemas.SeatHoldOut)
+def place_hold(body: schemas.SeatHoldCreate, db: Session = Depends(get_db), _=Depends(verify_bot_key)):
+    ride = holds.lock_ride(db, body.ride_id)
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    if ride.status == "cancelled":
+        raise HTTPException(status_code=400, detail="Ride is cancelled")
+    try:
+        hold = holds.place(db, ride, body.seats, body.holder)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    db.refresh(hold)
+    return hold
+
+
+@router.patch("/{hold_id}", response_model=schemas.SeatHoldOut)
+def extend_hold(
+    hold_id: str,
+    body: schemas.SeatHoldUpdate,
+    db: Session = Depends(get_db),
+    _=Depends(verify_bot_key),
+):
+    """Restart the hold's TTL; with `seats`, also resize it."""
+    try:
+        hold = holds.extend(db, hold_id, body.seats)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if hold is None:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+    db.commit()
+    db.refresh(hold)
+    return hold
+
+
+@router.delete("/{hold_id}")
+def release_hold(hold_id: str, db: Session = Depends(get_db), _=Depends(verify_bot_key)):
+    holds.release(db, hold_id)
+    db.commit()
+    return {"ok": True}
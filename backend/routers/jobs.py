@@ -0,0 +1,68 @@
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import models, schemas
+import jobs
+import profiling
+from database import get_db
+from auth import require_admin
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"], route_class=profiling.ProfiledRoute)
+
+STATUSES = {"queued", "running", "done", "dead"}
+
+
+def job_out(job: models.Job) -> schemas.JobOut:
+    return schemas.JobOut(
+        id=job.id, kind=job.kind, status=job.status, priority=job.priority,
+        payload=json.loads(job.payload), result=json.loads(job.result) if job.result else None,
+        attempts=job.attempts, max_attempts=job.max_attempts, last_error=job.last_error,
+        run_at=job.run_at, created_at=job.created_at, started_at=job.started_at, finished_at=job.finished_at,
+    )
+
+
+@router.get("", response_model=List[schemas.JobOut])
+def list_jobs(
+    status: Optional[str] = Query(None),
+    kind: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    q = db.query(models.Job)
+    if status:
+        q = q.filter(models.Job.status == status)
+    if kind:
+        q = q.filter(models.Job.kind == kind)
+    return [job_out(j) for j in q.order_by(models.Job.id.desc()).limit(limit)]
+
+
+@router.get("/counts")
+def job_counts(db: Session = Depends(get_db), _=Depends(require_admin)):
+    """{kind: {status: n}}"""
+    return jobs.counts(db)
+
+
+@router.get("/{job_id}", response_model=schemas.JobOut)
+def get_job(job_id: int, db: Session = Depends(get_db), _=Depends(require_admin)):
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_out(job)
+
+
+@router.post("/{job_id}/retry", response_model=schemas.JobOut)
+def retry_job(job_id: int, db: Session = Depends(get_db), _=Depends(require_admin)):
+    """Re-queue a dead job with a fresh set of attempts."""
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "dead":
+        raise HTTPException(status_code=409, detail="Only dead jobs can be retried")
+    jobs.retry(db, job)
+    db.commit()
+    db.refresh(job)
+    return job_out(job)
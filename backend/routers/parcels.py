@@ -1,27 +1,100 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Security
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import models, schemas
+import allocation
+import metrics
+import parcel_events
+import search
+import tracking
+import profiling
 from database import get_db
-from auth import require_admin
+from auth import BOT_API_KEY, api_key_header, require_admin, require_driver
+from fieldsets import Fieldset, sparse_fields
 
-router = APIRouter(prefix="/api/parcels", tags=["parcels"])
+router = APIRouter(prefix="/api/parcels", tags=["parcels"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("", response_model=List[schemas.ParcelOut])
-def list_parcels(db: Session = Depends(get_db)):
-    return db.query(models.Parcel).order_by(models.Parcel.created_at.desc()).all()
+def list_parcels(
+    q: Optional[str] = Query(None, max_length=200),
+    db: Session = Depends(get_db),
+    fieldset: Optional[Fieldset] = Depends(sparse_fields(models.Parcel, schemas.ParcelOut)),
+):
+    query = fieldset.query(db) if fieldset else db.query(models.Parcel)
+    if q:
+        try:
+            query = query.filter(models.Parcel.id.in_(search.matching_ids("parcels", q)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    rows = query.order_by(models.Parcel.created_at.desc()).all()
+    return fieldset.response(rows) if fieldset else rows
 
 
 @router.post("", response_model=schemas.ParcelOut)
-def create_parcel(body: schemas.ParcelCreate, db: Session = Depends(get_db)):
-    parcel = models.Parcel(**body.model_dump())
+def create_parcel(
+    body: schemas.ParcelCreate,
+    db: Session = Depends(get_db),
+    x_bot_key: Optional[str] = Security(api_key_header),
+):
+    parcel = models.Parcel(**body.model_dump(), tracking_code=parcel_events.new_tracking_code())
     db.add(parcel)
+    db.flush()
+    parcel_events.record(db, parcel, "pending", actor="bot" if x_bot_key == BOT_API_KEY else "public")
     db.commit()
+    metrics.parcels_created.inc()
     db.refresh(parcel)
     return parcel
 
 
+@router.post("/allocate", response_model=schemas.AllocationOut)
+def allocate_parcels(
+    dry_run: bool = False,
+    reassign: bool = False,
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """Put pending parcels on upcoming rides by deadline and ride capacity."""
+    return allocation.allocate(db, reassign=reassign, dry_run=dry_run)
+
+
+@router.post("/transition")
+def transition_ride_parcels(
+    body: schemas.ParcelTransition,
+    db: Session = Depends(get_db),
+    user: models.User = Depends(require_driver),
+):
+    """Move a ride's parcels one status forward at once.
+
+    status="in_transit" moves its pending parcels (on departure), status="delivered"
+    its in-transit ones (on arrival); parcels in any other status are left alone.
+    """
+    if body.status not in parcel_events.PREVIOUS:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    ride = db.query(models.Ride).filter(models.Ride.id == body.ride_id).first()
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    if user.role == "driver" and ride.driver_id != user.id:
+        raise HTTPException(status_code=403, detail="Not your ride")
+    lat, lng = body.lat, body.lng
+    if lat is None or lng is None:
+        fix = tracking.tracker.current(db, ride.id)
+        lat, lng = (fix["lat"], fix["lng"]) if fix else (None, None)
+    moved = parcel_events.transition_ride(
+        db, ride.id, body.status, actor=user.username, lat=lat, lng=lng, note=body.note,
+    )
+    return {"ride_id": ride.id, "status": body.status, "moved": moved}
+
+
+@router.get("/track/{tracking_code}", response_model=schemas.ParcelTrackingOut)
+def track_parcel(tracking_code: str, db: Session = Depends(get_db)):
+    """Public tracking page data: status history only, no contact details."""
+    timeline = parcel_events.timeline(db, tracking_code.strip().upper())
+    if timeline is None:
+        raise HTTPException(status_code=404, detail="Parcel not found")
+    return timeline
+
+
 @router.get("/{parcel_id}", response_model=schemas.ParcelOut)
 def get_parcel(parcel_id: int, db: Session = Depends(get_db)):
     parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
@@ -31,13 +104,16 @@ def get_parcel(parcel_id: int, db: Session = Depends(get_db)):
 
 
 @router.patch("/{parcel_id}/status", response_model=schemas.ParcelOut)
-def update_parcel_status(parcel_id: int, body: schemas.ParcelStatusUpdate, db: Session = Depends(get_db), _=Depends(require_admin)):
+def update_parcel_status(parcel_id: int, body: schemas.ParcelStatusUpdate, db: Session = Depends(get_db), user=Depends(require_admin)):
     parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
     if not parcel:
         raise HTTPException(status_code=404, detail="Parcel not found")
-    if body.status not in {"pending", "in_transit", "delivered"}:
+    if body.status not in parcel_events.STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
-    parcel.status = body.status
+    parcel_events.record(
+        db, parcel, body.status, actor=user.username,
+        ride_id=body.ride_id, lat=body.lat, lng=body.lng, note=body.note,
+    )
     db.commit()
     db.refresh(parcel)
     return parcel
@@ -48,6 +124,7 @@ def delete_parcel(parcel_id: int, db: Session = Depends(get_db), _=Depends(requi
     parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
     if not parcel:
         raise HTTPException(status_code=404, detail="Parcel not found")
+    parcel_events.delete_for(db, [parcel.id])
     db.delete(parcel)
     db.commit()
     return {"ok": True}
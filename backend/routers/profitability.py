@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import date
+import schemas
+import profitability
+import profiling
+from database import get_db
+from auth import require_admin
+
+router = APIRouter(prefix="/api/profitability", tags=["profitability"], route_class=profiling.ProfiledRoute)
+
+
+@router.get("", response_model=schemas.ProfitabilityOut)
+def ride_profitability(
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    fuel_price: float = Query(profitability.CostParams.fuel_price, gt=0),
+    fuel_l100: float = Query(profitability.CostParams.fuel_l100, gt=0),
+    tolls: float = Query(profitability.CostParams.tolls, ge=0),
+    driver_cost: float = Query(profitability.CostParams.driver_cost, ge=0),
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    params = profitability.CostParams(
+        fuel_price=fuel_price, fuel_l100=fuel_l100, tolls=tolls, driver_cost=driver_cost,
+    )
+    return profitability.compute(db, date_from, date_to, params)
@@ -1,16 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date
+from sqlalchemy import update
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 import models, schemas
+import aggregates
+import scheduling
+import tracking
+import profiling
 from database import get_db
 from auth import require_admin
+from fieldsets import Fieldset, sparse_fields
 
-router = APIRouter(prefix="/api/rides", tags=["rides"])
+router = APIRouter(prefix="/api/rides", tags=["rides"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("", response_model=List[schemas.RideOut])
-def list_rides(db: Session = Depends(get_db)):
-    return db.query(models.Ride).order_by(models.Ride.date).all()
+def list_rides(
+    db: Session = Depends(get_db),
+    fieldset: Optional[Fieldset] = Depends(sparse_fields(models.Ride, schemas.RideOut)),
+):
+    if fieldset:
+        return fieldset.response(fieldset.query(db).order_by(models.Ride.date).all())
+    return (
+        db.query(models.Ride)
+        .options(selectinload(models.Ride.route), selectinload(models.Ride.driver))
+        .order_by(models.Ride.date)
+        .all()
+    )
 
 
 @router.post("", response_model=schemas.RideOut)
@@ -26,13 +43,65 @@ def create_ride(body: schemas.RideCreate, db: Session = Depends(get_db), _=Depen
         vehicle=body.vehicle,
         price=body.price,
         status="active",
+        parcel_capacity=body.parcel_capacity,
+        parcel_weight_kg=body.parcel_weight_kg,
+        parcel_volume_l=body.parcel_volume_l,
     )
     db.add(ride)
+    db.flush()
+    aggregates.ride_added(db, ride)
     db.commit()
     db.refresh(ride)
     return ride
 
 
+@router.get("/assignment-plan", response_model=schemas.AssignmentPlanOut)
+def assignment_plan(
+    date_from: Optional[date] = None,
+    days: int = 7,
+    rest_hours: float = scheduling.REST_HOURS,
+    keep_assigned: bool = True,
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """Proposed drivers and vehicles for the upcoming rides; nothing is saved."""
+    if not 1 <= days <= 31:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 31")
+    return scheduling.propose(db, date_from, days, rest_hours, keep_assigned)
+
+
+@router.post("/assignment-plan/apply")
+def apply_assignment_plan(body: schemas.AssignmentApply, db: Session = Depends(get_db), _=Depends(require_admin)):
+    """Save a (possibly edited) plan in one transaction; rejected if it breaks rest time or double-books a vehicle."""
+    if not body.assignments:
+        return {"ok": True, "updated": 0}
+    ride_ids = [a.ride_id for a in body.assignments]
+    if len(set(ride_ids)) != len(ride_ids):
+        raise HTTPException(status_code=400, detail="Duplicate ride in plan")
+    found = {r for (r,) in db.query(models.Ride.id).filter(models.Ride.id.in_(ride_ids))}
+    missing = [r for r in ride_ids if r not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Rides not found: {missing}")
+    driver_ids = {a.driver_id for a in body.assignments if a.driver_id is not None}
+    drivers = {
+        u for (u,) in db.query(models.User.id).filter(models.User.id.in_(driver_ids), models.User.role == "driver")
+    }
+    if driver_ids - drivers:
+        raise HTTPException(status_code=404, detail=f"Drivers not found: {sorted(driver_ids - drivers)}")
+
+    conflicts = scheduling.conflicts_for(db, {a.ride_id: a.driver_id for a in body.assignments}, body.rest_hours)
+    if conflicts:
+        raise HTTPException(status_code=409, detail={"message": "Rest time conflicts", "rides": conflicts})
+    overlaps = scheduling.vehicle_conflicts_for(db, {a.ride_id: a.vehicle for a in body.assignments})
+    if overlaps:
+        raise HTTPException(status_code=409, detail={"message": "Vehicle conflicts", "rides": overlaps})
+    db.execute(update(models.Ride), [
+        {"id": a.ride_id, "driver_id": a.driver_id, "vehicle": a.vehicle} for a in body.assignments
+    ])
+    db.commit()
+    return {"ok": True, "updated": len(ride_ids)}
+
+
 @router.get("/{ride_id}", response_model=schemas.RideOut)
 def get_ride(ride_id: int, db: Session = Depends(get_db)):
     ride = db.query(models.Ride).filter(models.Ride.id == ride_id).first()
@@ -66,13 +135,30 @@ def delete_ride(ride_id: int, db: Session = Depends(get_db), _=Depends(require_a
     ride = db.query(models.Ride).filter(models.Ride.id == ride_id).first()
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not found")
+    aggregates.ride_removed(db, ride)
+    tracking.forget(db, [ride.id])
     db.delete(ride)
     db.commit()
     return {"ok": True}
 
 
 @router.get("/{ride_id}/bookings", response_model=List[schemas.BookingOut])
-def ride_bookings(ride_id: int, db: Session = Depends(get_db)):
+def ride_bookings(
+    ride_id: int,
+    include_cancelled: bool = Query(False),
+    db: Session = Depends(get_db),
+    fieldset: Optional[Fieldset] = Depends(sparse_fields(models.Booking, schemas.BookingOut)),
+):
     if not db.query(models.Ride).filter(models.Ride.id == ride_id).first():
         raise HTTPException(status_code=404, detail="Ride not found")
-    return db.query(models.Booking).filter(models.Booking.ride_id == ride_id).all()
+    where = [models.Booking.ride_id == ride_id]
+    if not include_cancelled:
+        where.append(models.Booking.status != "cancelled")
+    if fieldset:
+        return fieldset.response(fieldset.query(db).filter(*where).all())
+    return (
+        db.query(models.Booking)
+        .options(selectinload(models.Booking.from_stop), selectinload(models.Booking.to_stop))
+        .filter(*where)
+        .all()
+    )
@@ -1,31 +1,59 @@
+import math
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
 import models, schemas
+import aggregates
+import distances
+import spatial
+import tracking
+from geocoding import gazetteer_lookup
+import profiling
 from database import get_db
 from auth import require_admin
+from fieldsets import Fieldset, sparse_fields
 
-router = APIRouter(prefix="/api/routes", tags=["routes"])
+router = APIRouter(prefix="/api/routes", tags=["routes"], route_class=profiling.ProfiledRoute)
+
+
+def _stop_coords(s: schemas.StopCreate):
+    """Fill missing stop coordinates from the offline gazetteer."""
+    if s.lat is not None and s.lng is not None:
+        return s.lat, s.lng
+    hit = gazetteer_lookup(f"{s.city}, {s.country}")
+    return (hit.lat, hit.lng) if hit else (s.lat, s.lng)
+
+
+def _matrix_json(m, decimals: int):
+    """Unreachable pairs are inf, which JSON cannot carry; they become null."""
+    return [[v if math.isfinite(v) else None for v in row] for row in m.round(decimals).tolist()]
 
 
 @router.get("", response_model=List[schemas.RouteOut])
-def list_routes(db: Session = Depends(get_db)):
-    return db.query(models.Route).order_by(models.Route.id).all()
+def list_routes(
+    db: Session = Depends(get_db),
+    fieldset: Optional[Fieldset] = Depends(sparse_fields(models.Route, schemas.RouteOut)),
+):
+    if fieldset:
+        return fieldset.response(fieldset.query(db).order_by(models.Route.id).all())
+    return db.query(models.Route).options(selectinload(models.Route.stops)).order_by(models.Route.id).all()
 
 
 @router.post("", response_model=schemas.RouteOut)
 def create_route(body: schemas.RouteCreate, db: Session = Depends(get_db), _=Depends(require_admin)):
-    route = models.Route(name=body.name, direction=body.direction, is_active=body.is_active)
+    route = models.Route(name=body.name, direction=body.direction, is_active=body.is_active, tolls=body.tolls)
     db.add(route)
     db.flush()
     for i, s in enumerate(body.stops):
+        lat, lng = _stop_coords(s)
         db.add(models.Stop(
             route_id=route.id, city=s.city, country=s.country,
             order=s.order if s.order is not None else i,
-            pickup=s.pickup, dropoff=s.dropoff, lat=s.lat, lng=s.lng,
+            pickup=s.pickup, dropoff=s.dropoff, lat=lat, lng=lng,
         ))
     db.commit()
     db.refresh(route)
+    spatial.stops.replace_route(route.id, route.stops)
     return route
 
 
@@ -37,6 +65,19 @@ def get_route(route_id: int, db: Session = Depends(get_db)):
     return route
 
 
+@router.get("/{route_id}/matrix", response_model=schemas.RouteMatrixOut)
+def get_route_matrix(route_id: int, db: Session = Depends(get_db), _=Depends(require_admin)):
+    """Stop-to-stop road distance (km) and duration (min) for stops with coordinates; null where unreachable."""
+    if not db.query(models.Route.id).filter(models.Route.id == route_id).first():
+        raise HTTPException(status_code=404, detail="Route not found")
+    stops, dist, dur = distances.route_matrix(db, route_id)
+    return {
+        "stop_ids": [s.id for s in stops],
+        "distance_km": _matrix_json(dist, 2),
+        "duration_min": _matrix_json(dur, 1),
+    }
+
+
 @router.put("/{route_id}", response_model=schemas.RouteOut)
 def update_route(route_id: int, body: schemas.RouteUpdate, db: Session = Depends(get_db), _=Depends(require_admin)):
     route = db.query(models.Route).filter(models.Route.id == route_id).first()
@@ -45,15 +86,19 @@ def update_route(route_id: int, body: schemas.RouteUpdate, db: Session = Depends
     route.name = body.name
     route.direction = body.direction
     route.is_active = body.is_active
+    if "tolls" in body.model_fields_set:    # clients that predate tolls leave them alone
+        route.tolls = body.tolls
     db.query(models.Stop).filter(models.Stop.route_id == route_id).delete()
     for i, s in enumerate(body.stops):
+        lat, lng = _stop_coords(s)
         db.add(models.Stop(
             route_id=route_id, city=s.city, country=s.country,
             order=s.order if s.order is not None else i,
-            pickup=s.pickup, dropoff=s.dropoff, lat=s.lat, lng=s.lng,
+            pickup=s.pickup, dropoff=s.dropoff, lat=lat, lng=lng,
         ))
     db.commit()
     db.refresh(route)
+    spatial.stops.replace_route(route_id, route.stops)
     return route
 
 
@@ -62,6 +107,10 @@ def delete_route(route_id: int, db: Session = Depends(get_db), _=Depends(require
     route = db.query(models.Route).filter(models.Route.id == route_id).first()
     if not route:
         raise HTTPException(status_code=404, detail="Route not found")
+    for ride in route.rides:
+        aggregates.ride_removed(db, ride)
+    tracking.forget(db, [ride.id for ride in route.rides])
     db.delete(route)
     db.commit()
+    spatial.stops.replace_route(route_id, [])
     return {"ok": True}
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+import schemas
+import search
+import profiling
+from database import get_db
+from auth import require_admin
+
+router = APIRouter(prefix="/api/search", tags=["search"], route_class=profiling.ProfiledRoute)
+
+KINDS = {"all": ("bookings", "parcels"), "bookings": ("bookings",), "parcels": ("parcels",)}
+
+
+@router.get("", response_model=schemas.SearchOut)
+def search_all(
+    q: str = Query(..., max_length=200),
+    kind: str = Query("all"),
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """Ranked matches on names, phones (any part of the number), comments, NP offices and descriptions.
+
+    Only the newest 500 matches of each kind are ranked (search.CANDIDATES),
+    so an older, better match can be missing from a broad query; add terms,
+    or use `q` on /api/bookings or /api/parcels, which filters all rows.
+    """
+    if kind not in KINDS:
+        raise HTTPException(status_code=400, detail="Invalid kind")
+    try:
+        found = search.search(db, q, KINDS[kind], limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"query": q, **found}
@@ -0,0 +1,106 @@
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Tuple
+import models, schemas
+import geocoding
+import spatial
+import profiling
+from database import get_db
+from auth import require_admin
+
+router = APIRouter(prefix="/api/spatial", tags=["spatial"], route_class=profiling.ProfiledRoute)
+
+
+# The handlers are async for the geocoder; their database work runs in the threadpool
+
+async def _point(db: Session, lat: Optional[float], lng: Optional[float], address: Optional[str]) -> Tuple[float, float]:
+    if lat is not None and lng is not None:
+        return lat, lng
+    if not address:
+        raise HTTPException(status_code=400, detail="Pass lat/lng or address")
+    result = await geocoding.geocoder.geocode(db, address)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Address not found: {address}")
+    return result.lat, result.lng
+
+
+def _stops_out(db: Session, hits: List[Tuple[int, float]]) -> List[dict]:
+    if not hits:
+        return []
+    by_id = {s.id: s for s in db.query(models.Stop).filter(models.Stop.id.in_([sid for sid, _ in hits]))}
+    return [
+        {
+            "stop_id": sid, "route_id": by_id[sid].route_id, "city": by_id[sid].city,
+            "country": by_id[sid].country, "lat": by_id[sid].lat, "lng": by_id[sid].lng,
+            "distance_km": round(km, 3),
+        }
+        for sid, km in hits if sid in by_id
+    ]
+
+
+@router.get("/nearest-stop", response_model=List[schemas.NearbyStop])
+async def nearest_stop(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    address: Optional[str] = None,
+    route_id: Optional[int] = None,
+    k: int = 1,
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """Closest stop(s) to a point or address, optionally on one route."""
+    point = await _point(db, lat, lng, address)
+    return await run_in_threadpool(_nearest_stops, db, point, min(max(k, 1), 50), route_id)
+
+
+def _nearest_stops(db: Session, point: Tuple[float, float], k: int, route_id: Optional[int]) -> List[dict]:
+    spatial.stops.ensure(db)
+    return _stops_out(db, spatial.stops.nearest(*point, k=k, route_id=route_id))
+
+
+@router.get("/nearby", response_model=schemas.NearbyOut)
+async def nearby(
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    address: Optional[str] = None,
+    radius_km: float = 5.0,
+    date_from: Optional[date] = None,
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """Stops within radius_km, and passengers of upcoming rides picked up at them."""
+    if not 0 < radius_km <= 200:
+        raise HTTPException(status_code=400, detail="radius_km must be in (0, 200]")
+    point = await _point(db, lat, lng, address)
+    return await run_in_threadpool(_nearby, db, point, radius_km, date_from)
+
+
+def _nearby(db: Session, point: Tuple[float, float], radius_km: float, date_from: Optional[date]) -> dict:
+    spatial.stops.ensure(db)
+    hits = spatial.stops.within(*point, radius_km)
+    passengers = []
+    if hits:
+        km_by_stop = dict(hits)
+        rows = (
+            db.query(models.Booking, models.Ride.date)
+            .join(models.Ride, models.Ride.id == models.Booking.ride_id)
+            .filter(
+                models.Booking.from_stop_id.in_(list(km_by_stop)),
+                models.Booking.status == "confirmed",
+                models.Ride.status != "cancelled",
+                models.Ride.date >= (date_from or date.today()),
+            )
+            .order_by(models.Ride.date, models.Booking.id)
+            .all()
+        )
+        passengers = [
+            {
+                "booking_id": b.id, "ride_id": b.ride_id, "date": ride_date, "name": b.name,
+                "phone": b.phone, "seats": b.seats, "stop_id": b.from_stop_id,
+                "distance_km": round(km_by_stop[b.from_stop_id], 3),
+            }
+            for b, ride_date in rows
+        ]
+    return {"stops": _stops_out(db, hits), "passengers": passengers}
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date
+import schemas
+import aggregates
+import forecast
+import jobs
+import profiling
+from database import get_db
+from auth import require_admin
+
+router = APIRouter(prefix="/api/stats", tags=["stats"], route_class=profiling.ProfiledRoute)
+
+LEVELS = {"ride", "route_day", "month"}
+
+
+@router.get("/occupancy", response_model=List[schemas.OccupancyStatOut])
+def occupancy(
+    level: str = Query("month"),
+    route_id: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    if level not in LEVELS:
+        raise HTTPException(status_code=400, detail="Invalid level")
+    return [
+        schemas.OccupancyStatOut(
+            level=s.level, key=s.key, route_id=s.route_id, period=s.period,
+            rides=s.rides, seats_total=s.seats_total, seats_sold=s.seats_sold,
+            load_factor=round(s.seats_sold / s.seats_total, 4) if s.seats_total else 0.0,
+            bookings=s.bookings, cancellations=s.cancellations, revenue=s.revenue,
+        )
+        for s in aggregates.query(db, level, route_id, date_from, date_to)
+    ]
+
+
+@router.post("/rebuild", status_code=202)
+def rebuild(db: Session = Depends(get_db), _=Depends(require_admin)):
+    """Queue a full rebuild; follow it at /api/jobs/{job_id}."""
+    job = jobs.enqueue(db, "aggregates.rebuild", dedupe=True)
+    db.commit()
+    return {"ok": True, "job_id": job.id}
+
+
+@router.get("/verify")
+def verify(db: Session = Depends(get_db), _=Depends(require_admin)):
+    problems = aggregates.verify(db)
+    return {"ok": not problems, "mismatches": problems[:100]}
+
+
+@router.get("/forecast", response_model=List[schemas.RideForecastOut])
+def demand_forecast(
+    route_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    _=Depends(require_admin),
+):
+    """Read-only: the curves are updated by the forecast.update job that booking writes queue."""
+    return forecast.predict(db, route_id=route_id)
+
+
+@router.post("/forecast/refit", status_code=202)
+def refit_forecast(db: Session = Depends(get_db), _=Depends(require_admin)):
+    """Queue a full refit; the job result has the number of rides fitted."""
+    job = jobs.enqueue(db, "forecast.refit", dedupe=True)
+    db.commit()
+    return {"ok": True, "job_id": job.id}
@@ -2,10 +2,11 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 import models, schemas
+import profiling
 from database import get_db
 from auth import require_admin, hash_password
 
-router = APIRouter(prefix="/api/users", tags=["users"])
+router = APIRouter(prefix="/api/users", tags=["users"], route_class=profiling.ProfiledRoute)
 
 
 @router.get("", response_model=List[schemas.UserOut])
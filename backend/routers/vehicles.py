@@ -1,20 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from datetime import date as date_type
 
 from database import get_db
 from auth import get_current_user
 import models, schemas
+import maintenance
+import profiling
 
-router = APIRouter(prefix="/api/vehicles", tags=["vehicles"])
+router = APIRouter(prefix="/api/vehicles", tags=["vehicles"], route_class=profiling.ProfiledRoute)
 
 
 # ── Vehicles ──────────────────────────────────────────────────────────────────
 
+def _with_summary(v: models.Vehicle, summary: Optional[dict]) -> schemas.VehicleOut:
+    out = schemas.VehicleOut.model_validate(v)
+    if not summary:
+        return out
+    return out.model_copy(update={
+        "record_count": summary["record_count"],
+        "total_cost": summary["total_cost"],
+        "last_service": [schemas.MaintenanceSummaryOut.model_validate(s) for s in summary["last_service"]],
+    })
+
+
 @router.get("", response_model=List[schemas.VehicleOut])
 def list_vehicles(db: Session = Depends(get_db), _=Depends(get_current_user)):
-    return db.query(models.Vehicle).all()
+    vehicles = db.query(models.Vehicle).order_by(models.Vehicle.id).all()
+    summary = maintenance.summaries(db)
+    return [_with_summary(v, summary.get(v.id)) for v in vehicles]
 
 
 @router.post("", response_model=schemas.VehicleOut)
@@ -35,7 +50,7 @@ def update_vehicle(vehicle_id: int, data: schemas.VehicleUpdate, db: Session = D
         setattr(v, k, val)
     db.commit()
     db.refresh(v)
-    return v
+    return _with_summary(v, maintenance.summaries(db, [v.id]).get(v.id))
 
 
 @router.delete("/{vehicle_id}")
@@ -50,17 +65,36 @@ def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db), _=Depends(get
 
 # ── Maintenance records ────────────────────────────────────────────────────────
 
-@router.get("/{vehicle_id}/maintenance", response_model=List[schemas.MaintenanceRecordOut])
-def list_maintenance(vehicle_id: int, db: Session = Depends(get_db), _=Depends(get_current_user)):
+@router.get("/maintenance/due", response_model=List[schemas.MaintenanceDueOut])
+def maintenance_due(
+    within_km: int = Query(1000, ge=0),
+    within_days: int = Query(14, ge=0),
+    db: Session = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    return maintenance.due(db, within_km, within_days)
+
+
+@router.get("/{vehicle_id}/maintenance", response_model=schemas.MaintenancePage)
+def list_maintenance(
+    vehicle_id: int,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    db: Session = Depends(get_db),
+    _=Depends(get_current_user),
+):
     v = db.get(models.Vehicle, vehicle_id)
     if not v:
         raise HTTPException(404, "Vehicle not found")
-    return (
-        db.query(models.MaintenanceRecord)
-        .filter_by(vehicle_id=vehicle_id)
-        .order_by(models.MaintenanceRecord.mileage.desc())
-        .all()
-    )
+    after = None
+    if cursor:
+        try:
+            mileage, record_id = cursor.split(":", 1)
+            after = (int(mileage), int(record_id))
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+    items, last = maintenance.history_page(db, vehicle_id, limit, after)
+    return {"items": items, "next_cursor": f"{last[0]}:{last[1]}" if last else None}
 
 
 @router.post("/{vehicle_id}/maintenance", response_model=schemas.MaintenanceRecordOut)
@@ -73,6 +107,8 @@ def add_maintenance(vehicle_id: int, data: schemas.MaintenanceRecordCreate, db:
     # Update current mileage if this record is newer
     if data.mileage > v.mileage_current:
         v.mileage_current = data.mileage
+    db.flush()
+    maintenance.refresh(db, vehicle_id, rec.work_type)
     db.commit()
     db.refresh(rec)
     return rec
@@ -84,5 +120,7 @@ def delete_maintenance(record_id: int, db: Session = Depends(get_db), _=Depends(
     if not rec:
         raise HTTPException(404, "Record not found")
     db.delete(rec)
+    db.flush()
+    maintenance.refresh(db, rec.vehicle_id, rec.work_type)
     db.commit()
     return {"ok": True}
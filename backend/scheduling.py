@@ -0,0 +1,348 @@
+"""
+Weekly driver and vehicle assignment.
+
+Every ride is one leg between the countries. A crew that finishes a
+UA->CZ ride is in Czechia, so its next ride has to go the other way.
+Ride j can follow ride i in one schedule when it runs in the opposite
+direction and departs at least `rest_hours` after i arrives. A ride
+departs at DEPARTURE_HOUR on its date, and its duration comes from the
+route's stop-to-stop matrix.
+
+The "can follow" edges form a DAG. A maximum bipartite matching on it
+(Hopcroft-Karp) gives the fewest chains that cover every ride (min path
+cover = rides - matching). Each chain then gets one driver and one
+vehicle. Rides that already have a driver or a recognised vehicle keep
+it, and chains are cut wherever they would join rides pinned to
+different drivers or vehicles.
+"""
+import math
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+import distances
+import models
+
+DEPARTURE_HOUR = 8
+REST_HOURS = 24
+MAX_IDLE_HOURS = 7 * 24     # longer gaps are not worth chaining
+DEFAULT_TRIP_HOURS = 24     # routes without stop coordinates
+
+
+@dataclass
+class PlanRide:
+    id: int
+    route_id: int
+    date: date
+    direction: str
+    depart: float           # hours since 0001-01-01
+    arrive: float
+    driver_id: Optional[int]
+    vehicle_id: Optional[int]
+
+
+def trip_hours(db: Session, route_ids: Sequence[int]) -> Dict[int, float]:
+    """Driving time along each route's stops, from the distance matrix."""
+    out = {}
+    for route_id in set(route_ids):
+        stops, _, dur = distances.route_matrix(db, route_id)
+        n = len(stops)
+        minutes = float(dur[np.arange(n - 1), np.arange(1, n)].sum()) if n > 1 else 0.0
+        out[route_id] = minutes / 60 if minutes > 0 else DEFAULT_TRIP_HOURS
+    return out
+
+
+def follows(a: PlanRide, b: PlanRide, rest_hours: float = REST_HOURS) -> bool:
+    """Can the crew of ride a take ride b next?"""
+    gap = b.depart - a.arrive
+    return a.direction != b.direction and rest_hours <= gap <= MAX_IDLE_HOURS
+
+
+def clashes(a: PlanRide, b: PlanRide, rest_hours: float = REST_HOURS) -> bool:
+    """True when one crew cannot do ride a and then ride b (b departing later).
+
+    Either the rest is too short, or b runs in the same direction before
+    the crew could have got back by other means.
+    """
+    gap = b.depart - a.arrive
+    return gap < rest_hours or (a.direction == b.direction and gap < MAX_IDLE_HOURS)
+
+
+def max_matching(adj: List[List[int]], n_right: int) -> List[int]:
+    """Hopcroft-Karp; adj[u] lists right vertices in order of preference. Returns match of each left vertex or -1."""
+    n = len(adj)
+    match_l = [-1] * n
+    match_r = [-1] * n_right
+    for u in range(n):
+        for v in adj[u]:
+            if match_r[v] == -1:
+                match_l[u], match_r[v] = v, u
+                break
+    inf = n + 1
+    while True:
+        dist = [inf] * n
+        queue = deque()
+        for u in range(n):
+            if match_l[u] == -1:
+                dist[u] = 0
+                queue.append(u)
+        found = False
+        while queue:
+            u = queue.popleft()
+            for v in adj[u]:
+                w = match_r[v]
+                if w == -1:
+                    found = True
+                elif dist[w] == inf:
+                    dist[w] = dist[u] + 1
+                    queue.append(w)
+        if not found:
+            return match_l
+
+        pos = [0] * n
+        for root in range(n):
+            if match_l[root] != -1:
+                continue
+            stack, via = [root], []
+            while stack:
+                u = stack[-1]
+                step = None
+                while pos[u] < len(adj[u]):
+                    v = adj[u][pos[u]]
+                    pos[u] += 1
+                    w = match_r[v]
+                    if w == -1 or dist[w] == dist[u] + 1:
+                        step = (v, w)
+                        break
+                if step is None:
+                    dist[u] = inf
+                    stack.pop()
+                    if via:
+                        via.pop()
+                    continue
+                v, w = step
+                via.append(v)
+                if w == -1:
+                    for uu, vv in zip(stack, via):
+                        match_l[uu], match_r[vv] = vv, uu
+                    break
+                stack.append(w)
+
+
+def chains(rides: List[PlanRide], rest_hours: float = REST_HOURS) -> List[List[int]]:
+    """Minimum path cover of the "can follow" DAG; rides must be sorted by departure."""
+    n = len(rides)
+    depart = np.array([r.depart for r in rides])
+    adj = []
+    for i, a in enumerate(rides):
+        lo = np.searchsorted(depart, a.arrive + rest_hours, side="left")
+        hi = np.searchsorted(depart, a.arrive + MAX_IDLE_HOURS, side="right")
+        # Shortest gap first keeps crews busy and leaves later rides for others
+        adj.append([j for j in range(lo, hi) if follows(a, rides[j], rest_hours)])
+    succ = max_matching(adj, n)
+    has_pred = set(v for v in succ if v != -1)
+    out = []
+    for start in range(n):
+        if start in has_pred:
+            continue
+        chain, i = [], start
+        while i != -1:
+            chain.append(i)
+            i = succ[i]
+        out.append(chain)
+    return out
+
+
+def _feasible(seq: List[int], rides: List[PlanRide], rest_hours: float) -> bool:
+    return not any(clashes(rides[a], rides[b], rest_hours) for a, b in zip(seq, seq[1:]))
+
+
+def _assign(
+    cover: List[List[int]],
+    pinned: Dict[int, int],
+    resources: List[int],
+    rides: List[PlanRide],
+    rest_hours: float,
+) -> Dict[int, int]:
+    """Map ride index -> resource (driver or vehicle id), honouring pins."""
+    pieces: List[Tuple[Optional[int], List[int]]] = []
+    for chain in cover:
+        cur, owner = [], None
+        for i in chain:
+            p = pinned.get(i)
+            if p is not None and owner is not None and p != owner:
+                pieces.append((owner, cur))
+                cur, owner = [], None
+            cur.append(i)
+            owner = p if p is not None else owner
+        pieces.append((owner, cur))
+
+    by_owner, free = defaultdict(list), []
+    for owner, piece in pieces:
+        (by_owner[owner] if owner is not None else free).append(piece)
+
+    out = {}
+    for owner, group in by_owner.items():
+        group.sort(key=len, reverse=True)
+        merged = group[0]
+        for extra in group[1:]:
+            candidate = sorted(merged + extra)
+            if _feasible(candidate, rides, rest_hours):
+                merged = candidate
+                continue
+            # Keep the existing pins; hand the rest of the piece back to the pool
+            cur = []
+            for i in extra:
+                if pinned.get(i) == owner:
+                    out[i] = owner
+                    if cur:
+                        free.append(cur)
+                    cur = []
+                else:
+                    cur.append(i)
+            if cur:
+                free.append(cur)
+        for i in merged:
+            out[i] = owner
+
+    idle = [r for r in resources if r not in by_owner]
+    free.sort(key=len, reverse=True)
+    for resource, piece in zip(idle, free):
+        for i in piece:
+            out[i] = resource
+    return out
+
+
+def _conflicts(assigned: Dict[int, int], rides: List[PlanRide], rest_hours: float) -> List[Tuple[int, int]]:
+    per = defaultdict(list)
+    for i, resource in assigned.items():
+        per[resource].append(i)
+    out = []
+    for seq in per.values():
+        seq.sort()
+        out += [(rides[a].id, rides[b].id) for a, b in zip(seq, seq[1:]) if clashes(rides[a], rides[b], rest_hours)]
+    return out
+
+
+def _vehicle_lookup(db: Session) -> Tuple[Dict[str, int], Dict[int, str]]:
+    """Ride.vehicle is free text: match it against vehicle name or plate."""
+    by_key, names = {}, {}
+    for vid, name, plate in db.query(models.Vehicle.id, models.Vehicle.name, models.Vehicle.plate):
+        names[vid] = name
+        for key in (name, plate):
+            if key:
+                by_key[key.strip().lower()] = vid
+    return by_key, names
+
+
+def load_rides(db: Session, date_from: date, date_to: date) -> List[PlanRide]:
+    rows = (
+        db.query(models.Ride, models.Route.direction)
+        .join(models.Route, models.Route.id == models.Ride.route_id)
+        .filter(models.Ride.date >= date_from, models.Ride.date <= date_to, models.Ride.status != "cancelled")
+        .all()
+    )
+    hours = trip_hours(db, [r.route_id for r, _ in rows])
+    vehicle_ids, _ = _vehicle_lookup(db)
+    rides = []
+    for ride, direction in rows:
+        depart = ride.date.toordinal() * 24.0 + DEPARTURE_HOUR
+        rides.append(PlanRide(
+            id=ride.id, route_id=ride.route_id, date=ride.date, direction=direction,
+            depart=depart, arrive=depart + hours[ride.route_id],
+            driver_id=ride.driver_id,
+            vehicle_id=vehicle_ids.get((ride.vehicle or "").strip().lower()),
+        ))
+    rides.sort(key=lambda r: (r.depart, r.id))
+    return rides
+
+
+def propose(
+    db: Session,
+    date_from: Optional[date] = None,
+    days: int = 7,
+    rest_hours: float = REST_HOURS,
+    keep_assigned: bool = True,
+) -> dict:
+    date_from = date_from or date.today()
+    date_to = date_from + timedelta(days=days - 1)
+    rides = load_rides(db, date_from, date_to)
+    drivers = {u.id: u.full_name or u.username for u in db.query(models.User).filter(models.User.role == "driver")}
+    _, vehicle_names = _vehicle_lookup(db)
+
+    cover = chains(rides, rest_hours)
+    pinned_drivers = {i: r.driver_id for i, r in enumerate(rides) if keep_assigned and r.driver_id in drivers}
+    pinned_vehicles = {i: r.vehicle_id for i, r in enumerate(rides) if keep_assigned and r.vehicle_id is not None}
+    by_driver = _assign(cover, pinned_drivers, sorted(drivers), rides, rest_hours)
+    by_vehicle = _assign(cover, pinned_vehicles, sorted(vehicle_names), rides, rest_hours)
+
+    assignments = []
+    for i, r in enumerate(rides):
+        driver_id, vehicle_id = by_driver.get(i), by_vehicle.get(i)
+        assignments.append({
+            "ride_id": r.id,
+            "route_id": r.route_id,
+            "date": r.date,
+            "direction": r.direction,
+            "driver_id": driver_id,
+            "driver_name": drivers.get(driver_id),
+            "vehicle_id": vehicle_id,
+            "vehicle": vehicle_names.get(vehicle_id),
+            "current_driver_id": r.driver_id,
+        })
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "rest_hours": rest_hours,
+        "rides": len(rides),
+        "crews_needed": len(cover),
+        "assignments": assignments,
+        "unassigned_driver": [r.id for i, r in enumerate(rides) if i not in by_driver],
+        "unassigned_vehicle": [r.id for i, r in enumerate(rides) if i not in by_vehicle],
+        "driver_conflicts": _conflicts(by_driver, rides, rest_hours),
+        "vehicle_conflicts": _conflicts(by_vehicle, rides, rest_hours),
+    }
+
+
+def _around(db: Session, ride_ids: Sequence[int]) -> List[PlanRide]:
+    """The given rides and every ride close enough to clash with them."""
+    dates = [d for (d,) in db.query(models.Ride.date).filter(models.Ride.id.in_(list(ride_ids)))]
+    if not dates:
+        return []
+    margin = timedelta(days=math.ceil(MAX_IDLE_HOURS / 24))
+    return load_rides(db, min(dates) - margin, max(dates) + margin)
+
+
+def conflicts_for(
+    db: Session, drivers: Dict[int, Optional[int]], rest_hours: float = REST_HOURS,
+) -> List[Tuple[int, int]]:
+    """Rest-time conflicts the {ride id: driver id} changes would create in the driver schedules."""
+    rides = _around(db, list(drivers))
+    for r in rides:
+        r.driver_id = drivers.get(r.id, r.driver_id)
+    assigned = {i: r.driver_id for i, r in enumerate(rides) if r.driver_id is not None}
+    touched = set(drivers)
+    return [pair for pair in _conflicts(assigned, rides, rest_hours) if touched & set(pair)]
+
+
+def vehicle_conflicts_for(db: Session, vehicles: Dict[int, Optional[str]]) -> List[Tuple[int, int]]:
+    """Rides the {ride id: vehicle} changes would give to one vehicle that cannot make both.
+
+    A vehicle needs no rest, but it cannot be on two rides at once, and it
+    is on the wrong side of the border for a second ride in the same
+    direction. Vehicles not in the fleet are told apart by their text.
+    """
+    rides = _around(db, list(vehicles))
+    by_key, _ = _vehicle_lookup(db)
+    current = dict(db.query(models.Ride.id, models.Ride.vehicle).filter(models.Ride.id.in_([r.id for r in rides])))
+    assigned = {}
+    for i, r in enumerate(rides):
+        key = ((vehicles[r.id] if r.id in vehicles else current.get(r.id)) or "").strip().lower()
+        if key:
+            assigned[i] = by_key.get(key, key)
+    touched = set(vehicles)
+    return [pair for pair in _conflicts(assigned, rides, 0) if touched & set(pair)]
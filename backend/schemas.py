@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import date, datetime
 
 
@@ -50,6 +50,7 @@ class RouteBase(BaseModel):
     name:      str
     direction: str
     is_active: bool = True
+    tolls:     Optional[float] = None
 
 class RouteCreate(RouteBase):
     stops: List[StopCreate] = []
@@ -62,6 +63,11 @@ class RouteOut(RouteBase):
     stops: List[StopOut] = []
     model_config = {"from_attributes": True}
 
+class RouteMatrixOut(BaseModel):
+    stop_ids:     List[int]
+    distance_km:  List[List[Optional[float]]]   # null: no road between the stops
+    duration_min: List[List[Optional[float]]]
+
 class RouteShort(BaseModel):
     id:        int
     name:      str
@@ -78,6 +84,9 @@ class RideBase(BaseModel):
     seats_total: int
     vehicle:     Optional[str] = None
     price:       Optional[int] = None
+    parcel_capacity:  Optional[int] = None
+    parcel_weight_kg: Optional[float] = None
+    parcel_volume_l:  Optional[float] = None
 
 class RideCreate(RideBase):
     pass
@@ -85,12 +94,45 @@ class RideCreate(RideBase):
 class RideOut(RideBase):
     id:         int
     seats_free: int
+    seats_held: int = 0
     status:     str
     driver_id:  Optional[int] = None
     driver:     Optional[UserOut] = None
     route:      RouteShort
     model_config = {"from_attributes": True}
 
+class AssignmentOut(BaseModel):
+    ride_id:           int
+    route_id:          int
+    date:              date
+    direction:         str
+    driver_id:         Optional[int] = None
+    driver_name:       Optional[str] = None
+    vehicle_id:        Optional[int] = None
+    vehicle:           Optional[str] = None
+    current_driver_id: Optional[int] = None
+
+class AssignmentPlanOut(BaseModel):
+    date_from:          date
+    date_to:            date
+    rest_hours:         float
+    rides:              int
+    crews_needed:       int
+    assignments:        List[AssignmentOut]
+    unassigned_driver:  List[int]
+    unassigned_vehicle: List[int]
+    driver_conflicts:   List[List[int]]
+    vehicle_conflicts:  List[List[int]]
+
+class AssignmentIn(BaseModel):
+    ride_id:   int
+    driver_id: Optional[int] = None
+    vehicle:   Optional[str] = None
+
+class AssignmentApply(BaseModel):
+    assignments: List[AssignmentIn]
+    rest_hours:  float = 24
+
 
 # ── Booking ───────────────────────────────────────────────────────────────────
 
@@ -104,7 +146,7 @@ class BookingBase(BaseModel):
     comment:      Optional[str] = None
 
 class BookingCreate(BookingBase):
-    pass
+    hold_id: Optional[str] = None   # seat hold to book from (see holds.py)
 
 class BookingUpdate(BaseModel):
     seats:   Optional[int] = None
@@ -130,19 +172,77 @@ class ParcelBase(BaseModel):
     np_office:      str
     description:    Optional[str] = None
     ride_id:        Optional[int] = None
+    weight_kg:      Optional[float] = None
+    volume_l:       Optional[float] = None
+    deadline:       Optional[date] = None
 
 class ParcelCreate(ParcelBase):
     pass
 
 class ParcelStatusUpdate(BaseModel):
+    status:  str
+    ride_id: Optional[int] = None
+    lat:     Optional[float] = None
+    lng:     Optional[float] = None
+    note:    Optional[str] = None
+
+class ParcelTransition(BaseModel):
+    ride_id: int
+    status:  str                     # "in_transit" | "delivered"
+    lat:     Optional[float] = None  # default: the van's last GPS fix
+    lng:     Optional[float] = None
+    note:    Optional[str] = None
+
+class ParcelEventOut(BaseModel):
     status: str
+    at:     datetime
+    lat:    Optional[float] = None
+    lng:    Optional[float] = None
+    note:   Optional[str] = None
+
+class ParcelTrackingOut(BaseModel):
+    tracking_code: str
+    direction:     str
+    status:        str
+    created_at:    Optional[datetime] = None
+    np_office:     str
+    events:        List[ParcelEventOut]
 
 class ParcelOut(ParcelBase):
-    id:         int
-    status:     str
-    created_at: datetime
+    id:                int
+    status:            str
+    tracking_code:     Optional[str] = None
+    status_changed_at: Optional[datetime] = None
+    created_at:        datetime
     model_config = {"from_attributes": True}
 
+class ParcelAllocation(BaseModel):
+    parcel_id: int
+    ride_id:   Optional[int] = None
+
+class ParcelUnallocated(BaseModel):
+    parcel_id: int
+    reason:    str   # "no_ride" | "deadline" | "capacity"
+
+class RideParcelLoad(BaseModel):
+    ride_id:            int
+    date:               date
+    direction:          str
+    parcels:            int
+    weight_kg:          float
+    volume_l:           float
+    capacity:           int
+    weight_capacity_kg: float
+    volume_capacity_l:  float
+
+class AllocationOut(BaseModel):
+    dry_run:     bool
+    considered:  int
+    changed:     int
+    assignments: List[ParcelAllocation]
+    unallocated: List[ParcelUnallocated]
+    rides:       List[RideParcelLoad]
+
 
 # ── Vehicle ───────────────────────────────────────────────────────────────────
 
@@ -167,6 +267,7 @@ class VehicleCreate(BaseModel):
     model_name:      Optional[str] = None
     year:            Optional[int] = None
     mileage_current: int = 0
+    fuel_l100:       Optional[float] = None
     notes:           Optional[str] = None
 
 class VehicleUpdate(BaseModel):
@@ -176,14 +277,194 @@ class VehicleUpdate(BaseModel):
     model_name:      Optional[str] = None
     year:            Optional[int] = None
     mileage_current: Optional[int] = None
+    fuel_l100:       Optional[float] = None
     notes:           Optional[str] = None
 
+class MaintenanceDueOut(BaseModel):
+    vehicle_id:             int
+    vehicle_name:           str
+    plate:                  str
+    work_type:              str
+    record_id:              int
+    last_date:              date
+    last_mileage:           int
+    next_service_km:        int
+    mileage_current:        int
+    remaining_km:           int
+    projected_mileage:      int
+    projected_remaining_km: int
+    projected_due_date:     Optional[date] = None
+    overdue:                bool
+
+class MaintenanceSummaryOut(BaseModel):
+    work_type:       str
+    record_id:       int
+    last_date:       date
+    last_mileage:    int
+    next_service_km: Optional[int] = None
+    model_config = {"from_attributes": True}
+
+class MaintenancePage(BaseModel):
+    items:       List[MaintenanceRecordOut]
+    next_cursor: Optional[str] = None
+
 class VehicleOut(VehicleCreate):
-    id:          int
-    maintenance: List[MaintenanceRecordOut] = []
+    id:           int
+    record_count: int = 0
+    total_cost:   float = 0.0
+    last_service: List[MaintenanceSummaryOut] = []
     model_config = {"from_attributes": True}
 
 
+# ── Geocoding ─────────────────────────────────────────────────────────────────
+
+class GeocodeRequest(BaseModel):
+    addresses: List[str]
+
+class GeocodeResult(BaseModel):
+    address:   str
+    lat:       Optional[float] = None
+    lng:       Optional[float] = None
+    source:    Optional[str] = None
+    precision: Optional[str] = None
+
+
+class NearbyStop(BaseModel):
+    stop_id:     int
+    route_id:    int
+    city:        str
+    country:     str
+    lat:         float
+    lng:         float
+    distance_km: float
+
+class NearbyPassenger(BaseModel):
+    booking_id:  int
+    ride_id:     int
+    date:        date
+    name:        str
+    phone:       str
+    seats:       int
+    stop_id:     int
+    distance_km: float
+
+class NearbyOut(BaseModel):
+    stops:      List[NearbyStop]
+    passengers: List[NearbyPassenger]
+
+
+# ── GPS tracking ──────────────────────────────────────────────────────────────
+
+class PositionFixIn(BaseModel):
+    lat:       float
+    lng:       float
+    t:         Optional[datetime] = None   # device time (UTC); default: time received
+    speed_kmh: Optional[float] = None
+
+class PositionBatch(BaseModel):
+    fixes: List[PositionFixIn]
+
+class PositionOut(BaseModel):
+    ride_id:   int
+    t:         datetime
+    lat:       float
+    lng:       float
+    speed_kmh: Optional[float] = None
+
+class TrackOut(BaseModel):
+    ride_id:     int
+    points:      int
+    kept:        int
+    tolerance_m: float
+    path:        List[List[float]]   # [[lat, lng], ...]
+    times:       List[datetime]
+
+
+# ── Tour optimizer ────────────────────────────────────────────────────────────
+
+class TourPoint(BaseModel):
+    lat:   float
+    lng:   float
+    after: Optional[int] = None   # index of a point that must be visited first (pickup → drop-off)
+
+class TourRequest(BaseModel):
+    points:         List[TourPoint]
+    start:          Optional[int] = None   # fixed first point; default: easternmost
+    end:            Optional[int] = None   # fixed last point
+    time_budget_ms: int = 200
+
+class TourOut(BaseModel):
+    order:       List[int]
+    distance_km: float
+    baseline_km: float
+    elapsed_ms:  float
+
+
+# ── Profitability ─────────────────────────────────────────────────────────────
+
+class RideProfitOut(BaseModel):
+    ride_id:     int
+    route_id:    int
+    date:        date
+    seats_sold:  int
+    seats_total: int
+    distance_km: float
+    revenue:     float
+    fuel_cost:   float
+    tolls:       float
+    driver_cost: float
+    profit:      float
+
+class ProfitTotals(BaseModel):
+    rides:      int
+    seats_sold: int
+    revenue:    float
+    cost:       float
+    profit:     float
+    margin:     float
+
+class ProfitRollup(ProfitTotals):
+    key: str
+
+class ProfitabilityOut(BaseModel):
+    rides:    List[RideProfitOut]
+    by_route: List[ProfitRollup]
+    by_month: List[ProfitRollup]
+    totals:   ProfitTotals
+
+
+# ── Occupancy aggregates ──────────────────────────────────────────────────────
+
+class OccupancyStatOut(BaseModel):
+    level:         str
+    key:           str
+    route_id:      Optional[int] = None
+    period:        date
+    rides:         int
+    seats_total:   int
+    seats_sold:    int
+    load_factor:   float
+    bookings:      int
+    cancellations: int
+    revenue:       float
+
+
+# ── Forecast ──────────────────────────────────────────────────────────────────
+
+class RideForecastOut(BaseModel):
+    ride_id:         int
+    route_id:        int
+    date:            date
+    days_out:        int
+    seats_total:     int
+    booked:          int
+    forecast:        float
+    expected_load:   float
+    vehicles_needed: int
+    model:           str
+    history_rides:   int
+
+
 # ── Auth ──────────────────────────────────────────────────────────────────────
 
 class Token(BaseModel):
@@ -193,3 +474,47 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+
+
+# ── Background jobs ───────────────────────────────────────────────────────────
+
+class JobOut(BaseModel):
+    id:           int
+    kind:         str
+    status:       str
+    priority:     int
+    payload:      Any = None
+    result:       Any = None
+    attempts:     int
+    max_attempts: int
+    last_error:   Optional[str] = None
+    run_at:       datetime
+    created_at:   datetime
+    started_at:   Optional[datetime] = None
+    finished_at:  Optional[datetime] = None
+
+
+# ── Seat holds ────────────────────────────────────────────────────────────────
+
+class SeatHoldCreate(BaseModel):
+    ride_id: int
+    seats:   int = 1
+    holder:  Optional[str] = None
+
+class SeatHoldUpdate(BaseModel):
+    seats: Optional[int] = None
+
+class SeatHoldOut(BaseModel):
+    id:         str
+    ride_id:    int
+    seats:      int
+    expires_at: datetime
+    model_config = {"from_attributes": True}
+
+
+# ── Search ────────────────────────────────────────────────────────────────────
+
+class SearchOut(BaseModel):
+    query:    str
+    bookings: List[BookingOut] = []
+    parcels:  List[ParcelOut] = []
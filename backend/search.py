@@ -0,0 +1,257 @@
+"""
+Full-text search over bookings and parcels.
+
+bookings_fts and parcels_fts are FTS5 tables that use the trigram
+tokenizer. Each row's rowid is the booking or parcel id. Triggers on the
+base tables (migration 0015) keep them in sync with every writer: the
+ORM, bulk Core statements and raw SQL. Trigrams match any substring of
+three or more characters, and Unicode case folding covers Cyrillic as
+well as Latin, so "ковал" finds "Коваленко". Each index also keeps a
+digits-only copy of the phone columns, so "067 111" finds
+"+38 (067) 111-22-33".
+
+A query is split into terms, and every term must match:
+- A term that looks like a phone number is matched against the digits.
+- Any other term of three or more characters joins the MATCH expression.
+- "НП", "NP" or "№" marks a Nova Poshta office. The number after it
+  ("НП 12", "№12", "НП №12") must appear as a number of its own in the
+  parcel's np_office; for bookings it is checked like a short term.
+- Other shorter terms are too short for trigrams. They are checked as
+  case-folded substrings of the rows the index found.
+
+A query therefore needs at least one term of three or more characters,
+or three or more digits.
+
+Results are ranked by bm25 with names weighted highest, and ties go to
+the newest row. FTS5's bm25() reads each term's whole posting list for
+the IDF factor, which takes hundreds of milliseconds for a common surname
+over a million rows. Every term must match, so IDF does not tell results
+apart, and the score is computed here without it. Only the newest
+CANDIDATES matches are ranked, so broad queries stay within milliseconds.
+When a query matches more rows than that, an older row never makes the
+results however well it scores; more terms narrow the query until it
+does. The list endpoints' `q` filter (matching_ids) has no such cap.
+
+INDEXES defines both indexes. Migration 0015 creates them from it with
+create(), and rebuild() refills them.
+
+Usage: python search.py rebuild
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Integer, column, event, text
+from sqlalchemy.orm import Session, selectinload
+
+import models
+
+MIN_TERM = 3
+MAX_TERMS = 8
+CANDIDATES = 500        # newest matches that get ranked
+K1, B = 1.2, 0.75       # bm25 parameters, as in FTS5
+_PHONE = re.compile(r"^\+?[\d()\-]+$")
+_PHONE_RUN = re.compile(r"\+?\(?\d[\d\s()\-]*\d")    # "+38 (067) 111-22-33" typed with spaces
+_OFFICE_WORDS = "' ' || replace(replace(replace(np_office, '№', ' '), ',', ' '), '-', ' ') || ' '"
+_NP_OFFICE = re.compile(r"^(?:нп|np|№)+[№.:\-]*(\d*)$")     # "нп", "№12", "нп№12" (case-folded)
+_DIGITS = "replace(replace(replace(replace(replace(coalesce({}, ''), ' ', ''), '-', ''), '+', ''), '(', ''), ')', '')"
+
+
+@dataclass(frozen=True)
+class Index:
+    table: str
+    columns: Tuple[str, ...]
+    phones: Tuple[str, ...]
+    weights: Tuple[float, ...]      # rank weight per column, then for digits
+
+    @property
+    def fts(self) -> str:
+        return f"{self.table}_fts"
+
+
+INDEXES = {
+    "bookings": Index("bookings", ("name", "phone", "comment"), ("phone",), (10.0, 4.0, 1.0, 4.0)),
+    "parcels": Index(
+        "parcels",
+        ("sender", "sender_phone", "receiver", "receiver_phone", "np_office", "description"),
+        ("sender_phone", "receiver_phone"),
+        (10.0, 4.0, 10.0, 4.0, 2.0, 1.0, 4.0),
+    ),
+}
+MODELS = {"bookings": models.Booking, "parcels": models.Parcel}
+
+
+@dataclass
+class Query:
+    match: str                                          # FTS5 MATCH expression
+    short: List[str] = field(default_factory=list)     # case-folded substrings checked per row
+    terms: List[Tuple[bool, str]] = field(default_factory=list)    # (is digits, case-folded text) of `match`
+    offices: List[str] = field(default_factory=list)   # office numbers checked against np_office
+
+
+def parse(q: str) -> Query:
+    """Raises ValueError when no term is long enough to use the index."""
+    match, short, terms, offices = [], [], [], []
+    q = _PHONE_RUN.sub(lambda m: re.sub(r"\D", "", m.group()), q)
+    office_next = False
+    for term in q.split()[:MAX_TERMS]:
+        term = term.strip("\"'.,;:")
+        digits = re.sub(r"\D", "", term)
+        marker = _NP_OFFICE.match(term.casefold())
+        if marker:
+            office_next = not marker.group(1)
+            if marker.group(1):
+                offices.append(marker.group(1))
+            continue
+        if office_next and term.isdigit():
+            offices.append(term)
+            office_next = False
+            continue
+        office_next = False
+        if _PHONE.match(term) and len(digits) >= MIN_TERM:
+            match.append(f'digits : "{digits}"')
+            terms.append((True, digits))
+        elif len(term) >= MIN_TERM:
+            match.append('"' + term.replace('"', '""') + '"')
+            terms.append((False, term.casefold()))
+        elif term:
+            short.append(term.casefold())
+    if not match:
+        raise ValueError(f"Search needs a word of at least {MIN_TERM} characters or {MIN_TERM} digits")
+    return Query(" AND ".join(match), short, terms, offices)
+
+
+def _where(index: Index, query: Query) -> Tuple[str, dict]:
+    clauses, params = [f"{index.fts} MATCH :match"], {"match": query.match}
+    short, offices = query.short, query.offices
+    if "np_office" not in index.columns:
+        short, offices = short + offices, []    # e.g. "НП 12" in a booking comment
+    if short:
+        row = "casefold(" + " || ' ' || ".join(f"coalesce({c}, '')" for c in index.columns) + ")"
+        for i, term in enumerate(short):
+            clauses.append(f"instr({row}, :short{i}) > 0")
+            params[f"short{i}"] = term
+    for i, office in enumerate(offices):
+        # Whole numbers only: office 12 is not office 120
+        clauses.append(f"instr({_OFFICE_WORDS}, :office{i}) > 0")
+        params[f"office{i}"] = f" {office} "
+    return " AND ".join(clauses), params
+
+
+def _score(index: Index, query: Query, values, averages) -> float:
+    """bm25 of one row without the IDF factor; `values` are its column texts, then digits."""
+    score = 0.0
+    for digits, term in query.terms:
+        for i, value in enumerate(values):
+            if not value or digits != (i == len(values) - 1):
+                continue
+            tf = value.casefold().count(term)
+            if tf:
+                norm = 1 - B + B * len(value) / max(averages[i], 1.0)
+                score += index.weights[i] * tf * (K1 + 1) / (tf + K1 * norm)
+    return -score
+
+
+def ranked(db: Session, kind: str, query: Query, limit: int = 20) -> List[Tuple[int, float]]:
+    """(id, score) of the best matches; lower scores are better."""
+    index = INDEXES[kind]
+    where, params = _where(index, query)
+    cols = ", ".join(index.columns)
+    newest = db.execute(text(
+        f"SELECT rowid, {cols}, digits FROM {index.fts} WHERE {where} ORDER BY rowid DESC LIMIT :n"
+    ), dict(params, n=CANDIDATES)).all()
+    if not newest:
+        return []
+    averages = [sum(len(row[i] or "") for row in newest) / len(newest) for i in range(1, len(newest[0]))]
+    scored = [(row[0], _score(index, query, row[1:], averages)) for row in newest]
+    scored.sort(key=lambda r: (r[1], -r[0]))
+    return scored[:limit]
+
+
+def matching_ids(kind: str, q: str):
+    """All matching ids as a subquery, for `Model.id.in_(...)` filters on list endpoints."""
+    index = INDEXES[kind]
+    where, params = _where(index, parse(q))
+    return text(f"SELECT rowid FROM {index.fts} WHERE {where}").bindparams(**params).columns(column("rowid", Integer))
+
+
+def search(db: Session, q: str, kinds=("bookings", "parcels"), limit: int = 20) -> Dict[str, list]:
+    """{kind: [model, ...]} in rank order."""
+    query = parse(q)
+    out = {}
+    for kind in kinds:
+        ids = [i for i, _ in ranked(db, kind, query, limit)]
+        model = MODELS[kind]
+        rows = db.query(model).filter(model.id.in_(ids))
+        if model is models.Booking:
+            rows = rows.options(selectinload(models.Booking.from_stop), selectinload(models.Booking.to_stop))
+        by_id = {obj.id: obj for obj in rows}
+        out[kind] = [by_id[i] for i in ids if i in by_id]
+    return out
+
+
+def _values(index: Index, row: str) -> str:
+    """SQL for one index row of `row` (a table name, or new/old in a trigger): id, columns, digits."""
+    digits = " || ' ' || ".join(_DIGITS.format(f"{row}.{p}") for p in index.phones)
+    return ", ".join([f"{row}.id", *(f"{row}.{c}" for c in index.columns), digits])
+
+
+def create(conn):
+    """Create the FTS tables and the triggers that keep them in sync; empty until rebuild()."""
+    for index in INDEXES.values():
+        fts, cols = index.fts, ", ".join(index.columns)
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, digits, tokenize='trigram')"
+        )
+        insert = f"INSERT INTO {fts} (rowid, {cols}, digits) VALUES ({_values(index, 'new')});"
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {index.table} BEGIN {insert} END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {index.table} "
+            f"BEGIN DELETE FROM {fts} WHERE rowid = old.id; END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {index.table} "
+            f"BEGIN DELETE FROM {fts} WHERE rowid = old.id; {insert} END"
+        )
+
+
+def rebuild(conn):
+    """Refill both indexes from their tables (after bulk loads that ran without the triggers)."""
+    for index in INDEXES.values():
+        cols = ", ".join(index.columns)
+        conn.exec_driver_sql(f"DELETE FROM {index.fts}")
+        conn.exec_driver_sql(
+            f"INSERT INTO {index.fts} (rowid, {cols}, digits) "
+            f"SELECT {_values(index, index.table)} FROM {index.table}"
+        )
+        conn.exec_driver_sql(f"INSERT INTO {index.fts} ({index.fts}) VALUES ('optimize')")
+
+
+def _casefold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+def _register_functions(dbapi_connection, record):
+    # SQLite's lower() and LIKE only fold ASCII
+    dbapi_connection.create_function("casefold", 1, _casefold, deterministic=True)
+
+
+def install(engine):
+    """Register the SQL functions queries use on `engine`'s new connections."""
+    event.listen(engine, "connect", _register_functions)
+
+
+if __name__ == "__main__":
+    import sys
+    import migrations
+    from database import engine
+
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(2)
+    migrations.upgrade(engine)
+    with engine.begin() as conn:
+        rebuild(conn)
+    print("Search indexes rebuilt")
@@ -11,10 +11,12 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
 from database import SessionLocal, engine
 import models
+import aggregates
+import migrations
 from auth import hash_password
 from datetime import date
 
-models.Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
 
 db = SessionLocal()
 
@@ -72,6 +74,8 @@ if not existing_route:
         status="active",
     )
     db.add(ride)
+    db.flush()
+    aggregates.ride_added(db, ride)
     db.commit()
     print(f"Created route (id={route.id}) with {len(stops_data)} stops and 1 sample ride")
 else:
@@ -0,0 +1,194 @@
+"""
+In-memory spatial index over stop coordinates.
+
+A uniform grid (CELL_DEG degrees per cell) maps each cell to the stops
+inside it. Nearest-stop searches expand rings of cells around the query
+point and stop as soon as no unvisited cell can hold anything closer;
+radius searches only visit the cells overlapping the circle's bounding
+box. Both touch a handful of cells, independent of the number of stops.
+
+The index is built lazily from the database on first use and kept up to
+date by the routers that change stop coordinates (route create/update/
+delete and the driver's drag-to-move). Changes made by other worker
+processes are noticed through cache.versions and trigger a rebuild.
+Passengers are located through their pickup stop (Booking.from_stop_id).
+"""
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+import cache
+import models
+from geo import EARTH_RADIUS_KM
+
+CELL_DEG = 0.1
+KM_PER_DEG = math.pi * EARTH_RADIUS_KM / 180
+
+
+def _distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((p2 - p1) / 2) ** 2
+        + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return math.floor(lat / CELL_DEG), math.floor(lng / CELL_DEG)
+
+
+class StopIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._generation = 0
+        self._points: Dict[int, Tuple[float, float, int]] = {}   # stop id -> (lat, lng, route id)
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._extent: Optional[List[int]] = None   # [min row, max row, min col, max col]; only grows
+
+    # ── Maintenance ───────────────────────────────────────────────────────────
+
+    def ensure(self, db: Session):
+        # Own writes are applied incrementally; stops changed by another worker mean a rebuild
+        cache.versions.maybe_refresh()
+        if not self._built or self._generation != cache.versions.elsewhere.get("routes", 0):
+            self.rebuild(db)
+
+    def rebuild(self, db: Session):
+        rows = (
+            db.query(models.Stop.id, models.Stop.lat, models.Stop.lng, models.Stop.route_id)
+            .filter(models.Stop.lat.isnot(None), models.Stop.lng.isnot(None))
+            .all()
+        )
+        generation = cache.versions.elsewhere.get("routes", 0)
+        with self._lock:
+            self._generation = generation
+            self._points.clear()
+            self._cells.clear()
+            self._extent = None
+            for stop_id, lat, lng, route_id in rows:
+                self._add(stop_id, lat, lng, route_id)
+            self._built = True
+
+    def invalidate(self):
+        with self._lock:
+            self._built = False
+
+    def _add(self, stop_id: int, lat: float, lng: float, route_id: int):
+        self._points[stop_id] = (lat, lng, route_id)
+        key = _cell(lat, lng)
+        self._cells.setdefault(key, set()).add(stop_id)
+        if self._extent is None:
+            self._extent = [key[0], key[0], key[1], key[1]]
+        else:
+            e = self._extent
+            e[0], e[1], e[2], e[3] = min(e[0], key[0]), max(e[1], key[0]), min(e[2], key[1]), max(e[3], key[1])
+
+    def _remove(self, stop_id: int):
+        point = self._points.pop(stop_id, None)
+        if point is None:
+            return
+        key = _cell(point[0], point[1])
+        bucket = self._cells.get(key)
+        if bucket is not None:
+            bucket.discard(stop_id)
+            if not bucket:
+                del self._cells[key]
+
+    def upsert(self, stop: models.Stop):
+        """Add or move one stop (call after commit)."""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(stop.id)
+            if stop.lat is not None and stop.lng is not None:
+                self._add(stop.id, stop.lat, stop.lng, stop.route_id)
+
+    def replace_route(self, route_id: int, stops: List[models.Stop]):
+        """Swap all stops of a route (after its stops were rewritten or deleted)."""
+        with self._lock:
+            if not self._built:
+                return
+            for stop_id in [i for i, p in self._points.items() if p[2] == route_id]:
+                self._remove(stop_id)
+            for s in stops:
+                if s.lat is not None and s.lng is not None:
+                    self._add(s.id, s.lat, s.lng, route_id)
+
+    def __len__(self):
+        return len(self._points)
+
+    # ── Queries ───────────────────────────────────────────────────────────────
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int = 1,
+        route_id: Optional[int] = None,
+        max_km: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        """Up to k (stop id, km) pairs, closest first."""
+        accept: Callable[[int], bool] = (
+            (lambda sid: self._points[sid][2] == route_id) if route_id is not None else (lambda sid: True)
+        )
+        with self._lock:
+            if not self._cells:
+                return []
+            ci, cj = _cell(lat, lng)
+            e = self._extent
+            max_ring = max(abs(ci - e[0]), abs(ci - e[1]), abs(cj - e[2]), abs(cj - e[3]))
+            found: List[Tuple[float, int]] = []
+            for ring in range(max_ring + 1):
+                for key in self._ring(ci, cj, ring):
+                    for sid in self._cells.get(key, ()):
+                        if accept(sid):
+                            p = self._points[sid]
+                            found.append((_distance_km(lat, lng, p[0], p[1]), sid))
+                found.sort()
+                del found[k:]
+                # Anything outside this ring is at least `ring` whole cells away
+                bound = ring * CELL_DEG * KM_PER_DEG * math.cos(
+                    math.radians(min(89.0, abs(lat) + (ring + 1) * CELL_DEG))
+                )
+                if len(found) == k and found[-1][0] <= bound:
+                    break
+                if max_km is not None and bound > max_km:
+                    break
+        return [(sid, km) for km, sid in found if max_km is None or km <= max_km]
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[int, float]]:
+        """(stop id, km) pairs within radius_km, closest first."""
+        dlat = radius_km / KM_PER_DEG
+        dlng = radius_km / (KM_PER_DEG * max(math.cos(math.radians(min(89.0, abs(lat) + dlat))), 1e-6))
+        i0, j0 = _cell(lat - dlat, lng - dlng)
+        i1, j1 = _cell(lat + dlat, lng + dlng)
+        out = []
+        with self._lock:
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    for sid in self._cells.get((i, j), ()):
+                        p = self._points[sid]
+                        km = _distance_km(lat, lng, p[0], p[1])
+                        if km <= radius_km:
+                            out.append((sid, km))
+        out.sort(key=lambda x: x[1])
+        return out
+
+    @staticmethod
+    def _ring(ci: int, cj: int, ring: int):
+        if ring == 0:
+            yield ci, cj
+            return
+        for j in range(cj - ring, cj + ring + 1):
+            yield ci - ring, j
+            yield ci + ring, j
+        for i in range(ci - ring + 1, ci + ring):
+            yield i, cj - ring
+            yield i, cj + ring
+
+
+stops = StopIndex()
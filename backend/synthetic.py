@@ -0,0 +1,492 @@
+"""
+Synthetic data at production scale, for finding performance cliffs.
+
+Builds dozens of UA<->CZ routes with real stop coordinates and years of
+rides on them. Bookings come from repeat customers (a few regulars make
+most of them) with lead times that follow a booking curve, so upcoming
+rides are only partly sold. There are also parcels with their event
+history, and a fleet with maintenance histories. Everything follows
+from the seed, so two runs give the same database.
+
+Rows are generated column-wise with NumPy and written with Core
+executemany inserts in large batches. On SQLite the load runs with
+synchronous=OFF and an in-memory journal. Secondary indexes and the
+search index triggers are dropped and rebuilt afterwards, so a crash
+mid-load means starting again on a fresh file. The derived tables are rebuilt at the end: occupancy
+stats, the maintenance index and the demand curves.
+
+Usage: python synthetic.py [--bookings 1000000] [--routes 40] [--years 3]
+           [--seed 1] [--db path/to/file.db]
+"""
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import aggregates
+import forecast
+import maintenance
+import migrations
+import models
+import parcel_events
+import search
+from auth import hash_password
+from gazetteer import CITIES
+
+BATCH = 50_000
+DEPARTURE_HOUR = 8
+MEAN_LEAD_DAYS = 6.0        # booking curve: P(booked more than d days out) = exp(-d / MEAN_LEAD_DAYS)
+CANCELLED_BOOKINGS = 0.07
+CANCELLED_RIDES = 0.02
+CUSTOMERS_PER_BOOKING = 0.25
+
+ORIGINS = (
+    "Київ", "Житомир", "Рівне", "Луцьк", "Тернопіль", "Хмельницький", "Вінниця", "Івано-Франківськ",
+    "Ужгород", "Мукачево", "Чернівці", "Одеса", "Харків", "Дніпро", "Полтава", "Черкаси",
+)
+DESTINATIONS = (
+    "Прага", "Брно", "Острава", "Оломоуц", "Пльзень", "Градець-Кралове", "Пардубіце", "Ліберець",
+    "Злін", "Чеські Будейовіце", "Карлові Вари", "Млада Болеслав",
+)
+CORRIDOR = ("Львів", "Краків", "Катовіце", "Острава")
+# (make, model, seats)
+VANS = (
+    ("Volkswagen", "Crafter", 8), ("Ford", "Transit", 8), ("Mercedes-Benz", "Sprinter", 16),
+    ("Mercedes-Benz", "Sprinter", 20), ("Iveco", "Daily", 16),
+)
+# work type -> (service interval km, cost EUR)
+SERVICES = {
+    "oil_change": (15_000, 180.0), "filters": (30_000, 120.0), "brake_pads": (50_000, 320.0),
+    "tires": (60_000, 900.0), "timing_belt": (120_000, 650.0), "battery": (200_000, 210.0),
+}
+FIRST_NAMES = ("Олена", "Іван", "Марія", "Андрій", "Оксана", "Петро", "Наталія", "Юрій", "Ірина", "Василь",
+               "Тетяна", "Олег", "Світлана", "Микола", "Галина", "Сергій")
+LAST_NAMES = ("Шевченко", "Коваленко", "Бондаренко", "Ткаченко", "Кравчук", "Олійник", "Мельник", "Поліщук",
+              "Лисенко", "Гончаренко", "Савчук", "Руденко", "Марченко", "Петренко")
+COMMENTS = ("З дитиною", "Великий багаж", "Тварина в переносці", "Зателефонувати за годину", "Місце біля вікна")
+
+
+@dataclass
+class Scale:
+    bookings: int = 1_000_000
+    routes: int = 40            # one direction each; half go UA->CZ, half back
+    years: float = 3.0          # history before today
+    future_days: int = 60
+    parcels: Optional[int] = None       # default: a fifth of the bookings
+    drivers: int = 80
+    vehicles: int = 50
+
+
+_CITY = {c[3]: (c[0], c[1], c[2]) for c in CITIES}
+
+
+def _strings(rng: np.random.Generator, alphabet: str, n: int, length: int) -> List[str]:
+    chars = np.frombuffer(alphabet.encode("ascii"), dtype=np.uint8)
+    buf = chars[rng.integers(0, len(chars), size=(n, length))].tobytes().decode("ascii")
+    return [buf[i:i + length] for i in range(0, n * length, length)]
+
+
+def _phones(rng: np.random.Generator, n: int) -> List[str]:
+    czech = rng.random(n) < 0.15
+    numbers = rng.integers(100_000_000, 1_000_000_000, size=n)
+    return [("+420" if cz else "+380") + str(x) for cz, x in zip(czech.tolist(), numbers.tolist())]
+
+
+def _datetimes(base: datetime, hours: np.ndarray) -> list:
+    stamps = np.datetime64(base, "us") + (hours * 3_600_000_000).astype("timedelta64[us]")
+    return stamps.tolist()
+
+
+# ── Loading ───────────────────────────────────────────────────────────────────
+
+def _insert(conn, table, columns: Dict[str, list]):
+    keys = list(columns)
+    rows = zip(*columns.values())
+    n = len(next(iter(columns.values()))) if columns else 0
+    stmt = insert(table)
+    for start in range(0, n, BATCH):
+        chunk = [dict(zip(keys, values)) for _, values in zip(range(BATCH), rows)]
+        conn.execute(stmt, chunk)
+
+
+def _relax(conn) -> dict:
+    """Trade durability for load speed on SQLite; returns the settings to restore."""
+    if conn.dialect.name != "sqlite":
+        return {}
+    saved = {
+        "synchronous": conn.exec_driver_sql("PRAGMA synchronous").scalar(),
+        "journal_mode": conn.exec_driver_sql("PRAGMA journal_mode").scalar(),
+    }
+    conn.exec_driver_sql("PRAGMA synchronous=OFF")
+    if saved["journal_mode"] != "wal":
+        conn.exec_driver_sql("PRAGMA journal_mode=MEMORY")
+    conn.exec_driver_sql("PRAGMA cache_size=-262144")       # 256 MB
+    conn.exec_driver_sql("PRAGMA temp_store=MEMORY")
+    conn.commit()
+    return saved
+
+
+def _restore(conn, saved: dict):
+    for name, value in saved.items():
+        conn.exec_driver_sql(f"PRAGMA {name}={value}")
+    conn.commit()
+
+
+# ── Generation ────────────────────────────────────────────────────────────────
+
+def _routes(rng: np.random.Generator, n: int) -> List[dict]:
+    pairs = [(o, d) for o in ORIGINS for d in DESTINATIONS]
+    order = rng.permutation(len(pairs))[: max(1, n // 2)]
+    lviv_lng = _CITY["Львів"][2]
+    out = []
+    for o, d in (pairs[i] for i in sorted(order)):
+        # Up to two towns on the way west to Lviv, then the usual corridor
+        on_way = [c for c in ORIGINS if lviv_lng < _CITY[c][2] < _CITY[o][2] and c != o]
+        picks = sorted(rng.choice(len(on_way), size=min(2, len(on_way)), replace=False)) if on_way else []
+        via = sorted((on_way[i] for i in picks), key=lambda c: -_CITY[c][2])
+        cities = list(dict.fromkeys([o, *via, *CORRIDOR, d]))
+        tolls = round(float(rng.uniform(60, 180)), 2)
+        price = int(rng.integers(22, 45)) * 50
+        out.append({"name": f"{o} → {d}", "direction": "UA->CZ", "cities": cities, "tolls": tolls, "price": price})
+        out.append({"name": f"{d} → {o}", "direction": "CZ->UA", "cities": cities[::-1], "tolls": tolls, "price": price})
+    return out[:n] if n > 1 else out[:1]
+
+
+def generate(
+    engine: Engine,
+    scale: Scale = Scale(),
+    seed: int = 1,
+    admin_username: str = "admin",
+    admin_password: str = "admin",
+    today: Optional[date] = None,
+    log=print,
+) -> dict:
+    """Fill an empty database; returns row counts."""
+    today = today or date.today()
+    now = datetime.combine(today, datetime.utcnow().time())
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    migrations.upgrade(engine, log=log)
+    with Session(engine) as db:
+        if db.query(models.Ride.id).first() or db.query(models.Booking.id).first():
+            raise SystemExit("Database is not empty; generate into a fresh file")
+
+    # Users, routes and the fleet are small: plain ORM
+    routes = _routes(rng, scale.routes)
+    with Session(engine) as db:
+        if not db.query(models.User).filter(models.User.username == admin_username).first():
+            db.add(models.User(username=admin_username, password_hash=hash_password(admin_password), role="admin"))
+        driver_hash = hash_password("driver")
+        drivers = [
+            models.User(
+                username=f"driver{i:03d}", password_hash=driver_hash, role="driver",
+                full_name=f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i * 7) % len(LAST_NAMES)]}",
+                phone=p,
+            )
+            for i, p in enumerate(_phones(rng, scale.drivers))
+        ]
+        db.add_all(drivers)
+        route_rows = []
+        for r in routes:
+            route = models.Route(name=r["name"], direction=r["direction"], is_active=True, tolls=r["tolls"])
+            start_country = _CITY[r["cities"][0]][0]
+            route.stops = [
+                models.Stop(city=c, country=_CITY[c][0], order=i, lat=_CITY[c][1], lng=_CITY[c][2],
+                            pickup=_CITY[c][0] == start_country, dropoff=_CITY[c][0] != start_country)
+                for i, c in enumerate(r["cities"])
+            ]
+            route_rows.append(route)
+        db.add_all(route_rows)
+
+        van = rng.integers(len(VANS), size=scale.vehicles)
+        vehicles = [
+            models.Vehicle(
+                name=f"{VANS[v][1]} #{i + 1}", plate=plate, make=VANS[v][0], model_name=VANS[v][1],
+                year=int(rng.integers(2012, 2024)), fuel_l100=round(float(rng.uniform(8.5, 12.5)), 1),
+            )
+            for i, (v, plate) in enumerate(zip(van.tolist(), (
+                f"{a}{n:04d}{b}" for a, n, b in zip(
+                    _strings(rng, "ABCEHIKMOPTX", scale.vehicles, 2),
+                    rng.integers(0, 10_000, size=scale.vehicles).tolist(),
+                    _strings(rng, "ABCEHIKMOPTX", scale.vehicles, 2),
+                )
+            )))
+        ]
+        db.add_all(vehicles)
+        db.commit()
+        driver_ids = np.array([d.id for d in drivers], dtype=np.int64)
+        route_ids = np.array([r.id for r in route_rows], dtype=np.int64)
+        route_stops = [[(s.id, s.pickup) for s in sorted(r.stops, key=lambda s: s.order)] for r in route_rows]
+        vehicle_ids = [v.id for v in vehicles]
+        vehicle_names = [v.name for v in vehicles]
+        vehicle_seats = np.array([VANS[v][2] for v in van.tolist()], dtype=np.int64)
+
+    # ── Rides: enough capacity for the bookings, spread over the whole period
+    first_day = today - timedelta(days=int(scale.years * 365))
+    n_days = (today - first_day).days + scale.future_days
+    n_routes = len(routes)
+    booking_seats = rng.choice([1, 2, 3, 4], size=scale.bookings, p=[0.62, 0.26, 0.09, 0.03])
+    cancelled = rng.random(scale.bookings) < CANCELLED_BOOKINGS
+    consumed = np.where(cancelled, 0, booking_seats)
+    needed = int(consumed.sum())
+    per_route_day = needed / (n_routes * n_days * vehicle_seats.mean() * 0.6)
+    for attempt in range(8):
+        ride_rng = np.random.default_rng([seed, 1, attempt])
+        k = np.floor(per_route_day) + (ride_rng.random((n_days, n_routes)) < per_route_day % 1)
+        day_idx, route_idx = np.nonzero(k > 0)
+        repeat = k[day_idx, route_idx].astype(np.int64)
+        day_idx, route_idx = np.repeat(day_idx, repeat), np.repeat(route_idx, repeat)
+        n_rides = len(day_idx)
+        vehicle = ride_rng.integers(len(vehicle_ids), size=n_rides)
+        seats_total = vehicle_seats[vehicle]
+        ride_cancelled = ride_rng.random(n_rides) < CANCELLED_RIDES
+        days_ahead = day_idx - (today - first_day).days
+        ride_day = np.datetime64(first_day) + day_idx.astype("timedelta64[D]")
+        doy = (ride_day - ride_day.astype("datetime64[Y]")).astype(np.int64)
+        weekday = (day_idx + first_day.weekday()) % 7
+        # Busier in summer and around the Christmas holidays, and on Fridays and Sundays
+        season = 1 + 0.12 * np.cos(2 * np.pi * (doy - 200) / 365) + 0.1 * (np.minimum(doy, 365 - doy) < 10)
+        season *= np.where((weekday == 4) | (weekday == 6), 1.1, 0.95)
+        load = np.minimum(1, ride_rng.beta(6, 2, size=n_rides) * season)
+        load *= np.exp(-np.clip(days_ahead, 0, None) / MEAN_LEAD_DAYS)
+        target = np.where(ride_cancelled, 0, np.floor(seats_total * load)).astype(np.int64)
+        if target.sum() >= needed:
+            break
+        per_route_day *= 1.3 * needed / max(1, target.sum())
+    else:
+        raise SystemExit("Could not size the rides for that many bookings")
+    # Scale the loads down to exactly the seats the bookings need, so no stretch of rides is left empty
+    scaled = np.floor(target * (needed / max(1, target.sum()))).astype(np.int64)
+    room = np.flatnonzero((scaled < seats_total) & ~ride_cancelled)
+    scaled[ride_rng.permutation(room)[: needed - int(scaled.sum())]] += 1
+    target = scaled
+    log(f"{n_rides} rides on {n_routes} routes over {n_days} days")
+
+    # ── Bookings fill rides in date order; cancelled ones take no seats
+    capacity_end = np.cumsum(target)
+    start = np.cumsum(consumed) - consumed
+    booking_ride = np.minimum(np.searchsorted(capacity_end, start, side="right"), n_rides - 1)
+    seats = np.where(cancelled, booking_seats, np.minimum(booking_seats, capacity_end[booking_ride] - start))
+    sold = np.bincount(booking_ride, weights=np.where(cancelled, 0, seats), minlength=n_rides).astype(np.int64)
+
+    departure = day_idx[booking_ride] * 24.0 + DEPARTURE_HOUR
+    now_hours = (now - datetime.combine(first_day, datetime.min.time())).total_seconds() / 3600
+    ahead = np.clip(departure - now_hours, 0, None)
+    lead = ahead + rng.exponential(MEAN_LEAD_DAYS * 24, size=scale.bookings) + rng.uniform(0.5, 3, size=scale.bookings)
+    created = departure - lead
+    order = np.argsort(created, kind="stable")        # booking ids follow creation time
+
+    n_customers = max(1, int(scale.bookings * CUSTOMERS_PER_BOOKING))
+    phones = _phones(rng, n_customers)
+    names = [f"{FIRST_NAMES[i % len(FIRST_NAMES)]} {LAST_NAMES[(i // len(FIRST_NAMES)) % len(LAST_NAMES)]}"
+             for i in rng.integers(0, len(FIRST_NAMES) * len(LAST_NAMES), size=n_customers).tolist()]
+    # Lognormal booking frequency: most people travel once or twice, regulars dozens of times
+    frequency = np.cumsum(rng.lognormal(0, 1.0, size=n_customers))
+    customer = np.minimum(
+        np.searchsorted(frequency, rng.random(scale.bookings) * frequency[-1]), n_customers - 1,
+    )
+
+    pickup_ids, dropoff_ids = [], []
+    for stops in route_stops:
+        pickup_ids.append([s for s, p in stops if p] or [stops[0][0]])
+        dropoff_ids.append([s for s, p in stops if not p] or [stops[-1][0]])
+    n_pick = np.array([len(p) for p in pickup_ids])
+    n_drop = np.array([len(d) for d in dropoff_ids])
+    pick_flat = np.array([s for p in pickup_ids for s in p])
+    drop_flat = np.array([s for d in dropoff_ids for s in d])
+    pick_off = np.concatenate([[0], np.cumsum(n_pick)[:-1]])
+    drop_off = np.concatenate([[0], np.cumsum(n_drop)[:-1]])
+    b_route = route_idx[booking_ride]
+    from_stop = pick_flat[pick_off[b_route] + (rng.random(scale.bookings) * n_pick[b_route]).astype(np.int64)]
+    to_stop = drop_flat[drop_off[b_route] + (rng.random(scale.bookings) * n_drop[b_route]).astype(np.int64)]
+    comment_idx = np.where(rng.random(scale.bookings) < 0.1, rng.integers(len(COMMENTS), size=scale.bookings), -1)
+
+    # ── Parcels ride along in both directions
+    n_parcels = scale.bookings // 5 if scale.parcels is None else scale.parcels
+    live_rides = np.flatnonzero(~ride_cancelled)
+    parcel_ride = live_rides[rng.integers(len(live_rides), size=n_parcels)] if len(live_rides) else np.zeros(0, int)
+    p_departure = day_idx[parcel_ride] * 24.0 + DEPARTURE_HOUR
+    p_ahead = np.clip(p_departure - now_hours, 0, None)
+    p_created = p_departure - p_ahead - rng.exponential(3 * 24, size=n_parcels) - 1
+    by_created = np.argsort(p_created, kind="stable")
+    parcel_ride, p_departure, p_created = parcel_ride[by_created], p_departure[by_created], p_created[by_created]
+    # 0 pending, 1 in transit, 2 delivered, from where the ride is now
+    p_state = np.where(p_departure > now_hours, 0, np.where(p_departure + 48 > now_hours, 1, 2))
+    p_unassigned = (p_state == 0) & (rng.random(n_parcels) < 0.3)
+    codes = _strings(rng, parcel_events.CODE_ALPHABET, n_parcels, parcel_events.CODE_LENGTH)
+    while len(set(codes)) < len(codes):
+        seen = set()
+        for i, c in enumerate(codes):
+            if c in seen:
+                codes[i] = _strings(rng, parcel_events.CODE_ALPHABET, 1, parcel_events.CODE_LENGTH)[0]
+            seen.add(codes[i])
+    senders = _phones(rng, n_parcels)
+    sender_names = [f"{FIRST_NAMES[i % 16]} {LAST_NAMES[i % 14]}" for i in rng.integers(0, 224, size=n_parcels).tolist()]
+
+    base = datetime.combine(first_day, datetime.min.time())
+    statuses = parcel_events.STATUSES
+    with engine.connect() as conn:
+        saved = _relax(conn)
+        try:
+            with conn.begin():
+                tables = [models.Ride.__table__, models.Booking.__table__, models.Parcel.__table__,
+                          models.ParcelEvent.__table__, models.MaintenanceRecord.__table__]
+                indexes = [ix for t in tables for ix in t.indexes]
+                for ix in indexes:
+                    ix.drop(conn, checkfirst=True)
+                # The search triggers would index row by row; search.rebuild() refills in one pass
+                triggers = conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%\\_fts\\_%' ESCAPE '\\'"
+                ).all()
+                for (name,) in triggers:
+                    conn.exec_driver_sql(f"DROP TRIGGER {name}")
+
+                ride_dates = ride_day.tolist()
+                _insert(conn, models.Ride.__table__, {
+                    "id": list(range(1, n_rides + 1)),
+                    "route_id": route_ids[route_idx].tolist(),
+                    "driver_id": [None if u < 0.05 else d for u, d in zip(
+                        rng.random(n_rides).tolist(), driver_ids[rng.integers(len(driver_ids), size=n_rides)].tolist())],
+                    "date": ride_dates,
+                    "seats_total": seats_total.tolist(),
+                    "seats_free": (seats_total - sold).tolist(),
+                    "vehicle": [vehicle_names[v] for v in vehicle.tolist()],
+                    "price": [routes[r]["price"] for r in route_idx.tolist()],
+                    "status": np.where(ride_cancelled, "cancelled", "active").tolist(),
+                })
+                log(f"rides written ({time.perf_counter() - started:.1f}s)")
+
+                created_at = _datetimes(base, created[order])
+                _insert(conn, models.Booking.__table__, {
+                    "id": list(range(1, scale.bookings + 1)),
+                    "ride_id": (booking_ride[order] + 1).tolist(),
+                    "name": [names[c] for c in customer[order].tolist()],
+                    "phone": [phones[c] for c in customer[order].tolist()],
+                    "seats": seats[order].tolist(),
+                    "from_stop_id": from_stop[order].tolist(),
+                    "to_stop_id": to_stop[order].tolist(),
+                    "comment": [COMMENTS[c] if c >= 0 else None for c in comment_idx[order].tolist()],
+                    "created_at": created_at,
+                    "status": np.where(cancelled[order], "cancelled", "confirmed").tolist(),
+                })
+                log(f"{scale.bookings} bookings written ({time.perf_counter() - started:.1f}s)")
+
+                p_created_at = _datetimes(base, p_created)
+                changed_hours = np.where(p_state == 0, p_created, np.where(p_state == 1, p_departure, p_departure + 48))
+                _insert(conn, models.Parcel.__table__, {
+                    "id": list(range(1, n_parcels + 1)),
+                    "ride_id": [None if u else r + 1 for u, r in zip(p_unassigned.tolist(), parcel_ride.tolist())],
+                    "direction": [routes[r]["direction"] for r in route_idx[parcel_ride].tolist()],
+                    "sender": sender_names,
+                    "sender_phone": senders,
+                    "receiver": sender_names[::-1],
+                    "receiver_phone": senders[::-1],
+                    "np_office": rng.integers(1, 450, size=n_parcels).astype(str).tolist(),
+                    "description": [None] * n_parcels,
+                    "status": [statuses[s] for s in p_state.tolist()],
+                    "weight_kg": np.round(rng.gamma(2.0, 3.0, size=n_parcels) + 0.2, 1).tolist(),
+                    "volume_l": np.round(rng.gamma(2.0, 10.0, size=n_parcels) + 1, 1).tolist(),
+                    "deadline": [None] * n_parcels,
+                    "tracking_code": codes,
+                    "status_changed_at": _datetimes(base, changed_hours),
+                    "created_at": p_created_at,
+                })
+                # One event per step reached: pending at creation, in transit at departure, delivered 2 days later
+                ride = parcel_ride.tolist()
+                steps = np.repeat(np.arange(n_parcels), p_state + 1)
+                step = np.arange(len(steps)) - np.repeat(np.cumsum(p_state + 1) - (p_state + 1), p_state + 1)
+                at = np.where(step == 0, p_created[steps], p_departure[steps] + (step - 1) * 48)
+                _insert(conn, models.ParcelEvent.__table__, {
+                    "parcel_id": (steps + 1).tolist(),
+                    "status": [statuses[s] for s in step.tolist()],
+                    "created_at": _datetimes(base, at),
+                    "actor": np.where(step == 0, "bot", "system").tolist(),
+                    "ride_id": [None if s == 0 else ride[p] + 1 for p, s in zip(steps.tolist(), step.tolist())],
+                })
+                log(f"{n_parcels} parcels, {len(steps)} events written ({time.perf_counter() - started:.1f}s)")
+
+                # Maintenance: each van runs a long-haul mileage, services at their intervals with some slack
+                m = {k: [] for k in ("vehicle_id", "date", "mileage", "work_type", "cost", "next_service_km")}
+                history_days = max(1, (today - first_day).days)
+                mileage = {}
+                for vid in vehicle_ids:
+                    km_per_day = float(rng.uniform(250, 500))
+                    start_km = int(rng.integers(0, 150_000))
+                    current = start_km + int(km_per_day * history_days)
+                    mileage[vid] = current
+                    for work_type, (interval, cost) in SERVICES.items():
+                        due = np.arange((start_km // interval + 1) * interval, current, interval)
+                        km = (due + rng.normal(0, interval * 0.05, size=len(due))).astype(np.int64)
+                        km = km[(km > start_km) & (km < current)]
+                        days = ((km - start_km) / km_per_day).astype(np.int64)
+                        m["vehicle_id"] += [vid] * len(km)
+                        m["date"] += (np.datetime64(first_day) + days.astype("timedelta64[D]")).tolist()
+                        m["mileage"] += km.tolist()
+                        m["work_type"] += [work_type] * len(km)
+                        m["cost"] += np.round(cost * rng.uniform(0.8, 1.3, size=len(km)), 2).tolist()
+                        m["next_service_km"] += (km + interval).tolist()
+                _insert(conn, models.MaintenanceRecord.__table__, m)
+                for vid, km in mileage.items():
+                    conn.execute(
+                        models.Vehicle.__table__.update().where(models.Vehicle.id == vid).values(mileage_current=km)
+                    )
+
+                for ix in indexes:
+                    ix.create(conn)
+                search.rebuild(conn)
+                search.create(conn)     # the triggers again
+        finally:
+            _restore(conn, saved)
+    log(f"indexes and search index rebuilt ({time.perf_counter() - started:.1f}s)")
+
+    with Session(engine) as db:
+        aggregates.rebuild(db)
+        maintenance.rebuild(db)
+        forecast.update(db, today=today, full=True)
+        counts = {
+            t.name: db.execute(select(func.count()).select_from(t)).scalar()
+            for t in (models.Route.__table__, models.Ride.__table__, models.Booking.__table__,
+                      models.Parcel.__table__, models.ParcelEvent.__table__, models.Vehicle.__table__,
+                      models.MaintenanceRecord.__table__)
+        }
+    log(f"derived tables rebuilt ({time.perf_counter() - started:.1f}s)")
+    counts["seconds"] = round(time.perf_counter() - started, 1)
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Generate a large deterministic dataset.")
+    parser.add_argument("--bookings", type=int, default=Scale.bookings)
+    parser.add_argument("--routes", type=int, default=Scale.routes)
+    parser.add_argument("--years", type=float, default=Scale.years)
+    parser.add_argument("--future-days", type=int, default=Scale.future_days)
+    parser.add_argument("--parcels", type=int, default=None)
+    parser.add_argument("--drivers", type=int, default=Scale.drivers)
+    parser.add_argument("--vehicles", type=int, default=Scale.vehicles)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="SQLite file to create (default: DATABASE_URL)")
+    args = parser.parse_args()
+
+    if args.db:
+        engine = create_engine(f"sqlite:///{os.path.abspath(args.db)}")
+    else:
+        from database import engine
+    scale = Scale(
+        bookings=args.bookings, routes=args.routes, years=args.years, future_days=args.future_days,
+        parcels=args.parcels, drivers=args.drivers, vehicles=args.vehicles,
+    )
+    counts = generate(
+        engine, scale, seed=args.seed,
+        admin_username=os.getenv("ADMIN_USERNAME", "admin"), admin_password=os.getenv("ADMIN_PASSWORD", "admin"),
+    )
+    print(", ".join(f"{k}: {v}" for k, v in counts.items()))
@@ -0,0 +1,25 @@
+import pytest
+from fastapi import HTTPException
+
+import models
+import schemas
+from fieldsets import sparse_fields
+
+rides_fields = sparse_fields(models.Ride, schemas.RideOut)
+
+
+@pytest.mark.parametrize("fields", ["driver.password_hash", "password_hash", "driver.username,driver.password_hash"])
+def test_password_hash_cannot_be_selected(fields):
+    with pytest.raises(HTTPException) as e:
+        rides_fields(fields=fields)
+    assert e.value.status_code == 400
+
+
+def test_relation_outside_the_schema_is_rejected():
+    with pytest.raises(HTTPException):
+        sparse_fields(models.Parcel, schemas.ParcelOut)(fields="ride.date")
+
+
+def test_schema_fields_are_selected():
+    fieldset = rides_fields(fields="date,seats_free,driver.username,route.name")
+    assert fieldset.keys == [("id",), ("date",), ("seats_free",), ("driver", "username"), ("route", "name")]
@@ -0,0 +1,25 @@
+import pytest
+
+import search
+
+
+@pytest.mark.parametrize("q", ["НП 12 Львів", "нп №12 Львів", "№12 Львів", "НП12 Львів", "np 12 Львів"])
+def test_np_marker_makes_an_office_term(q):
+    query = search.parse(q)
+    assert query.offices == ["12"]
+    assert query.short == []
+    assert query.terms == [(False, "львів")]
+
+
+def test_marker_without_number_is_dropped():
+    query = search.parse("НП Львів")
+    assert query.offices == [] and query.short == []
+
+
+def test_other_short_terms_stay_substrings():
+    assert search.parse("Коваленко 12").short == ["12"]
+
+
+def test_query_needs_an_indexed_term():
+    with pytest.raises(ValueError):
+        search.parse("НП 12")
@@ -0,0 +1,21 @@
+import pytest
+
+import tour
+
+LAT, LNG = [50.0, 50.1, 50.2], [14.0, 15.0, 16.0]
+
+
+def test_default_start_is_not_the_end_point():
+    # Point 2 is the easternmost, and would be the default start without the end constraint
+    result = tour.optimize(LAT, LNG, end=2)
+    assert result["order"][-1] == 2
+    assert result["order"][0] != 2
+
+
+def test_single_point_with_end():
+    assert tour.optimize([50.0], [14.0], end=0)["order"] == [0]
+
+
+def test_start_and_end_must_differ():
+    with pytest.raises(ValueError):
+        tour.optimize(LAT, LNG, start=1, end=1)
@@ -0,0 +1,241 @@
+"""
+Pickup/drop-off tour optimizer.
+
+Builds a haversine distance matrix, seeds with a constrained nearest-
+neighbour tour and improves it with 2-opt and Or-opt moves until no move
+helps or the time budget runs out. The start point (and optionally the
+end point) stay fixed, and any point with a predecessor ("pickup before
+drop-off") is never visited before it.
+"""
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from geo import DETOUR_FACTOR, distance_matrix_km
+
+EPS = 1e-9
+
+
+def tour_length(dist: np.ndarray, order: Sequence[int]) -> float:
+    order = np.asarray(order)
+    return float(dist[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def easternmost_nearest_neighbour(lat: np.ndarray, lng: np.ndarray) -> List[int]:
+    """The heuristic the driver map used: start at max longitude, greedy on squared degree deltas."""
+    n = len(lat)
+    if n <= 1:
+        return list(range(n))
+    order = [int(np.argmax(lng))]
+    visited = np.zeros(n, dtype=bool)
+    visited[order[0]] = True
+    for _ in range(n - 1):
+        cur = order[-1]
+        d = (lng - lng[cur]) ** 2 + (lat - lat[cur]) ** 2
+        d[visited] = np.inf
+        nxt = int(np.argmin(d))
+        visited[nxt] = True
+        order.append(nxt)
+    return order
+
+
+class TourProblem:
+    def __init__(
+        self,
+        dist: np.ndarray,
+        start: int,
+        end: Optional[int] = None,
+        after: Optional[Sequence[Optional[int]]] = None,
+    ):
+        self.dist = dist
+        self.n = len(dist)
+        self.start = start
+        self.end = end
+        # after[i] = j means j has to be visited before i
+        self.after = list(after) if after is not None else [None] * self.n
+
+    def feasible(self, order: Sequence[int]) -> bool:
+        if order[0] != self.start or (self.end is not None and order[-1] != self.end):
+            return False
+        pos = np.empty(self.n, dtype=np.int64)
+        pos[np.asarray(order)] = np.arange(self.n)
+        return all(a is None or pos[a] < pos[i] for i, a in enumerate(self.after))
+
+    def nearest_neighbour(self) -> List[int]:
+        n = self.n
+        visited = np.zeros(n, dtype=bool)
+        visited[self.start] = True
+        order = [self.start]
+        waiting = np.array([a is not None for a in self.after])
+        children = {}
+        for i, a in enumerate(self.after):
+            if a is not None:
+                children.setdefault(a, []).append(i)
+        for c in children.get(self.start, []):
+            waiting[c] = False
+        remaining = n - 1 - (1 if self.end is not None and self.end != self.start else 0)
+        for _ in range(remaining):
+            d = self.dist[order[-1]].copy()
+            d[visited | waiting] = np.inf
+            if self.end is not None:
+                d[self.end] = np.inf
+            nxt = int(np.argmin(d))
+            if not np.isfinite(d[nxt]):
+                break
+            visited[nxt] = True
+            order.append(nxt)
+            for c in children.get(nxt, []):
+                waiting[c] = False
+        if self.end is not None and self.end != self.start:
+            order.append(self.end)
+        return order
+
+    # ── Local search ──────────────────────────────────────────────────────────
+
+    def _two_opt(self, order: List[int], deadline: float) -> bool:
+        """Reverse order[i..j] when it shortens the path; first improvement per i."""
+        dist = self.dist
+        n = len(order)
+        last = n - 1 if self.end is not None else n
+        improved = False
+        arr = np.asarray(order)
+        for i in range(1, last - 1):
+            if time.perf_counter() > deadline:
+                break
+            a, b = arr[i - 1], arr[i]
+            js = np.arange(i + 1, last)
+            c = arr[js]
+            nxt = np.where(js + 1 < n, arr[np.minimum(js + 1, n - 1)], -1)
+            old = dist[a, b] + np.where(nxt >= 0, dist[c, np.maximum(nxt, 0)], 0.0)
+            new = dist[a, c] + np.where(nxt >= 0, dist[b, np.maximum(nxt, 0)], 0.0)
+            delta = new - old
+            for k in np.argsort(delta):
+                if delta[k] >= -EPS:
+                    break
+                j = int(js[k])
+                cand = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                if self.feasible(cand):
+                    order[:] = cand
+                    arr = np.asarray(order)
+                    improved = True
+                    break
+        return improved
+
+    def _or_opt(self, order: List[int], deadline: float) -> bool:
+        """Move segments of 1-3 points to a better position (without reversing)."""
+        dist = self.dist
+        improved = False
+        n = len(order)
+        last = n - 1 if self.end is not None else n
+        for seg_len in (1, 2, 3):
+            i = 1
+            while i + seg_len <= last:
+                if time.perf_counter() > deadline:
+                    return improved
+                seg = order[i:i + seg_len]
+                prev = order[i - 1]
+                nxt = order[i + seg_len] if i + seg_len < n else None
+                gain = dist[prev, seg[0]]
+                if nxt is not None:
+                    gain += dist[seg[-1], nxt] - dist[prev, nxt]
+
+                # Insert between rest[p] and rest[p + 1]; never after a fixed end
+                rest = order[:i] + order[i + seg_len:]
+                r = np.asarray(rest)
+                stop = len(rest) - 1 if self.end is not None else len(rest)
+                u = r[:stop]
+                v_idx = np.arange(1, stop + 1)
+                has_v = v_idx < len(r)
+                v = r[np.minimum(v_idx, len(r) - 1)]
+                added = dist[u, seg[0]] + np.where(has_v, dist[seg[-1], v] - dist[u, v], 0.0)
+                gains = gain - added
+
+                moved = False
+                for p in np.argsort(-gains):
+                    if gains[p] <= EPS:
+                        break
+                    cand = rest[:p + 1] + seg + rest[p + 1:]
+                    if self.feasible(cand):
+                        order[:] = cand
+                        improved = moved = True
+                        break
+                if not moved:
+                    i += 1
+        return improved
+
+    def solve(self, time_budget: float = 0.2) -> List[int]:
+        deadline = time.perf_counter() + time_budget
+        order = self.nearest_neighbour()
+        if self.n <= 3:
+            return order
+        while time.perf_counter() < deadline:
+            changed = self._two_opt(order, deadline)
+            changed = self._or_opt(order, deadline) or changed
+            if not changed:
+                break
+        return order
+
+
+def _validate(n: int, start: Optional[int], end: Optional[int], after: List[Optional[int]]):
+    """Raise ValueError for constraints no tour can satisfy."""
+    if len(after) != n:
+        raise ValueError("after must have one entry per point")
+    for name, idx in (("start", start), ("end", end)):
+        if idx is not None and not 0 <= idx < n:
+            raise ValueError(f"{name} out of range")
+    if start is not None and start == end and n > 1:
+        raise ValueError("start and end must differ")
+    if all(a is not None for a in after) and n:
+        raise ValueError("at least one point must have no predecessor")
+    for i, a in enumerate(after):
+        if a is None:
+            continue
+        if not 0 <= a < n or a == i:
+            raise ValueError(f"invalid predecessor for point {i}")
+        if i == start:
+            raise ValueError("the start point cannot have a predecessor")
+        if a == end:
+            raise ValueError("the end point cannot be a predecessor")
+    for i in range(n):
+        seen, j = 0, after[i]
+        while j is not None:
+            seen += 1
+            if seen > n:
+                raise ValueError("predecessor constraints contain a cycle")
+            j = after[j]
+
+
+def optimize(
+    lat: Sequence[float],
+    lng: Sequence[float],
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    after: Optional[Sequence[Optional[int]]] = None,
+    time_budget: float = 0.2,
+    dist: Optional[np.ndarray] = None,
+) -> dict:
+    """`dist` overrides the haversine × detour matrix (e.g. from distances.matrix)."""
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    started = time.perf_counter()
+    n = len(lat)
+    after = list(after) if after is not None else [None] * n
+    _validate(n, start, end, after)
+    if dist is None:
+        dist = distance_matrix_km(lat, lng) * DETOUR_FACTOR
+    if start is None:
+        # Entering from the Ukrainian side, like the map did
+        free = np.array([a is None for a in after])
+        if end is not None and n > 1:
+            free[end] = False   # a one-point tour starts where it ends
+        start = int(np.flatnonzero(free)[np.argmax(lng[free])])
+    problem = TourProblem(dist, start, end, after)
+    order = problem.solve(time_budget) if len(lat) > 1 else [start]
+    baseline = easternmost_nearest_neighbour(lat, lng)
+    return {
+        "order": [int(i) for i in order],
+        "distance_km": round(tour_length(dist, order), 2),
+        "baseline_km": round(tour_length(dist, baseline), 2),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
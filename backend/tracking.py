@@ -0,0 +1,306 @@
+"""
+Driver GPS tracking.
+
+Fixes arrive in batches. For every ride, the latest RING_SIZE fixes live
+in a fixed-size NumPy ring buffer, so the current position is O(1) and
+memory stays bounded however long a van drives. New fixes also queue up
+for storage and are written to position_fixes in one bulk INSERT once
+FLUSH_BATCH rows are waiting or FLUSH_SECONDS have passed. At most that
+much can be lost if the process dies.
+
+Rings are per process. With several workers, a worker only has the
+fixes its own requests received: current() falls back to the stored
+fixes, which lag by up to FLUSH_SECONDS, and all_current() lists only the
+rides reporting to this worker.
+
+A batch that is accepted stays accepted. If the inline flush fails, the
+fixes stay queued for the next flush, and the driver still gets its
+(accepted, dropped) counts instead of an error that would make it resend
+fixes the ring already holds.
+
+Tracks for the map are simplified with Douglas-Peucker on an
+equirectangular projection (metres), which cuts a 5-second track of a
+1500 km trip from tens of thousands of points to a few hundred.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from geo import EARTH_RADIUS_KM
+from models import PositionFix
+
+RING_SIZE = 2048
+FLUSH_BATCH = 1000
+FLUSH_SECONDS = 10.0
+IDLE_EVICT_SECONDS = 24 * 3600
+FIELDS = ("t", "lat", "lng", "speed")
+
+log = logging.getLogger(__name__)
+
+
+class Ring:
+    """Fixed-capacity buffer of (t, lat, lng, speed) rows; oldest rows are overwritten."""
+
+    def __init__(self, size: int = RING_SIZE):
+        self.data = np.full((size, len(FIELDS)), np.nan)
+        self.size = size
+        self.head = 0       # next slot to write
+        self.count = 0
+
+    def extend(self, rows: np.ndarray):
+        rows = rows[-self.size:]
+        n = len(rows)
+        end = self.head + n
+        if end <= self.size:
+            self.data[self.head:end] = rows
+        else:
+            split = self.size - self.head
+            self.data[self.head:] = rows[:split]
+            self.data[:n - split] = rows[split:]
+        self.head = end % self.size
+        self.count = min(self.count + n, self.size)
+
+    def last(self) -> Optional[np.ndarray]:
+        return self.data[(self.head - 1) % self.size].copy() if self.count else None
+
+    def rows(self) -> np.ndarray:
+        """Buffered rows, oldest first."""
+        if self.count < self.size:
+            return self.data[:self.count].copy()
+        return np.concatenate([self.data[self.head:], self.data[:self.head]])
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def naive_utc(dt: datetime) -> datetime:
+    """Stored times are naive UTC (like datetime.utcnow); convert aware ones."""
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def epoch_seconds(dt: datetime) -> float:
+    return (naive_utc(dt) - EPOCH).total_seconds()
+
+
+def _from_epoch(seconds: float) -> datetime:
+    return EPOCH + timedelta(seconds=float(seconds))
+
+
+def _fix_dict(ride_id: int, row) -> dict:
+    return {
+        "ride_id": ride_id,
+        "t": _from_epoch(row[0]),
+        "lat": float(row[1]),
+        "lng": float(row[2]),
+        "speed_kmh": None if np.isnan(row[3]) else float(row[3]),
+    }
+
+
+def douglas_peucker(lat: np.ndarray, lng: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Boolean mask of the points kept by Douglas-Peucker at `tolerance_m` metres."""
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    r = EARTH_RADIUS_KM * 1000
+    y = np.radians(lat) * r
+    x = np.radians(lng) * r * math.cos(math.radians(float(np.mean(lat))))
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b <= a + 1:
+            continue
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[a + 1:b] - x[a], y[a + 1:b] - y[a]
+        norm = math.hypot(dx, dy)
+        d = np.abs(dy * px - dx * py) / norm if norm > 0 else np.hypot(px, py)
+        i = int(np.argmax(d))
+        if d[i] > tolerance_m:
+            m = a + 1 + i
+            keep[m] = True
+            stack.append((a, m))
+            stack.append((m, b))
+    return keep
+
+
+class Tracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rings: Dict[int, Ring] = {}
+        self._seen: Dict[int, float] = {}              # ride id -> monotonic time of last batch
+        self._pending: List[Tuple[int, np.ndarray]] = []
+        self._pending_rows = 0
+        self._last_flush = time.monotonic()
+
+    def ingest(self, db: Session, ride_id: int, fixes: np.ndarray) -> Tuple[int, int]:
+        """Add rows of (epoch seconds, lat, lng, speed); returns (accepted, dropped).
+
+        Rows out of range or not newer than the last known fix are dropped.
+        """
+        received = len(fixes)
+        fixes = fixes[np.argsort(fixes[:, 0], kind="stable")]
+        valid = (np.abs(fixes[:, 1]) <= 90) & (np.abs(fixes[:, 2]) <= 180)
+        with self._lock:
+            ring = self._rings.get(ride_id)
+            if ring is None:
+                ring = self._rings[ride_id] = Ring()
+            last = ring.last()
+            if last is not None:
+                valid &= fixes[:, 0] > last[0]
+            fixes = fixes[valid]
+            # Duplicate timestamps inside the batch: keep the first
+            if len(fixes) > 1:
+                fixes = fixes[np.concatenate([[True], np.diff(fixes[:, 0]) > 0])]
+            if len(fixes):
+                ring.extend(fixes)
+                self._pending.append((ride_id, fixes))
+                self._pending_rows += len(fixes)
+            self._seen[ride_id] = time.monotonic()
+            due = (
+                self._pending_rows >= FLUSH_BATCH
+                or time.monotonic() - self._last_flush >= FLUSH_SECONDS
+            )
+        if due:
+            try:
+                self.flush(db)
+            except SQLAlchemyError:     # the fixes stay queued; flush_periodically retries them
+                log.warning("Position flush failed; %d fixes stay queued", self._pending_rows, exc_info=True)
+        return len(fixes), received - len(fixes)
+
+    def flush(self, db: Session) -> int:
+        """Write queued fixes with one bulk INSERT."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._pending_rows = 0
+            self._last_flush = time.monotonic()
+            self._evict_idle()
+        rows = [_fix_dict(ride_id, row) for ride_id, batch in pending for row in batch]
+        if not rows:
+            return 0
+        t = PositionFix.__table__
+        try:
+            db.execute(insert(t), [
+                {"ride_id": r["ride_id"], "recorded_at": r["t"], "lat": r["lat"], "lng": r["lng"],
+                 "speed_kmh": r["speed_kmh"]}
+                for r in rows
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._pending = pending + self._pending
+                self._pending_rows += len(rows)
+            raise
+        return len(rows)
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - IDLE_EVICT_SECONDS
+        queued = {ride_id for ride_id, _ in self._pending}
+        for ride_id in [r for r, seen in self._seen.items() if seen < cutoff and r not in queued]:
+            self._rings.pop(ride_id, None)
+            self._seen.pop(ride_id, None)
+
+    def current(self, db: Session, ride_id: int) -> Optional[dict]:
+        """Latest fix: from this worker's ring, else the latest stored one (up to FLUSH_SECONDS behind)."""
+        with self._lock:
+            ring = self._rings.get(ride_id)
+            last = ring.last() if ring is not None else None
+        if last is not None:
+            return _fix_dict(ride_id, last)
+        row = (
+            db.query(PositionFix)
+            .filter(PositionFix.ride_id == ride_id)
+            .order_by(PositionFix.recorded_at.desc())
+            .first()
+        )
+        if row is None:
+            return None
+        return {"ride_id": ride_id, "t": row.recorded_at, "lat": row.lat, "lng": row.lng, "speed_kmh": row.speed_kmh}
+
+    def all_current(self) -> List[dict]:
+        """Latest buffered fix of every ride reporting to this process.
+
+        Only fixes this worker received: rides reporting through other
+        workers are missing.
+        """
+        with self._lock:
+            lasts = [(ride_id, ring.last()) for ride_id, ring in self._rings.items()]
+        return [_fix_dict(ride_id, last) for ride_id, last in lasts if last is not None]
+
+    def track(self, db: Session, ride_id: int, since: Optional[datetime] = None) -> np.ndarray:
+        """Rows of (epoch seconds, lat, lng, speed), oldest first."""
+        with self._lock:
+            ring = self._rings.get(ride_id)
+            recent = ring.rows() if ring is not None else None
+        if recent is not None and since is not None and len(recent) and recent[0, 0] <= epoch_seconds(since):
+            return recent[recent[:, 0] >= epoch_seconds(since)]
+        self.flush(db)
+        q = db.query(PositionFix.recorded_at, PositionFix.lat, PositionFix.lng, PositionFix.speed_kmh).filter(
+            PositionFix.ride_id == ride_id,
+        )
+        if since is not None:
+            q = q.filter(PositionFix.recorded_at >= since)
+        rows = q.order_by(PositionFix.recorded_at).all()
+        out = np.empty((len(rows), len(FIELDS)))
+        for i, (t, lat, lng, speed) in enumerate(rows):
+            out[i] = (epoch_seconds(t), lat, lng, np.nan if speed is None else speed)
+        return out
+
+
+tracker = Tracker()
+
+
+def forget(db: Session, ride_ids: List[int]):
+    """Drop stored and buffered fixes of deleted rides (call before commit)."""
+    db.query(PositionFix).filter(PositionFix.ride_id.in_(ride_ids)).delete(synchronize_session=False)
+    with tracker._lock:
+        gone = set(ride_ids)
+        tracker._pending = [(r, b) for r, b in tracker._pending if r not in gone]
+        tracker._pending_rows = sum(len(b) for _, b in tracker._pending)
+        for ride_id in gone:
+            tracker._rings.pop(ride_id, None)
+            tracker._seen.pop(ride_id, None)
+
+
+async def flush_periodically(session_factory):
+    """Background task: flush quiet periods too, not only when new fixes arrive.
+
+    A failed flush keeps its fixes queued, so the next round retries them.
+    """
+    while True:
+        await asyncio.sleep(FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(flush_with, session_factory)
+        except SQLAlchemyError:
+            log.warning("Position flush failed; retrying in %.0fs", FLUSH_SECONDS, exc_info=True)
+
+
+def flush_with(session_factory):
+    with session_factory() as db:
+        tracker.flush(db)
+
+
+def simplified_track(
+    db: Session, ride_id: int, tolerance_m: float = 50.0, since: Optional[datetime] = None,
+) -> dict:
+    rows = tracker.track(db, ride_id, since)
+    keep = douglas_peucker(rows[:, 1], rows[:, 2], tolerance_m) if len(rows) else np.zeros(0, dtype=bool)
+    kept = rows[keep]
+    return {
+        "ride_id": ride_id,
+        "points": len(rows),
+        "kept": int(keep.sum()),
+        "tolerance_m": tolerance_m,
+        "path": np.round(kept[:, 1:3], 6).tolist(),
+        "times": [_from_epoch(t) for t in kept[:, 0]],
+    }
@@ -1,5 +1,6 @@
 import os
 import asyncio
+import uuid
 import httpx
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
@@ -25,6 +26,7 @@ storage = MemoryStorage()
 dp      = Dispatcher(storage=storage)
 
 HEADERS = {"X-Bot-Key": BOT_API_KEY}
+WRITE_RETRIES = 2   # only for writes with an Idempotency-Key, which the backend runs once
 
 
 # ── HTTP helpers ──────────────────────────────────────────────────────────────
@@ -36,18 +38,38 @@ async def api_get(path: str, params: dict = None):
         return r.json()
 
 
-async def api_post(path: str, data: dict):
+async def api_write(method: str, path: str, data: dict, idempotency_key: str = None):
+    """With a key, timeouts, dropped connections and 409 (still in progress) are retried with the same key."""
+    headers = dict(HEADERS, **({"Idempotency-Key": idempotency_key} if idempotency_key else {}))
+    attempts = 1 + (WRITE_RETRIES if idempotency_key else 0)
     async with httpx.AsyncClient() as c:
-        r = await c.post(f"{API_BASE}{path}", json=data, headers=HEADERS, timeout=10)
-        r.raise_for_status()
-        return r.json()
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                r = await c.request(method, f"{API_BASE}{path}", json=data, headers=headers, timeout=10)
+            except httpx.TransportError:
+                if last:
+                    raise
+                await asyncio.sleep(2 ** attempt)
+                continue
+            if r.status_code == 409 and not last:
+                await asyncio.sleep(2 ** attempt)
+                continue
+            r.raise_for_status()
+            return r.json()
 
 
-async def api_patch(path: str, data: dict):
-    async with httpx.AsyncClient() as c:
-        r = await c.patch(f"{API_BASE}{path}", json=data, headers=HEADERS, timeout=10)
-        r.raise_for_status()
-        return r.json()
+async def api_post(path: str, data: dict, idempotency_key: str = None):
+    return await api_write("POST", path, data, idempotency_key)
+
+
+async def api_patch(path: str, data: dict, idempotency_key: str = None):
+    return await api_write("PATCH", path, data, idempotency_key)
+
+
+def new_idempotency_key() -> str:
+    """One per FSM conversation: repeated taps and retries of its final request create one record."""
+    return uuid.uuid4().hex
 
 
 async def api_delete(path: str):
@@ -57,6 +79,53 @@ async def api_delete(path: str):
         return r.json()
 
 
+# ── Seat holds ────────────────────────────────────────────────────────────────
+# A booking conversation holds its seats from the moment a ride is chosen, so
+# a ride that fills up is noticed right away, not after the last step. Each
+# step extends the hold, and the final booking uses it. If the backend can't
+# be reached, the conversation goes on and the booking checks seats as before.
+
+async def hold_seats(state: FSMContext, seats: int = None):
+    """Place or extend the conversation's hold; returns the backend's refusal if the seats are gone."""
+    data = await state.get_data()
+    try:
+        if data.get("hold_id"):
+            try:
+                await api_patch(f"/api/holds/{data['hold_id']}", {"seats": seats})
+                return None
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404:
+                    raise
+        payload = {"ride_id": data["ride_id"], "seats": seats or data.get("seats") or 1, "holder": data.get("holder")}
+        hold = await api_post("/api/holds", payload, new_idempotency_key())
+        await state.update_data(hold_id=hold["id"])
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 400:
+            return e.response.json().get("detail", "Недостатньо місць")
+    except httpx.TransportError:
+        pass
+    return None
+
+
+async def keep_hold(state: FSMContext, answer) -> bool:
+    """Extend the hold between steps; False (after telling the user) if the seats are gone."""
+    refused = await hold_seats(state)
+    if refused:
+        await state.clear()
+        await answer(f"На жаль, місця на цей рейс закінчились ({refused}). Оберіть інший: /book")
+        return False
+    return True
+
+
+async def release_hold(state: FSMContext):
+    hold_id = (await state.get_data()).get("hold_id")
+    if hold_id:
+        try:
+            await api_delete(f"/api/holds/{hold_id}")
+        except httpx.HTTPError:
+            pass    # it expires by itself
+
+
 # ── FSM States ────────────────────────────────────────────────────────────────
 
 class BookingStates(StatesGroup):
@@ -93,6 +162,10 @@ class ParcelStates(StatesGroup):
     description    = State()
 
 
+class TrackParcelStates(StatesGroup):
+    await_code = State()
+
+
 # ── Keyboards ─────────────────────────────────────────────────────────────────
 
 def public_kb():
@@ -115,6 +188,7 @@ async def cmd_help(message: types.Message):
         "/rides — переглянути рейси\n"
         "/book — забронювати місце\n"
         "/parcel — відправити посилку\n"
+        "/track — відстежити посилку\n"
         "/my_bookings — мої бронювання\n"
         "/cancel_booking — скасувати бронювання\n"
         "/change_booking — змінити бронювання\n"
@@ -178,7 +252,14 @@ async def cmd_book(message: types.Message, state: FSMContext):
 @dp.callback_query(lambda c: c.data and c.data.startswith("book_ride:"))
 async def book_select_ride(callback: types.CallbackQuery, state: FSMContext):
     ride_id = int(callback.data.split(":", 1)[1])
-    await state.update_data(ride_id=ride_id)
+    await release_hold(state)
+    await state.update_data(
+        ride_id=ride_id, idempotency_key=new_idempotency_key(),
+        hold_id=None, seats=None, holder=f"tg:{callback.from_user.id}",
+    )
+    if not await keep_hold(state, callback.message.answer):
+        await callback.answer()
+        return
 
     # Fetch stops for this ride's route
     try:
@@ -212,6 +293,9 @@ async def book_select_ride(callback: types.CallbackQuery, state: FSMContext):
 async def book_from_stop(callback: types.CallbackQuery, state: FSMContext):
     _, stop_id, city = callback.data.split(":", 2)
     await state.update_data(from_stop_id=int(stop_id), from_stop_city=city)
+    if not await keep_hold(state, callback.message.answer):
+        await callback.answer()
+        return
 
     data = await state.get_data()
     all_stops = data.get("all_stops", [])
@@ -238,6 +322,9 @@ async def book_from_stop(callback: types.CallbackQuery, state: FSMContext):
 async def book_to_stop(callback: types.CallbackQuery, state: FSMContext):
     _, stop_id, city = callback.data.split(":", 2)
     await state.update_data(to_stop_id=int(stop_id), to_stop_city=city)
+    if not await keep_hold(state, callback.message.answer):
+        await callback.answer()
+        return
     await state.set_state(BookingStates.phone)
     await callback.message.answer("Введіть ваш номер телефону:")
     await callback.answer()
@@ -246,6 +333,8 @@ async def book_to_stop(callback: types.CallbackQuery, state: FSMContext):
 @dp.message(StateFilter(BookingStates.phone))
 async def booking_phone(message: types.Message, state: FSMContext):
     await state.update_data(phone=message.text.strip())
+    if not await keep_hold(state, message.answer):
+        return
     await state.set_state(BookingStates.name)
     await message.answer("Введіть ваше ПІБ:")
 
@@ -253,6 +342,8 @@ async def booking_phone(message: types.Message, state: FSMContext):
 @dp.message(StateFilter(BookingStates.name))
 async def booking_name(message: types.Message, state: FSMContext):
     await state.update_data(name=message.text.strip())
+    if not await keep_hold(state, message.answer):
+        return
     await state.set_state(BookingStates.seats)
     await message.answer("Скільки місць бронюєте?")
 
@@ -264,6 +355,10 @@ async def booking_seats(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Введіть ціле число")
         return
+    refused = await hold_seats(state, seats)
+    if refused:
+        await message.answer(f"{refused}\nВведіть іншу кількість місць або /cancel:")
+        return
     await state.update_data(seats=seats)
     await state.set_state(BookingStates.comment)
     await message.answer("Коментар (або '-' щоб пропустити):")
@@ -284,13 +379,15 @@ async def booking_comment(message: types.Message, state: FSMContext):
         "from_stop_id": data.get("from_stop_id"),
         "to_stop_id":   data.get("to_stop_id"),
         "comment":      comment,
+        "hold_id":      data.get("hold_id"),
     }
 
     try:
-        booking = await api_post("/api/bookings", payload)
+        booking = await api_post("/api/bookings", payload, data.get("idempotency_key"))
     except httpx.HTTPStatusError as e:
         detail = e.response.json().get("detail", "Помилка бронювання")
         await message.answer(f"Помилка: {detail}")
+        await release_hold(state)
         await state.clear()
         return
 
@@ -425,7 +522,7 @@ async def change_find(message: types.Message, state: FSMContext):
 @dp.callback_query(lambda c: c.data and c.data.startswith("change_sel:"))
 async def change_select(callback: types.CallbackQuery, state: FSMContext):
     booking_id = int(callback.data.split(":", 1)[1])
-    await state.update_data(edit_booking_id=booking_id)
+    await state.update_data(edit_booking_id=booking_id, idempotency_key=new_idempotency_key())
     await state.set_state(EditBookingStates.new_seats)
     await callback.message.answer("Нова кількість місць:")
     await callback.answer()
@@ -455,7 +552,7 @@ async def change_new_comment(message: types.Message, state: FSMContext):
         payload["comment"] = comment
 
     try:
-        await api_patch(f"/api/bookings/{booking_id}", payload)
+        await api_patch(f"/api/bookings/{booking_id}", payload, data.get("idempotency_key"))
         await message.answer(f"Бронювання id={booking_id} оновлено.")
     except httpx.HTTPStatusError as e:
         detail = e.response.json().get("detail", "Помилка")
@@ -479,7 +576,7 @@ async def cmd_parcel(message: types.Message, state: FSMContext):
 @dp.callback_query(lambda c: c.data and c.data.startswith("parcel_dir:"))
 async def parcel_direction(callback: types.CallbackQuery, state: FSMContext):
     direction = callback.data.split(":", 1)[1]
-    await state.update_data(direction=direction)
+    await state.update_data(direction=direction, idempotency_key=new_idempotency_key())
     await state.set_state(ParcelStates.sender)
     await callback.message.answer("ПІБ відправника:")
     await callback.answer()
@@ -538,13 +635,14 @@ async def parcel_description(message: types.Message, state: FSMContext):
     }
 
     try:
-        parcel = await api_post("/api/parcels", payload)
+        parcel = await api_post("/api/parcels", payload, data.get("idempotency_key"))
         await message.answer(
             f"Посилку зареєстровано! id={parcel['id']}\n"
             f"Напрямок: {parcel['direction']}\n"
             f"Відправник: {parcel['sender']} ({parcel['sender_phone']})\n"
             f"Отримувач: {parcel['receiver']} ({parcel['receiver_phone']})\n"
-            f"НП офіс: {parcel['np_office']}"
+            f"НП офіс: {parcel['np_office']}\n"
+            f"Код відстеження: {parcel['tracking_code']} (/track)"
         )
     except Exception:
         await message.answer("Помилка реєстрації посилки. Спробуйте пізніше.")
@@ -552,6 +650,47 @@ async def parcel_description(message: types.Message, state: FSMContext):
     await state.clear()
 
 
+# ── /track ────────────────────────────────────────────────────────────────────
+
+PARCEL_STATUS = {"pending": "прийнято", "in_transit": "в дорозі", "delivered": "доставлено"}
+
+
+@dp.message(Command("track"))
+async def cmd_track(message: types.Message, state: FSMContext):
+    await state.set_state(TrackParcelStates.await_code)
+    await message.answer("Введіть код відстеження посилки:")
+
+
+@dp.message(StateFilter(TrackParcelStates.await_code))
+async def track_show(message: types.Message, state: FSMContext):
+    code = message.text.strip().upper()
+    await state.clear()
+    try:
+        parcel = await api_get(f"/api/parcels/track/{code}")
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            await message.answer("Посилку з таким кодом не знайдено.")
+        else:
+            await message.answer("Помилка завантаження")
+        return
+    except Exception:
+        await message.answer("Помилка завантаження")
+        return
+
+    lines = [
+        f"Посилка {parcel['tracking_code']} ({parcel['direction']})",
+        f"Статус: {PARCEL_STATUS.get(parcel['status'], parcel['status'])}",
+        "",
+    ]
+    for e in parcel["events"]:
+        at = e["at"][:16].replace("T", " ")
+        line = f"{at} — {PARCEL_STATUS.get(e['status'], e['status'])}"
+        if e.get("note"):
+            line += f" ({e['note']})"
+        lines.append(line)
+    await message.answer("\n".join(lines))
+
+
 # ── /автопарк ─────────────────────────────────────────────────────────────────
 
 @dp.message(Command("автопарк"))
@@ -584,6 +723,7 @@ async def cmd_cancel(message: types.Message, state: FSMContext):
     if current is None:
         await message.answer("Немає активної операції")
         return
+    await release_hold(state)
     await state.clear()
     await message.answer("Операцію скасовано")
 
@@ -602,6 +742,7 @@ async def set_commands():
         BotCommand(command="rides",          description="Переглянути рейси"),
         BotCommand(command="book",           description="Забронювати місце"),
         BotCommand(command="parcel",         description="Відправити посилку"),
+        BotCommand(command="track",          description="Відстежити посилку"),
         BotCommand(command="my_bookings",    description="Мої бронювання"),
         BotCommand(command="cancel_booking", description="Скасувати бронювання"),
         BotCommand(command="change_booking", description="Змінити бронювання"),
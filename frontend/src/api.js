@@ -32,14 +32,14 @@ export const login = (username, password) => {
 }
 
 // ── Routes ────────────────────────────────────────────────────────────────────
-export const getRoutes  = ()          => api.get('/api/routes')
+export const getRoutes  = (params)    => api.get('/api/routes', { params })
 export const getRoute   = (id)        => api.get(`/api/routes/${id}`)
 export const createRoute = (data)     => api.post('/api/routes', data)
 export const updateRoute = (id, data) => api.put(`/api/routes/${id}`, data)
 export const deleteRoute = (id)       => api.delete(`/api/routes/${id}`)
 
 // ── Rides ─────────────────────────────────────────────────────────────────────
-export const getRides   = ()          => api.get('/api/rides')
+export const getRides   = (params)    => api.get('/api/rides', { params })
 export const createRide = (data)      => api.post('/api/rides', data)
 export const deleteRide = (id)        => api.delete(`/api/rides/${id}`)
 export const getRideBookings = (id)   => api.get(`/api/rides/${id}/bookings`)
@@ -51,7 +51,38 @@ export const updateBooking  = (id, data) => api.patch(`/api/bookings/${id}`, dat
 export const cancelBooking  = (id)    => api.delete(`/api/bookings/${id}`)
 
 // ── Parcels ───────────────────────────────────────────────────────────────────
-export const getParcels     = ()      => api.get('/api/parcels')
+export const getParcels     = (params) => api.get('/api/parcels', { params })
 export const createParcel   = (data)  => api.post('/api/parcels', data)
 export const updateParcelStatus = (id, status) => api.patch(`/api/parcels/${id}/status`, { status })
 export const deleteParcel   = (id)    => api.delete(`/api/parcels/${id}`)
+
+// ── Driver ────────────────────────────────────────────────────────────────────
+export const optimizeTour = (data) => api.post('/api/driver/optimize', data)
+export const geocodeBatch = (addresses) => api.post('/api/geocode', { addresses })
+
+// ── Profitability ─────────────────────────────────────────────────────────────
+export const getProfitability = (params) => api.get('/api/profitability', { params })
+
+// ── Live seat availability (server-sent events) ───────────────────────────────
+// onRides gets [{ id, seats_free, seats_held, seats_total, status }]; onResync means "re-fetch".
+export function subscribeRides(onRides, onResync) {
+  const token  = localStorage.getItem('token') || ''
+  const source = new EventSource(`/api/live/rides?token=${encodeURIComponent(token)}`)
+  source.addEventListener('rides', (e) => onRides(JSON.parse(e.data)))
+  source.addEventListener('resync', () => onResync())
+  return () => source.close()
+}
+
+// Merge ride deltas into a list of rides (deleted rides drop out)
+export const applyRideDeltas = (rides, deltas) => {
+  const byId = new Map(deltas.map((d) => [d.id, d]))
+  return rides
+    .filter((r) => byId.get(r.id)?.status !== 'deleted')
+    .map((r) => (byId.has(r.id) ? { ...r, ...byId.get(r.id) } : r))
+}
+
+// True if any delta is about a ride not in `rides` (a new ride: re-fetch it in full)
+export const hasNewRide = (rides, deltas) => {
+  const known = new Set(rides.map((r) => r.id))
+  return deltas.some((d) => d.status !== 'deleted' && !known.has(d.id))
+}
@@ -1,5 +1,5 @@
-import { useEffect, useState } from 'react'
-import { getRides, getRideBookings, cancelBooking } from '../api'
+import { useEffect, useRef, useState } from 'react'
+import { getRides, getRideBookings, cancelBooking, subscribeRides, applyRideDeltas, hasNewRide } from '../api'
 
 export default function BookingsPage() {
   const [rides, setRides]         = useState([])
@@ -7,10 +7,29 @@ export default function BookingsPage() {
   const [bookings, setBookings]   = useState([])
   const [loading, setLoading]     = useState(false)
 
+  const ridesRef    = useRef([])
+  const selectedRef = useRef('')
+  useEffect(() => { ridesRef.current = rides }, [rides])
+
   useEffect(() => {
     getRides().then((res) => setRides(res.data))
   }, [])
 
+  // Live seat counts; the booking list is re-fetched only when the selected ride changed
+  useEffect(() => subscribeRides(
+    (deltas) => {
+      if (hasNewRide(ridesRef.current, deltas)) getRides().then((res) => setRides(res.data))
+      else setRides((prev) => applyRideDeltas(prev, deltas))
+      if (deltas.some((d) => String(d.id) === String(selectedRef.current))) {
+        loadBookings(selectedRef.current)
+      }
+    },
+    () => {
+      getRides().then((res) => setRides(res.data))
+      if (selectedRef.current) loadBookings(selectedRef.current)
+    },
+  ), [])
+
   const loadBookings = async (rideId) => {
     if (!rideId) { setBookings([]); return }
     setLoading(true)
@@ -23,6 +42,7 @@ export default function BookingsPage() {
   }
 
   const handleRideChange = (e) => {
+    selectedRef.current = e.target.value
     setSelected(e.target.value)
     loadBookings(e.target.value)
   }
@@ -68,7 +88,7 @@ export default function BookingsPage() {
             <span>
               Заповненість:{' '}
               <b>
-                {selectedRideData.seats_total - selectedRideData.seats_free}/
+                {selectedRideData.seats_total - selectedRideData.seats_free - (selectedRideData.seats_held || 0)}/
                 {selectedRideData.seats_total}
               </b>
             </span>
@@ -2,6 +2,7 @@ import { useState, useRef, useEffect } from 'react'
 import { MapContainer, TileLayer, Polyline, Marker, Popup, useMap } from 'react-leaflet'
 import L from 'leaflet'
 import 'leaflet/dist/leaflet.css'
+import { optimizeTour, geocodeBatch } from '../api'
 
 // ── Icons ─────────────────────────────────────────────────────────────────────
 
@@ -22,51 +23,22 @@ const makeIcon = (color, label) =>
 
 // ── API helpers ───────────────────────────────────────────────────────────────
 
-async function geocode(address) {
-  await new Promise(r => setTimeout(r, 350)) // Nominatim rate limit
-  const url =
-    `https://nominatim.openstreetmap.org/search` +
-    `?q=${encodeURIComponent(address)}&format=json&limit=1`
-  const res = await fetch(url, {
-    headers: { 'Accept-Language': 'uk,en', 'User-Agent': 'CraftTransBot/1.0' },
+// One batched call; the server caches results and handles provider rate limits
+async function geocode(addresses) {
+  const { data } = await geocodeBatch(addresses)
+  return data.map(r => {
+    if (r.lat == null) throw new Error(`Адресу не знайдено: "${r.address}"`)
+    return { lat: r.lat, lng: r.lng }
   })
-  const data = await res.json()
-  if (!data.length) throw new Error(`Адресу не знайдено: "${address}"`)
-  return { lat: parseFloat(data[0].lat), lng: parseFloat(data[0].lon) }
-}
-
-// Nearest-neighbor TSP starting from the easternmost point (closest to Ukraine border)
-function optimizeOrder(points) {
-  if (points.length <= 1) return points.map((_, i) => i)
-
-  // Start from easternmost point (highest longitude) — first city when entering from Ukraine
-  let start = 0
-  for (let i = 1; i < points.length; i++) {
-    if (points[i].lng > points[start].lng) start = i
-  }
-
-  const visited = new Set([start])
-  const order   = [start]
-
-  while (order.length < points.length) {
-    const cur = points[order[order.length - 1]]
-    let nearest = -1, nearestDist = Infinity
-    for (let i = 0; i < points.length; i++) {
-      if (visited.has(i)) continue
-      const d = (cur.lng - points[i].lng) ** 2 + (cur.lat - points[i].lat) ** 2
-      if (d < nearestDist) { nearestDist = d; nearest = i }
-    }
-    visited.add(nearest)
-    order.push(nearest)
-  }
-  return order
 }
 
 // Returns { geometry: [[lat,lng],...], order: [inputIndex,...] }
 async function fetchOptimizedRoute(points) {
   if (points.length < 2) return { geometry: [], order: [0] }
 
-  const order        = optimizeOrder(points)
+  // Ordering is solved on the server (nearest neighbour + 2-opt/Or-opt)
+  const { data }     = await optimizeTour({ points: points.map(p => ({ lat: p.lat, lng: p.lng })) })
+  const order        = data.order
   const sortedPoints = order.map(i => points[i])
 
   const coords = sortedPoints.map(p => `${p.lng},${p.lat}`).join(';')
@@ -145,19 +117,10 @@ export default function DriverMap() {
         return
       }
 
-      // Geocode passengers
-      const pGeo = []
-      for (const p of activeP) {
-        const geo = await geocode(p.address)
-        pGeo.push({ ...p, ...geo })
-      }
-
-      // Geocode parcels
-      const cGeo = []
-      for (const c of activeC) {
-        const geo = await geocode(c.address)
-        cGeo.push({ ...c, ...geo })
-      }
+      // Geocode passengers and parcels in one request
+      const geo  = await geocode([...activeP, ...activeC].map(x => x.address))
+      const pGeo = activeP.map((p, i) => ({ ...p, ...geo[i] }))
+      const cGeo = activeC.map((c, i) => ({ ...c, ...geo[activeP.length + i] }))
 
       if (pGeo.length >= 2) {
         const { geometry, order } = await fetchOptimizedRoute(pGeo)
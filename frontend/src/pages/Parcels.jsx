@@ -23,13 +23,28 @@ export default function ParcelsPage() {
   const [form, setForm]         = useState(EMPTY_FORM)
   const [loading, setLoading]   = useState(false)
   const [error, setError]       = useState('')
+  const [search, setSearch]     = useState('')
+  const [searchError, setSearchError] = useState('')
+
+  // the server index needs 3+ characters; shorter input shows everything
+  const query = search.trim().length >= 3 ? search.trim() : ''
 
   const load = async () => {
-    const res = await getParcels()
-    setParcels(res.data)
+    try {
+      const res = await getParcels(query ? { q: query } : {})
+      setParcels(res.data)
+      setSearchError('')
+    } catch (err) {
+      // e.g. "ab 1": no word long enough for the index
+      setParcels([])
+      setSearchError(err.response?.data?.detail || 'Помилка завантаження')
+    }
   }
 
-  useEffect(() => { load() }, [])
+  useEffect(() => {
+    const t = setTimeout(load, 250)
+    return () => clearTimeout(t)
+  }, [query])
 
   const handleSubmit = async (e) => {
     e.preventDefault()
@@ -62,6 +77,12 @@ export default function ParcelsPage() {
     <div>
       <div className="flex items-center justify-between mb-6">
         <h1 className="text-2xl font-bold">Посилки</h1>
+        <input
+          className="ml-auto mr-3 w-72 border rounded-lg px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-500"
+          placeholder="Пошук: ПІБ, телефон, НП, опис"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+        />
         <button
           onClick={() => { setForm(EMPTY_FORM); setError(''); setShowForm(true) }}
           className="bg-blue-600 hover:bg-blue-700 text-white px-4 py-2 rounded-lg text-sm font-medium"
@@ -89,7 +110,7 @@ export default function ParcelsPage() {
             {parcels.length === 0 && (
               <tr>
                 <td colSpan={9} className="text-center py-8 text-gray-400">
-                  Посилок ще немає
+                  {searchError || (query ? 'Нічого не знайдено' : 'Посилок ще немає')}
                 </td>
               </tr>
             )}
@@ -1,5 +1,5 @@
-import { useEffect, useState } from 'react'
-import { getRides, getRoutes, createRide, deleteRide } from '../api'
+import { useEffect, useRef, useState } from 'react'
+import { getRides, getRoutes, createRide, deleteRide, subscribeRides, applyRideDeltas, hasNewRide } from '../api'
 
 const EMPTY_FORM = {
   route_id: '',
@@ -19,13 +19,24 @@ export default function RidesPage() {
   const [error, setError]       = useState('')
 
   const load = async () => {
-    const [ridesRes, routesRes] = await Promise.all([getRides(), getRoutes()])
+    const [ridesRes, routesRes] = await Promise.all([getRides(), getRoutes({ fields: 'name,direction,is_active' })])
     setRides(ridesRes.data)
     setRoutes(routesRes.data)
   }
 
   useEffect(() => { load() }, [])
 
+  // Seat counts pushed by the server; a ride we don't have yet means a reload
+  const ridesRef = useRef([])
+  useEffect(() => { ridesRef.current = rides }, [rides])
+  useEffect(() => subscribeRides(
+    (deltas) => {
+      if (hasNewRide(ridesRef.current, deltas)) load()
+      else setRides((prev) => applyRideDeltas(prev, deltas))
+    },
+    () => load(),
+  ), [])
+
   const handleSubmit = async (e) => {
     e.preventDefault()
     setError('')
@@ -58,8 +69,9 @@ export default function RidesPage() {
       ? 'bg-green-100 text-green-700'
       : 'bg-red-100 text-red-500'
 
+  // Booked share; held seats are out of seats_free but not sold yet
   const freePercent = (ride) =>
-    Math.round(((ride.seats_total - ride.seats_free) / ride.seats_total) * 100)
+    Math.round(((ride.seats_total - ride.seats_free - (ride.seats_held || 0)) / ride.seats_total) * 100)
 
   return (
     <div>
@@ -110,6 +122,11 @@ export default function RidesPage() {
                   <div className="flex items-center gap-2">
                     <div className="text-sm">
                       {r.seats_free}/{r.seats_total}
+                      {r.seats_held > 0 && (
+                        <span className="text-xs text-amber-600 ml-1" title="Утримуються, поки клієнт бронює в боті">
+                          +{r.seats_held}
+                        </span>
+                      )}
                     </div>
                     <div className="w-16 bg-gray-200 rounded-full h-1.5">
                       <div
@@ -2,7 +2,7 @@ import { useEffect, useState } from 'react'
 import { getRoutes, createRoute, updateRoute, deleteRoute, getRoute } from '../api'
 import StopEditor from '../components/StopEditor'
 
-const EMPTY_FORM = { name: '', direction: 'UA->CZ', is_active: true, stops: [] }
+const EMPTY_FORM = { name: '', direction: 'UA->CZ', is_active: true, tolls: '', stops: [] }
 
 export default function RoutesPage() {
   const [routes, setRoutes]     = useState([])
@@ -29,7 +29,7 @@ export default function RoutesPage() {
   const openEdit = async (id) => {
     const res = await getRoute(id)
     const r = res.data
-    setForm({ name: r.name, direction: r.direction, is_active: r.is_active, stops: r.stops })
+    setForm({ name: r.name, direction: r.direction, is_active: r.is_active, tolls: r.tolls ?? '', stops: r.stops })
     setEditId(id)
     setError('')
     setShowForm(true)
@@ -39,11 +39,12 @@ export default function RoutesPage() {
     e.preventDefault()
     setError('')
     setLoading(true)
+    const payload = { ...form, tolls: form.tolls === '' ? null : Number(form.tolls) }
     try {
       if (editId) {
-        await updateRoute(editId, form)
+        await updateRoute(editId, payload)
       } else {
-        await createRoute(form)
+        await createRoute(payload)
       }
       setShowForm(false)
       load()
@@ -168,6 +169,19 @@ export default function RoutesPage() {
                 <label htmlFor="is_active" className="text-sm text-gray-700">Маршрут активний</label>
               </div>
 
+              <div>
+                <label className="block text-sm font-medium text-gray-700 mb-1">Дорожні збори (€ за рейс)</label>
+                <input
+                  type="number"
+                  min="0"
+                  step="0.01"
+                  className="w-full border rounded-lg px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-500"
+                  placeholder="20"
+                  value={form.tolls}
+                  onChange={(e) => setForm({ ...form, tolls: e.target.value })}
+                />
+              </div>
+
               <div>
                 <label className="block text-sm font-medium text-gray-700 mb-2">Зупинки маршруту</label>
                 <StopEditor
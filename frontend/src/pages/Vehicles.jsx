@@ -28,8 +28,12 @@ function ServiceAlert({ record, currentMileage }) {
   )
 }
 
+const HISTORY_PAGE = 20
+
 function VehicleCard({ v, onUpdated, onDeleted }) {
   const [expanded, setExpanded]   = useState(false)
+  const [history, setHistory]     = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
   const [showForm, setShowForm]   = useState(false)
   const [mileageEdit, setMEditing] = useState(false)
   const [newMileage, setNewMileage] = useState(v.mileage_current)
@@ -38,6 +42,16 @@ function VehicleCard({ v, onUpdated, onDeleted }) {
     description: '', cost: '', next_service_km: '',
   })
 
+  const loadHistory = async (cursor = null) => {
+    const res = await api.get(`/api/vehicles/${v.id}/maintenance`, {
+      params: cursor ? { limit: HISTORY_PAGE, cursor } : { limit: HISTORY_PAGE },
+    })
+    setHistory(h => cursor ? [...h, ...res.data.items] : res.data.items)
+    setNextCursor(res.data.next_cursor)
+  }
+
+  useEffect(() => { if (expanded) loadHistory() }, [expanded, v.record_count])
+
   const saveMileage = async () => {
     await api.patch(`/api/vehicles/${v.id}`, { mileage_current: Number(newMileage) })
     setMEditing(false)
@@ -65,12 +79,10 @@ function VehicleCard({ v, onUpdated, onDeleted }) {
 
   // Upcoming alerts: latest record per work_type with next_service_km
   const alerts = []
-  const seen = new Set()
-  for (const r of v.maintenance) {
-    if (r.next_service_km && !seen.has(r.work_type)) {
-      seen.add(r.work_type)
-      const remaining = r.next_service_km - v.mileage_current
-      if (remaining <= 1000) alerts.push({ ...r, remaining })
+  for (const s of v.last_service) {
+    if (s.next_service_km) {
+      const remaining = s.next_service_km - v.mileage_current
+      if (remaining <= 1000) alerts.push({ ...s, id: s.record_id, remaining })
     }
   }
 
@@ -131,7 +143,14 @@ function VehicleCard({ v, onUpdated, onDeleted }) {
           {/* History */}
           <div className="mt-4">
             <div className="flex items-center justify-between mb-2">
-              <span className="font-medium text-gray-700 text-sm">Журнал обслуговування</span>
+              <span className="font-medium text-gray-700 text-sm">
+                Журнал обслуговування
+                {v.record_count > 0 && (
+                  <span className="ml-2 text-xs text-gray-400">
+                    {v.record_count} записів · {v.total_cost.toFixed(2)} €
+                  </span>
+                )}
+              </span>
               <button
                 onClick={() => setShowForm(x => !x)}
                 className="text-xs bg-blue-600 text-white px-3 py-1 rounded-lg hover:bg-blue-700"
@@ -183,7 +202,7 @@ function VehicleCard({ v, onUpdated, onDeleted }) {
               </form>
             )}
 
-            {v.maintenance.length === 0 ? (
+            {history.length === 0 ? (
               <p className="text-sm text-gray-400 italic">Записів немає</p>
             ) : (
               <table className="w-full text-sm">
@@ -199,7 +218,7 @@ function VehicleCard({ v, onUpdated, onDeleted }) {
                   </tr>
                 </thead>
                 <tbody>
-                  {v.maintenance.map(r => (
+                  {history.map(r => (
                     <tr key={r.id} className="border-b last:border-0 hover:bg-gray-50">
                       <td className="py-1.5">{r.date}</td>
                       <td className="py-1.5">{r.mileage.toLocaleString()} км</td>
@@ -218,6 +237,11 @@ function VehicleCard({ v, onUpdated, onDeleted }) {
                 </tbody>
               </table>
             )}
+            {nextCursor && (
+              <button onClick={() => loadHistory(nextCursor)} className="mt-2 text-xs text-blue-600 hover:underline">
+                Показати ще
+              </button>
+            )}
           </div>
 
           <button